@@ -1,15 +1,21 @@
 from cryptography.fernet import Fernet
-from src.services.data_processing import decrypt_ic, encrypt_ic, import_marksheet, import_student_data ,import_course_structure, process_student_datasheet, process_course_str
+from src.services.data_processing import add_students_bulk, decrypt_ic, decrypt_ic_batch, encrypt_ic, find_students_by_ic, ic_blind_index, import_marksheet, import_student_data ,import_course_structure, load_program_courses, process_course_str, seed_student_scores
 from src.services.admin_services import (
     get_all_student_statuses, add_student_status, update_student_status, delete_student_status,
     get_all_programs, add_program, update_program, delete_program,
     get_all_lecturers, add_lecturer, update_lecturer, deactivate_lecturer
 )
-from src.db.core import get_db_connection
+from src.db.core import get_db_connection, get_pool_stats
+from src.db.schema import SchemaNotReady, require_ic_blind_index, require_score_change_tracking, require_student_sort_keys
+from src.services.cohort_scores import get_cohort_scores
+from src.services.db_helpers import current_scores_version, invalidate_course_code_resolver
+from src.services.import_jobs import get_import_job, submit_import_job
+from src.services.pagination import decode_page_token, encode_page_token, keyset_predicate, like_prefix, parse_page_size
 from src.services.predictions import prediction_bp # Blueprint for predictive model
 from flask import current_app,Flask, jsonify, make_response, render_template, Response, request
 from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt_identity, jwt_required, JWTManager, set_access_cookies, set_refresh_cookies, unset_jwt_cookies
 import base64,datetime,hashlib,logging,os,pdfkit,pyodbc,pyotp,re,socket,tempfile,uuid
+import pandas as pd
 #from contextlib import closing
 from datetime import date,datetime, timedelta
 from dotenv import load_dotenv, set_key
@@ -103,7 +109,7 @@ app = Flask(__name__)
 # })
 
 
-CORS(app, supports_credentials=True, origins=["http://localhost:5173"], allow_headers=["Content-Type", "X-CSRF-TOKEN"])
+CORS(app, supports_credentials=True, origins=["http://localhost:5173"], allow_headers=["Content-Type", "X-CSRF-TOKEN"], expose_headers=["X-Scores-Version"])
 # CORS(app, supports_credentials=True, resources={r"/api/*": {"origins": ["http://localhost:5173"]}})
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
 app.config['JWT_TOKEN_LOCATION'] = ['cookies']
@@ -121,6 +127,11 @@ os.makedirs(upload_folder, exist_ok=True)
 # Register prediction routes
 app.register_blueprint(prediction_bp)
 
+# Schema changes are applied by `python -m src.db.migrate`, never by a request
+@app.errorhandler(SchemaNotReady)
+def schema_not_ready(e):
+    return jsonify({'error': str(e)}), 503
+
 # def find_free_port():
 #     with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
 #         s.bind(('', 0))
@@ -189,16 +200,11 @@ def fetch_internship_list(course_code: str, session: str):
     """, (course_code, session, session, session))
     cols = [c[0] for c in cursor.description]
     rows = cursor.fetchall()
-    data = []
-    for r in rows:
-        item = dict(zip(cols, r))
-        encrypted_ic = item.get('IC_NO')
-        if encrypted_ic:
-            try:
-                item['IC_NO'] = decrypt_ic(encrypted_ic)
-            except Exception:
-                item['IC_NO'] = None
-        data.append(item)
+    data = [dict(zip(cols, r)) for r in rows]
+    # Undecryptable ICs come back as None
+    for item, ic in zip(data, decrypt_ic_batch([item.get('IC_NO') for item in data])):
+        if item.get('IC_NO'):
+            item['IC_NO'] = ic
     cursor.close()
     conn.close()
     return data
@@ -247,16 +253,11 @@ def fetch_mentorship_list(session: str):
     cols = [c[0] for c in cursor.description]
     rows = cursor.fetchall()
 
-    data = []
-    for r in rows:
-        item = dict(zip(cols, r))
-        encrypted_ic = item.get('IC_NO')
-        if encrypted_ic:
-            try:
-                item['IC_NO'] = decrypt_ic(encrypted_ic)
-            except Exception:
-                item['IC_NO'] = None
-        data.append(item)
+    data = [dict(zip(cols, r)) for r in rows]
+    # Undecryptable ICs come back as None
+    for item, ic in zip(data, decrypt_ic_batch([item.get('IC_NO') for item in data])):
+        if item.get('IC_NO'):
+            item['IC_NO'] = ic
 
     cursor.close()
     conn.close()
@@ -401,6 +402,7 @@ def add_student():
             return jsonify({"error": "CU_ID must be an integer"}), 400
 
         ic_enc = encrypt_ic(str(data["IC_NO"]).strip())
+        ic_bidx = ic_blind_index(str(data["IC_NO"]).strip())
         mobile = (data.get("MOBILE_NO") or "-").strip()
         email = (data.get("EMAIL") or "-").strip()
         bm = (data.get("BM") or "-").strip()
@@ -409,6 +411,7 @@ def add_student():
         matric_no = str(data["MATRIC_NO"]).strip()
         student_status = "Active"
 
+        require_ic_blind_index()
         conn = get_db_connection()
         cursor = conn.cursor()
 
@@ -420,51 +423,29 @@ def add_student():
         INSERT INTO STUDENTS (
           STUDENT_NAME, COHORT, SEM, CU_ID, IC_NO,
           MOBILE_NO, EMAIL, BM, ENGLISH, ENTRY_Q,
-          MATRIC_NO, STUDENT_STATUS
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+          MATRIC_NO, STUDENT_STATUS, IC_NO_BIDX
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
         cursor.execute(
             insert_student_query,
             (
                 student_name, cohort_date, sem_str, cu_id_int, ic_enc,
                 mobile, email, bm, english, entry_q,
-                matric_no, student_status
+                matric_no, student_status, ic_bidx
             )
         )
 
         # Fetch courses based on the program code
-        cursor.execute(
-            """
-            SELECT COURSE_CODE, COURSE_CLASSIFICATION
-            FROM COURSE_STRUCTURE
-            WHERE PROGRAM_CODE = ?
-            """,
-            (program_code,)
-        )
-        courses = cursor.fetchall()
-        if not courses:
+        program_courses = load_program_courses(cursor, [program_code])
+        if not any(program_courses.values()):
             conn.rollback()
             return jsonify({"error": f"No courses found for program: {program_code}"}), 400
 
-        # Seed scores
-        insert_score_query = """
-        INSERT INTO STUDENT_SCORE (
-            MATRIC_NO, COURSE_CODE, ATTEMPT_1, ATTEMPT_2, ATTEMPT_3,
-            A1_UPDATED_AT, A2_UPDATED_AT, A3_UPDATED_AT
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        today = date.today()
-
-        for course_code, classification in courses:
-            is_mpu = bool(classification) and str(classification).upper().startswith("MPU")
-            if is_mpu:
-                params = (matric_no, course_code, "-", "-", "N/A", None, None, today)
-            else:
-                params = (matric_no, course_code, "-", "-", "-", None, None, None)
-            cursor.execute(insert_score_query, params)
+        # Seed scores (one batched insert)
+        seeded = seed_student_scores(cursor, [(matric_no, program_code)], program_courses)
 
         conn.commit()
-        return jsonify({"message": f"Student {student_name} added successfully with {len(courses)} courses"}), 201
+        return jsonify({"message": f"Student {student_name} added successfully with {seeded[matric_no]} courses"}), 201
 
     except Exception as e:
         logging.error(f"Failed to add student: {str(e)}")
@@ -481,6 +462,40 @@ def add_student():
             except Exception:
                 pass
 
+@app.route('/api/add-students', methods=['POST'])
+@jwt_required()
+def add_students():
+    """
+    Bulk version of /api/add-student for a new intake: a JSON list (or {"students": [...]}) of the same
+    fields, or a CSV upload in the 'file' form field with those column headers.
+    All-or-nothing: any invalid row returns 400 with per-row errors and nothing is written.
+    """
+    try:
+        if 'file' in request.files:
+            upload = request.files['file']
+            if not upload.filename.lower().endswith('.csv'):
+                return jsonify({"error": "Upload a .csv file"}), 400
+            df = pd.read_csv(upload, dtype=str, keep_default_na=False)
+            df.columns = [str(c).strip().upper() for c in df.columns]
+        else:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                data = data.get('students')
+            if not isinstance(data, list):
+                return jsonify({"error": "Expected a list of students or a CSV file"}), 400
+            df = pd.DataFrame(data)
+
+        result, errors = add_students_bulk(df)
+        if errors:
+            return jsonify({"error": "No students were added", "errors": errors}), 400
+        return jsonify({
+            "message": f"{result['students']} students added with {result['score_rows']} course rows",
+            **result
+        }), 201
+    except Exception as e:
+        logging.error(f"Failed to add students: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/cohorts', methods=['GET'])
 def list_cohorts():
     try:
@@ -660,6 +675,7 @@ def add_course_structure():
         
         cursor.execute(query, params)
         conn.commit()
+        invalidate_course_code_resolver()
         
         cursor.close()
         conn.close()
@@ -740,6 +756,7 @@ def delete_course_structure(course_code, program_code):
             (course_code, program_code)
         )
         conn.commit()
+        invalidate_course_code_resolver()
         if cursor.rowcount == 0:
             cursor.close()
             conn.close()
@@ -1005,6 +1022,8 @@ def import_excel():
     file = request.files['file']
     selected_sheet = request.form.get('selectedSheet')
     is_legacy = request.form.get('isLegacy','false').lower() == 'true' # <<< parse boolean safely
+    export_csv = request.form.get('exportCsv','false').lower() == 'true' # keep Student/Score CSVs as an audit copy
+    force_import = request.form.get('force','false').lower() == 'true' # re-send every row even if the workbook is unchanged
     program_code = request.form.get('program')
     user_email = get_jwt_identity()
 
@@ -1015,10 +1034,15 @@ def import_excel():
         if not program_code:
             return jsonify({"error": "Missing program code"})
 
+    # One path per upload: same-named workbooks (e.g. the weekly master) must not overwrite a queued job's file
     filename = secure_filename(file.filename)
-    file_path = os.path.join(upload_folder, filename)
+    file_path = os.path.join(upload_folder, f"{uuid.uuid4().hex}_{filename}")
     file.save(file_path)
 
+    def remove_upload():
+        if os.path.exists(file_path):
+            os.unlink(file_path)
+
     # sanitize email so it’s safe as a folder name
     base_csv_folder = os.path.join(os.getcwd(), "csv files")
     os.makedirs(base_csv_folder, exist_ok=True)
@@ -1030,7 +1054,10 @@ def import_excel():
 
     sheet_info = SHEET_INFO_MAP[selected_sheet]
     if selected_sheet == "Course Structure":
-        output_files = process_course_str(file_path, sheet_info, user_folder, is_legacy=is_legacy) # <-- Edited here
+        try:
+            output_files = process_course_str(file_path, sheet_info, user_folder, is_legacy=is_legacy) # <-- Edited here
+        finally:
+            remove_upload()
 
         # Import into DB using existing function
         if output_files:
@@ -1051,21 +1078,17 @@ def import_excel():
                 return jsonify({"error": f"Import into DB failed: {str(e)}"}), 500
 
     else:
-        output_files = process_student_datasheet(file_path, sheet_info, user_folder)
-
-        try:
-            results = import_student_data(file_path, sheet_info, user_folder)
-            if not results:
-                return jsonify({"error": f"Failed to process {selected_sheet}"}), 500
-
-            return jsonify({
-                "message": f"{selected_sheet} processed and imported successfully",
-                "files": results["files"],
-                "students": results["students"],
-                "scores": results["scores"]
-            })
-        except Exception as e:
-            return jsonify({"error": f"Import into DB failed: {str(e)}"}), 500
+        # Parse + DB write run on the import worker pool; poll GET /api/import/jobs/<job_id>
+        # (import_student_data parses the sheet once and feeds both DB stages)
+        # The upload lives until the background job is done with it
+        job_id = submit_import_job(selected_sheet, import_student_data, file_path, sheet_info, user_folder,
+                                   export_csv=export_csv, force=force_import, submitted_by=user_email,
+                                   cleanup=remove_upload)
+        return jsonify({
+            "message": f"{selected_sheet} import queued",
+            "job_id": job_id,
+            "status_url": f"/api/import/jobs/{job_id}"
+        }), 202
 
     return jsonify({"error": f"Failed to process {selected_sheet}"}), 500
 
@@ -1161,19 +1184,30 @@ def import_marksheet_scores():
         return jsonify({"error": "only .xlsm allowed"}), 400
 
     import tempfile, os
-    tmp_path = None
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsm") as tmpf:
-            f.save(tmpf.name)
-            tmp_path = tmpf.name
-        result = import_marksheet(tmp_path)  # function below uses per-sheet reads
-        return jsonify(result), 200
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsm") as tmpf:
+        f.save(tmpf.name)
+        tmp_path = tmpf.name
+
+    def remove_upload():
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    # The temp file lives until the background job is done with it
+    job_id = submit_import_job("Marksheet", import_marksheet, tmp_path, cleanup=remove_upload)
+    return jsonify({
+        "message": "Marksheet import queued",
+        "job_id": job_id,
+        "status_url": f"/api/import/jobs/{job_id}"
+    }), 202
+
+@app.route('/api/import/jobs/<string:job_id>', methods=['GET'])
+@jwt_required()
+def get_import_job_status(job_id):
+    """Stage, rows processed, throughput and (once finished) insert/update/error counts of an import job"""
+    job = get_import_job(job_id)
+    if job is None:
+        return jsonify({"error": "Import job not found"}), 404
+    return jsonify(job), 200
 
 #   Not using yet!
 @app.route('/admin/invite-token', methods=['GET'])
@@ -1320,58 +1354,321 @@ def setup():
         logging.error(f"Error in /api/setup (2FA initiation): {str(e)}")
         return jsonify({"error": "Server error during 2FA initiation"}), 500
 
+# Columns /api/students can return; `fields` picks a subset
+STUDENT_LIST_FIELDS = [
+    'STUDENT_ID', 'STUDENT_NAME', 'COHORT', 'SEM', 'CU_ID', 'IC_NO', 'MOBILE_NO', 'EMAIL',
+    'BM', 'ENGLISH', 'ENTRY_Q', 'MATRIC_NO', 'STUDENT_STATUS'
+]
+IC_MASK = '********'  # placeholder for an IC that was not decrypted; ignored if sent back on update
+
+# Sort keys for /api/students; STUDENT_ID is appended as the unique tie-breaker for keyset paging.
+# SORT_* are persisted NULL-free columns with an index per order (see require_student_sort_keys)
+STUDENT_SORTS = {
+    'name': ["SORT_NAME", "SORT_STATUS"],
+    'matric': ["SORT_MATRIC"],
+    'cohort': ["SORT_COHORT", "SORT_NAME"],
+    'sem': ["SORT_SEM", "SORT_NAME"],
+    'status': ["SORT_STATUS", "SORT_NAME"],
+}
+
+def build_student_filters(args):
+    """
+    WHERE clauses + params for the /api/students filters:
+    status (comma list), cohort_year, sem, name (prefix), matric (prefix), matric_no (exact),
+    q (name or matric no containing the text, for the students page search box).
+    Raises ValueError on malformed values.
+    """
+    clauses = ["IC_NO IS NOT NULL", "IC_NO <> ''"]  # only students with an IC_NO are listed
+    params = []
+
+    statuses = [x.strip() for x in (args.get('status') or '').split(',') if x.strip()]
+    if statuses:
+        clauses.append(f"STUDENT_STATUS IN ({', '.join('?' * len(statuses))})")
+        params.extend(statuses)
+
+    cohort_year = args.get('cohort_year')
+    if cohort_year:
+        year = int(cohort_year)
+        # Range instead of YEAR(COHORT) so an index on COHORT stays usable
+        clauses.append("COHORT >= ? AND COHORT < ?")
+        params.extend([date(year, 1, 1), date(year + 1, 1, 1)])
+
+    if args.get('sem'):
+        clauses.append("SEM = ?")
+        params.append(args.get('sem').strip())
+
+    if args.get('name'):
+        clauses.append("STUDENT_NAME LIKE ?")
+        params.append(like_prefix(args.get('name').strip()))
+
+    if args.get('matric'):
+        clauses.append("MATRIC_NO LIKE ?")
+        params.append(like_prefix(args.get('matric').strip()))
+
+    if args.get('matric_no'):
+        clauses.append("MATRIC_NO = ?")
+        params.append(args.get('matric_no').strip())
+
+    if args.get('q'):
+        pattern = '%' + like_prefix(args.get('q').strip())
+        clauses.append("(STUDENT_NAME LIKE ? OR MATRIC_NO LIKE ?)")
+        params.extend([pattern, pattern])
+
+    return clauses, params
+
 @app.route('/api/students', methods=['GET'])
 def get_students_info():
+    """
+    Student list. IC numbers are masked unless reveal_ic=true (decrypting every row is the
+    expensive part); fetch one IC with GET /api/students/<id>/ic instead.
+    Optional fields=STUDENT_STATUS,SEM,... limits the returned columns.
+    Filters: status, cohort_year, sem, name / matric (prefix), matric_no, q; sort=name|matric|cohort|sem|status, order=asc|desc.
+    Passing limit and/or page_token switches to keyset pagination:
+        {"items": [...], "total": N, "limit": L, "next_page_token": "..." | null}
+    total is counted for the first page only (null with a page_token); keep it client-side.
+    """
     try:
+        require_student_sort_keys()
+        reveal_ic = request.args.get('reveal_ic', 'false').lower() == 'true'
+        fields_arg = request.args.get('fields')
+        if fields_arg:
+            fields = [f.strip().upper() for f in fields_arg.split(',') if f.strip()]
+            unknown = [f for f in fields if f not in STUDENT_LIST_FIELDS]
+            if unknown:
+                return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        else:
+            fields = STUDENT_LIST_FIELDS
+
+        sort = request.args.get('sort', 'name').lower()
+        order = request.args.get('order', 'asc').upper()
+        if sort not in STUDENT_SORTS or order not in ('ASC', 'DESC'):
+            return jsonify({'error': 'Invalid sort/order'}), 400
+        sort_keys = [(expr, order) for expr in STUDENT_SORTS[sort]] + [("STUDENT_ID", order)]
+
+        paginate = 'limit' in request.args or 'page_token' in request.args
+        try:
+            where, params = build_student_filters(request.args)
+            limit = parse_page_size(request.args.get('limit'))
+            scope = f"students:{sort}:{order}"
+            last_values = decode_page_token(request.args['page_token'], scope) if request.args.get('page_token') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT
-                STUDENT_ID,
-                STUDENT_NAME,
-                COHORT,
-                SEM,
-                CU_ID,
-                IC_NO,
-                MOBILE_NO,
-                EMAIL,
-                BM,
-                ENGLISH,
-                ENTRY_Q,
-                MATRIC_NO,
-                STUDENT_STATUS
-            FROM STUDENTS
-            ORDER BY STUDENT_NAME, STUDENT_STATUS
-        """)
-        
-        columns = [column[0] for column in cursor.description]
-        rows = cursor.fetchall()
 
-        #data = [dict(zip(columns, row)) for row in rows]
-        data = []
-        for row in rows:
-            row_dict = dict(zip(columns, row))
-
-            encrypted_ic = row_dict.get('IC_NO')
-            if encrypted_ic:
-                try:
-                    row_dict['IC_NO'] = decrypt_ic(encrypted_ic)
-                except Exception as decrypt_error:
-                    row_dict['IC_NO'] = None
-                
-                data.append(row_dict)
+        if not paginate:
+            cursor.execute(f"""
+                SELECT {', '.join(fields)}
+                FROM STUDENTS
+                WHERE {' AND '.join(where)}
+                ORDER BY {', '.join(f'{expr} {direction}' for expr, direction in sort_keys)}
+            """, params)
+            columns = [column[0] for column in cursor.description]
+            data = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        else:
+            # Counted once per filter, on its first page; later pages only seek
+            total = None
+            if last_values is None:
+                cursor.execute(f"SELECT COUNT(*) FROM STUDENTS WHERE {' AND '.join(where)}", params)
+                total = cursor.fetchone()[0]
+
+            page_where, page_params = list(where), list(params)
+            if last_values is not None:
+                predicate, predicate_params = keyset_predicate(sort_keys, last_values)
+                page_where.append(predicate)
+                page_params.extend(predicate_params)
+
+            sort_select = ', '.join(f"{expr} AS SORT_{i}" for i, (expr, _) in enumerate(sort_keys))
+            cursor.execute(f"""
+                SELECT TOP ({limit + 1}) {', '.join(fields)}, {sort_select}
+                FROM STUDENTS
+                WHERE {' AND '.join(page_where)}
+                ORDER BY {', '.join(f'{expr} {direction}' for expr, direction in sort_keys)}
+            """, page_params)
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+
+            # One extra row tells us whether there is a next page
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            n_fields = len(fields)
+            data = [dict(zip(columns[:n_fields], row[:n_fields])) for row in rows]
+            next_token = encode_page_token(list(rows[-1][n_fields:]), scope) if has_more else None
+
+        if 'IC_NO' in fields:
+            if reveal_ic:
+                # Undecryptable ICs come back as None
+                for row_dict, ic in zip(data, decrypt_ic_batch([row_dict['IC_NO'] for row_dict in data])):
+                    row_dict['IC_NO'] = ic
+            else:
+                for row_dict in data:
+                    row_dict['IC_NO'] = IC_MASK
 
         cursor.close()
         conn.close()
+        if paginate:
+            return jsonify({'items': data, 'total': total, 'limit': limit, 'next_page_token': next_token}), 200
         return jsonify(data), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/students/<int:student_id>/ic', methods=['GET'])
+@jwt_required()
+def get_student_ic(student_id):
+    """Decrypt a single student's IC number on demand"""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT IC_NO FROM STUDENTS WHERE STUDENT_ID = ?", (student_id,))
+        row = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        if not row:
+            return jsonify({'error': 'Student not found'}), 404
+
+        ic_no = None
+        if row.IC_NO:
+            try:
+                ic_no = decrypt_ic(row.IC_NO)
+            except Exception:
+                ic_no = None
+        return jsonify({'STUDENT_ID': student_id, 'IC_NO': ic_no}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Most rows /api/students-scores/changes returns before telling the client to reload instead
+MAX_SCORE_CHANGES = 5000
+
+def get_students_scores_page(args):
+    """
+    One page of students (keyset on trimmed name, then MATRIC_NO), each with a compact
+    {COURSE_CODE: [ATTEMPT_1, ATTEMPT_2, ATTEMPT_3]} map.
+    Filters: cohort_year, program (courses of that PROGRAM_CODE), course (comma list), name (prefix),
+    q (name containing the text).
+    Students without any matching score row are left out when program/course is given.
+    """
+    limit = parse_page_size(args.get('limit'))
+    scope = "students-scores:name"
+    last_values = decode_page_token(args['page_token'], scope) if args.get('page_token') else None
+
+    # Score-row filter shared by the student EXISTS check and the score fetch
+    score_where, score_params = [], []
+    courses = [c.strip() for c in (args.get('course') or '').split(',') if c.strip()]
+    if courses:
+        score_where.append(f"ss.COURSE_CODE IN ({', '.join('?' * len(courses))})")
+        score_params.extend(courses)
+    if args.get('program'):
+        score_where.append("ss.COURSE_CODE IN (SELECT COURSE_CODE FROM COURSE_STRUCTURE WHERE PROGRAM_CODE = ?)")
+        score_params.append(args.get('program').strip())
+
+    where, params = ["1 = 1"], []
+    if args.get('cohort_year'):
+        year = int(args.get('cohort_year'))
+        where.append("s.COHORT >= ? AND s.COHORT < ?")
+        params.extend([date(year, 1, 1), date(year + 1, 1, 1)])
+    if args.get('name'):
+        where.append("s.STUDENT_NAME LIKE ?")
+        params.append(like_prefix(args.get('name').strip()))
+    if args.get('q'):
+        where.append("s.STUDENT_NAME LIKE ?")
+        params.append('%' + like_prefix(args.get('q').strip()))
+    if score_where:
+        where.append(f"EXISTS (SELECT 1 FROM STUDENT_SCORE ss WHERE ss.MATRIC_NO = s.MATRIC_NO AND {' AND '.join(score_where)})")
+        params.extend(score_params)
+
+    sort_keys = [("LTRIM(RTRIM(ISNULL(s.STUDENT_NAME, '')))", "ASC"), ("s.MATRIC_NO", "ASC")]
+
+    require_score_change_tracking()
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        # Taken before reading, so changes made while the page is read are replayed by the feed
+        version = current_scores_version(cursor)
+        # Counted on a filter's first page only, like /api/students
+        total = None
+        if last_values is None:
+            cursor.execute(f"SELECT COUNT(*) FROM STUDENTS s WHERE {' AND '.join(where)}", params)
+            total = cursor.fetchone()[0]
+
+        page_where, page_params = list(where), list(params)
+        if last_values is not None:
+            predicate, predicate_params = keyset_predicate(sort_keys, last_values)
+            page_where.append(predicate)
+            page_params.extend(predicate_params)
+
+        cursor.execute(f"""
+            SELECT TOP ({limit + 1})
+                s.MATRIC_NO, s.STUDENT_NAME, s.COHORT, s.SEM, s.CU_ID,
+                {sort_keys[0][0]} AS SORT_NAME
+            FROM STUDENTS s
+            WHERE {' AND '.join(page_where)}
+            ORDER BY {', '.join(f'{expr} {direction}' for expr, direction in sort_keys)}
+        """, page_params)
+        students = cursor.fetchall()
+        has_more = len(students) > limit
+        students = students[:limit]
+
+        items = [{
+            'MATRIC_NO': r.MATRIC_NO, 'STUDENT_NAME': r.STUDENT_NAME, 'COHORT': r.COHORT,
+            'SEM': r.SEM, 'CU_ID': r.CU_ID, 'courses': {}
+        } for r in students]
+        # Keyed like the DB compares MATRIC_NO (case-insensitive, trailing blanks ignored): the IN
+        # below also returns score rows whose MATRIC_NO is spelled differently from STUDENTS'
+        by_matric = {str(item['MATRIC_NO']).rstrip().upper(): item for item in items}
+
+        course_codes = set()
+        if items:
+            # Page size is capped at MAX_PAGE_SIZE, well under the 2100-parameter limit
+            matric_marks = ', '.join('?' * len(items))
+            cursor.execute(f"""
+                SELECT ss.MATRIC_NO, ss.COURSE_CODE, ss.ATTEMPT_1, ss.ATTEMPT_2, ss.ATTEMPT_3
+                FROM STUDENT_SCORE ss
+                WHERE ss.MATRIC_NO IN ({matric_marks})
+                  {''.join(' AND ' + w for w in score_where)}
+            """, [item['MATRIC_NO'] for item in items] + score_params)
+            for matric_no, course_code, a1, a2, a3 in cursor.fetchall():
+                item = by_matric.get(str(matric_no).rstrip().upper())
+                if item is None:
+                    continue
+                item['courses'][course_code] = [a1, a2, a3]
+                course_codes.add(course_code)
+
+        next_token = encode_page_token([students[-1].SORT_NAME, students[-1].MATRIC_NO], scope) if has_more else None
+        cursor.close()
+    finally:
+        conn.close()
+
+    return {
+        'items': items,
+        'course_codes': sorted(course_codes),
+        'total': total,
+        'limit': limit,
+        'next_page_token': next_token,
+        'version': version,
+    }
+
 @app.route('/api/students-scores', methods=['GET'])
 def get_students_scores():
+    """
+    Without paging args: the flat student x course join (one object per score row), as before;
+    the X-Scores-Version header is the version to pass to /api/students-scores/changes.
+    With limit and/or page_token: one row per student with a course -> [a1, a2, a3] map
+    (see get_students_scores_page for filters).
+    """
+    if 'limit' in request.args or 'page_token' in request.args:
+        try:
+            return jsonify(get_students_scores_page(request.args)), 200
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
     try:
+        require_score_change_tracking()
         conn = get_db_connection()
         cursor = conn.cursor()
+        version = current_scores_version(cursor)
         cursor.execute("""
             SELECT
                 student.STUDENT_NAME,
@@ -1396,100 +1693,198 @@ def get_students_scores():
         data = [dict(zip(columns, row)) for row in rows]
         cursor.close()
         conn.close()
-        return jsonify(data), 200
+        return jsonify(data), 200, {'X-Scores-Version': str(version)}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/students-scores', methods=['PUT'])
-@jwt_required()
-def update_student_scores():
-    try:
-        data = request.get_json()
-        matric_no = data.get('MATRIC_NO')
-        courses = data.get('courses')
-
-        if not matric_no or not courses:
-            return jsonify({'error': 'Missing matric_no or courses data'}), 400
+@app.route('/api/students-scores/changes', methods=['GET'])
+def get_students_scores_changes():
+    """
+    STUDENT_SCORE rows written or deleted after ?since=<version> (from a previous response).
+    Changed rows have the same fields as the flat /api/students-scores rows; deleted rows are
+    {SCORE_ID, MATRIC_NO, COURSE_CODE}. If more than MAX_SCORE_CHANGES rows changed the response
+    is {"reset": true, ...} and the client should reload the full list instead.
+    """
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({'error': 'since must be a non-negative integer version'}), 400
 
+    conn = None
+    try:
+        require_score_change_tracking()
         conn = get_db_connection()
         cursor = conn.cursor()
+        version = current_scores_version(cursor)
+        if version <= since:
+            return jsonify({'version': since, 'reset': False, 'changed': [], 'deleted': []}), 200
 
-        for course_code, new_attempts in courses.items():
-            new_attempt1, new_attempt2, new_attempt3 = new_attempts
-            
-            # Fetch current record to compare
-            cursor.execute(
-                """
-                SELECT ATTEMPT_1, ATTEMPT_2, ATTEMPT_3,
-                       A1_UPDATED_AT, A2_UPDATED_AT, A3_UPDATED_AT
-                FROM STUDENT_SCORE
-                WHERE MATRIC_NO = ? AND COURSE_CODE = ?
-                """,
-                (matric_no, course_code)
-            )
-            current_record = cursor.fetchone()
-
-            if current_record:
-                current_attempt1, current_attempt2, current_attempt3, \
-                current_a1_updated_at, current_a2_updated_at, current_a3_updated_at = current_record
+        cursor.execute(f"""
+            SELECT TOP ({MAX_SCORE_CHANGES + 1})
+                student.STUDENT_NAME,
+                student.COHORT,
+                student.SEM,
+                student.CU_ID,
+                score.SCORE_ID,
+                score.MATRIC_NO,
+                score.COURSE_CODE,
+                score.ATTEMPT_1,
+                score.ATTEMPT_2,
+                score.ATTEMPT_3
+            FROM STUDENT_SCORE AS score
+            LEFT JOIN STUDENTS AS student
+            ON student.MATRIC_NO = score.MATRIC_NO
+            WHERE score.ROW_VER > CAST(CAST(? AS BIGINT) AS BINARY(8))
+              AND score.ROW_VER <= CAST(CAST(? AS BIGINT) AS BINARY(8))
+            ORDER BY score.ROW_VER
+        """, (since, version))
+        columns = [col[0] for col in cursor.description]
+        changed = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        if len(changed) > MAX_SCORE_CHANGES:
+            return jsonify({'version': version, 'reset': True, 'changed': [], 'deleted': []}), 200
 
-                update_set_parts = []
-                update_values = []
+        cursor.execute("""
+            SELECT SCORE_ID, MATRIC_NO, COURSE_CODE
+            FROM STUDENT_SCORE_TOMBSTONES
+            WHERE ROW_VER > CAST(CAST(? AS BIGINT) AS BINARY(8))
+              AND ROW_VER <= CAST(CAST(? AS BIGINT) AS BINARY(8))
+            ORDER BY ROW_VER
+        """, (since, version))
+        deleted = [
+            {'SCORE_ID': score_id, 'MATRIC_NO': matric_no, 'COURSE_CODE': course_code}
+            for score_id, matric_no, course_code in cursor.fetchall()
+        ]
+        cursor.close()
+        return jsonify({'version': version, 'reset': False, 'changed': changed, 'deleted': deleted}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
 
-                # Always include all attempts in the SET clause, but only update _UPDATED_AT if changed
-                update_set_parts.append("ATTEMPT_1 = ?")
-                update_values.append(new_attempt1)
-                if str(new_attempt1) != str(current_attempt1):
-                    update_set_parts.append("A1_UPDATED_AT = GETDATE()")
-                else:
-                    update_set_parts.append("A1_UPDATED_AT = ?") # Keep existing timestamp
-                    update_values.append(current_a1_updated_at)
+# (SCORE_ID, a1, a2, a3, a1 changed, a2 changed, a3 changed); a changed attempt gets a fresh timestamp
+SCORE_BATCH_UPDATE_SQL = """
+    UPDATE STUDENT_SCORE
+    SET ATTEMPT_1 = ?, ATTEMPT_2 = ?, ATTEMPT_3 = ?,
+        A1_UPDATED_AT = CASE WHEN ? = 1 THEN GETDATE() ELSE A1_UPDATED_AT END,
+        A2_UPDATED_AT = CASE WHEN ? = 1 THEN GETDATE() ELSE A2_UPDATED_AT END,
+        A3_UPDATED_AT = CASE WHEN ? = 1 THEN GETDATE() ELSE A3_UPDATED_AT END
+    WHERE SCORE_ID = ?
+"""
+
+def parse_score_updates(data):
+    """
+    PUT /api/students-scores body -> {matric_no: {course_code: (a1, a2, a3)}}.
+    Accepts one student {"MATRIC_NO", "courses"}, {"students": [...]} or a bare list of those.
+    Raises ValueError on a malformed entry.
+    """
+    if isinstance(data, dict) and 'students' in data:
+        entries = data['students']
+    elif isinstance(data, list):
+        entries = data
+    else:
+        entries = [data]
+    if not isinstance(entries, list) or not entries:
+        raise ValueError('Missing matric_no or courses data')
+
+    updates = {}
+    for entry in entries:
+        matric_no = entry.get('MATRIC_NO') if isinstance(entry, dict) else None
+        courses = entry.get('courses') if isinstance(entry, dict) else None
+        if not matric_no or not courses or not isinstance(courses, dict):
+            raise ValueError('Missing matric_no or courses data')
+        student = updates.setdefault(str(matric_no).strip(), {})
+        for course_code, attempts in courses.items():
+            if not isinstance(attempts, (list, tuple)) or len(attempts) != 3:
+                raise ValueError(f'{matric_no} {course_code}: expected [attempt1, attempt2, attempt3]')
+            # Same text the NVARCHAR columns would store; None stays NULL
+            student[course_code] = tuple(None if a is None else str(a) for a in attempts)
+    return updates
+
+def _score_key(matric_no, course_code):
+    # Match the way SQL Server compares the keys (case-insensitive, trailing blanks ignored)
+    return (str(matric_no).rstrip().upper(), str(course_code).rstrip().upper())
+
+def fetch_score_rows(cursor, matric_nos, chunk_size=1000):
+    """{_score_key(MATRIC_NO, COURSE_CODE): (SCORE_ID, a1, a2, a3)} for the given students, one query per chunk"""
+    matric_nos = list(matric_nos)
+    rows = {}
+    for i in range(0, len(matric_nos), chunk_size):
+        chunk = matric_nos[i:i + chunk_size]
+        cursor.execute(f"""
+            SELECT MATRIC_NO, COURSE_CODE, SCORE_ID, ATTEMPT_1, ATTEMPT_2, ATTEMPT_3
+            FROM STUDENT_SCORE
+            WHERE MATRIC_NO IN ({', '.join('?' * len(chunk))})
+        """, chunk)
+        for matric_no, course_code, score_id, a1, a2, a3 in cursor.fetchall():
+            rows[_score_key(matric_no, course_code)] = (score_id, a1, a2, a3)
+    return rows
 
-                update_set_parts.append("ATTEMPT_2 = ?")
-                update_values.append(new_attempt2)
-                if str(new_attempt2) != str(current_attempt2):
-                    update_set_parts.append("A2_UPDATED_AT = GETDATE()")
-                else:
-                    update_set_parts.append("A2_UPDATED_AT = ?")
-                    update_values.append(current_a2_updated_at)
+@app.route('/api/students-scores', methods=['PUT'])
+@jwt_required()
+def update_student_scores():
+    """
+    Save edited attempts for one or many students in a single transaction.
+    Current rows are read in one query, compared in memory (str() comparison, as before), and only
+    rows with a changed attempt are written; each changed attempt's *_UPDATED_AT becomes GETDATE().
+    Missing (MATRIC_NO, COURSE_CODE) rows are inserted with timestamps for the non-null attempts.
+    """
+    conn = None
+    try:
+        try:
+            updates = parse_score_updates(request.get_json())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-                update_set_parts.append("ATTEMPT_3 = ?")
-                update_values.append(new_attempt3)
-                if str(new_attempt3) != str(current_attempt3):
-                    update_set_parts.append("A3_UPDATED_AT = GETDATE()")
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        current = fetch_score_rows(cursor, updates.keys())
+
+        update_rows, insert_rows = [], []
+        unchanged = 0
+        now = datetime.now()
+        for matric_no, courses in updates.items():
+            for course_code, new_attempts in courses.items():
+                existing = current.get(_score_key(matric_no, course_code))
+                if existing is None:
+                    # This case should ideally not happen if the student was created correctly
+                    insert_rows.append((
+                        matric_no, course_code, *new_attempts,
+                        *(now if a is not None else None for a in new_attempts)
+                    ))
+                    continue
+                score_id, *old_attempts = existing
+                flags = [int(str(new) != str(old)) for new, old in zip(new_attempts, old_attempts)]
+                if any(flags):
+                    update_rows.append((*new_attempts, *flags, score_id))
                 else:
-                    update_set_parts.append("A3_UPDATED_AT = ?")
-                    update_values.append(current_a3_updated_at)
-
-                update_query = f"""
-                    UPDATE STUDENT_SCORE
-                    SET {', '.join(update_set_parts)}
-                    WHERE MATRIC_NO = ? AND COURSE_CODE = ?
-                """
-                final_params = update_values + [matric_no, course_code]
-                cursor.execute(update_query, final_params)
-            else:
-                # This case should ideally not happen if the student was created correctly
-                # but as a fallback, we can insert.
-                # For insert, all updated_at fields are set to GETDATE() if the attempt is provided, else NULL
-                today = datetime.now()
-                cursor.execute("""
-                    INSERT INTO STUDENT_SCORE (MATRIC_NO, COURSE_CODE, ATTEMPT_1, ATTEMPT_2, ATTEMPT_3, A1_UPDATED_AT, A2_UPDATED_AT, A3_UPDATED_AT)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    matric_no, course_code, new_attempt1, new_attempt2, new_attempt3,
-                    today if new_attempt1 is not None else None,
-                    today if new_attempt2 is not None else None,
-                    today if new_attempt3 is not None else None
-                ))
-
-
+                    unchanged += 1
+
+        if update_rows:
+            cursor.fast_executemany = True
+            cursor.setinputsizes([(pyodbc.SQL_WVARCHAR, 100, 0)] * 3 + [(pyodbc.SQL_INTEGER, 0, 0)] * 4)
+            cursor.executemany(SCORE_BATCH_UPDATE_SQL, update_rows)
+            cursor.setinputsizes(None)
+        if insert_rows:
+            cursor.fast_executemany = True
+            cursor.setinputsizes([(pyodbc.SQL_WVARCHAR, 100, 0)] * 5 + [(pyodbc.SQL_TYPE_TIMESTAMP, 23, 3)] * 3)
+            cursor.executemany("""
+                INSERT INTO STUDENT_SCORE (MATRIC_NO, COURSE_CODE, ATTEMPT_1, ATTEMPT_2, ATTEMPT_3, A1_UPDATED_AT, A2_UPDATED_AT, A3_UPDATED_AT)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, insert_rows)
+            cursor.setinputsizes(None)
+        cursor.fast_executemany = False
 
         conn.commit()
         cursor.close()
         conn.close()
 
-        return jsonify({'message': 'Scores updated successfully'}), 200
+        return jsonify({
+            'message': 'Scores updated successfully',
+            'students': len(updates),
+            'updated': len(update_rows),
+            'inserted': len(insert_rows),
+            'unchanged': unchanged
+        }), 200
 
     except Exception as e:
         # Log the error
@@ -1505,102 +1900,15 @@ def get_students_scores_by_cohort():
     if not year:
         return jsonify({'error': 'year is required'}), 400
 
-    # Build a DATE string for the cohort anchor
-    cohort_date = f"{year}-01-01"  # adjust month if intake starts later
-
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-
-        query = """
-        DECLARE @cohortDate DATE = ?;
-
-        WITH CleanStructure AS (
-          SELECT DISTINCT
-            cs.COURSE_CODE,
-            cs.MODULE,
-            cs.COURSE_CLASSIFICATION,
-            cs.COURSE_LEVEL,
-            cs.COURSE_STATUS,
-            cs.COURSE_PRIORITY,
-            cs.COURSE_VERSION
-          FROM COURSE_STRUCTURE cs
-          WHERE cs.COURSE_VERSION IS NOT NULL
-        ),
-        VersionWindows AS (
-          SELECT
-            c.COURSE_CODE,
-            c.MODULE,
-            c.COURSE_CLASSIFICATION,
-            c.COURSE_LEVEL,
-            c.COURSE_STATUS,
-            c.COURSE_PRIORITY,
-            c.COURSE_VERSION AS version_start,
-            LEAD(c.COURSE_VERSION) OVER (
-              PARTITION BY c.COURSE_CODE
-              ORDER BY c.COURSE_VERSION
-            ) AS next_version_start
-          FROM CleanStructure c
-        ),
-        ApplicableCourses AS (
-        SELECT
-            vw.COURSE_CODE,
-            vw.MODULE,
-            vw.COURSE_CLASSIFICATION,
-            vw.COURSE_LEVEL,
-            vw.COURSE_STATUS,
-            vw.COURSE_PRIORITY
-        FROM VersionWindows vw
-        WHERE @cohortDate >= vw.version_start
-            AND @cohortDate < COALESCE(vw.next_version_start, '9999-12-31')
-        ),
-        CohortFiltered AS (
-        SELECT
-            s.MATRIC_NO,
-            s.STUDENT_NAME,
-            s.SEM,
-            s.CU_ID,
-            YEAR(s.COHORT) AS COHORT_YEAR
-        FROM STUDENTS s
-        WHERE s.COHORT IS NOT NULL
-            AND YEAR(s.COHORT) = YEAR(@cohortDate)
-        )
-        SELECT
-          st.STUDENT_NAME,
-          CAST(YEAR(@cohortDate) AS INT) AS REQUEST_YEAR,
-          st.COHORT_YEAR AS COHORT,
-          st.SEM,
-          st.CU_ID,
-          ac.COURSE_CODE,
-          sc.SCORE_ID,
-          st.MATRIC_NO,
-          sc.ATTEMPT_1,
-          sc.ATTEMPT_2,
-          sc.ATTEMPT_3
-        FROM CohortFiltered st
-        CROSS JOIN ApplicableCourses ac
-        LEFT JOIN STUDENT_SCORE sc
-          ON sc.MATRIC_NO = st.MATRIC_NO
-         AND RTRIM(LTRIM(sc.COURSE_CODE)) = RTRIM(LTRIM(ac.COURSE_CODE))
-        ORDER BY st.STUDENT_NAME, ac.COURSE_CODE;
-        """
-
-        # Bind a DATE string for @cohortDate
-        cur.execute(query, (cohort_date,))
-        cols = [c[0] for c in cur.description]
-        rows = [dict(zip(cols, r)) for r in cur.fetchall()]
-        cur.close()
-        conn.close()
-        return jsonify(rows), 200
+        # Materialized course list + per-year response cache (see src/services/cohort_scores.py)
+        return jsonify(get_cohort_scores(year)), 200
 
     except Exception as e:
         import traceback, sys, logging
         logger = logging.getLogger(__name__)
         tb = "".join(traceback.format_exception(*sys.exc_info()))
         logger.error("cohort query failed: %s\n%s", str(e), tb)
-        if conn:
-            conn.close()
         return jsonify({'error': str(e)}), 500
 
 
@@ -1634,8 +1942,22 @@ def delete_student(student_id):
         print(f"Delete error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/students/lookup-ic', methods=['POST'])
+@jwt_required()
+def lookup_students_by_ic():
+    """Find students by IC number through the blind index (IC sent in the body, not the URL)"""
+    data = request.get_json() or {}
+    ic_no = str(data.get('IC_NO') or '').strip()
+    if not ic_no:
+        return jsonify({'error': 'IC_NO is required'}), 400
+    try:
+        return jsonify(find_students_by_ic(ic_no)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/students/<student_id>', methods=['PUT'])
 def update_student(student_id):
+    require_ic_blind_index()
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -1664,7 +1986,14 @@ def update_student(student_id):
         update_fields = []
         values = []
         for key, value in data.items():
+            if key.upper() == "IC_NO_BIDX":
+                continue  # derived from IC_NO below, never taken from the client
+            if key.upper() == "IC_NO" and value == IC_MASK:
+                continue  # masked list value sent back unchanged
             if key.upper() == "IC_NO":
+                # Keep the blind index in step with the ciphertext
+                update_fields.append("IC_NO_BIDX = ?")
+                values.append(ic_blind_index(value))
                 value = encrypt_ic(value)
             update_fields.append(f"{key} = ?")
             values.append(value)
@@ -2015,6 +2344,12 @@ def api_delete_lecturer(lecturer_name):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/admin/db-pool-stats', methods=['GET'])
+@jwt_required()
+def api_get_db_pool_stats():
+    """Connection pool hit/miss/wait counters (used to size MSSQL_POOL_SIZE under load)"""
+    return jsonify(get_pool_stats()), 200
+
 
 @app.route('/api/students/status-counts', methods=['GET'])
 def get_student_status_counts():
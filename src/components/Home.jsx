@@ -13,7 +13,8 @@ const Home = () => {
   useEffect(() => {
     const fetchData = async () => {
       try {
-        const response = await api.get("/students");
+        // Charts only need status and semester; skip the IC column entirely
+        const response = await api.get("/students", { params: { fields: "STUDENT_ID,STUDENT_STATUS,SEM" } });
         const students = response.data;
 
         // Process for StudentStatusPieChart
@@ -2,7 +2,7 @@ import React, { useState, useEffect } from "react";
 import { AdapterDayjs } from "@mui/x-date-pickers/AdapterDayjs";
 import { DatePicker } from "@mui/x-date-pickers/DatePicker";
 import { LocalizationProvider } from '@mui/x-date-pickers/LocalizationProvider';
-import api from '../services/api';
+import api, { waitForImportJob } from '../services/api';
 import FileUpload from './FileUpload';
 import '../App.css';
 import { MdPersonAddAlt1, MdPersonRemoveAlt1 } from "react-icons/md";
@@ -119,6 +119,22 @@ const Import = () => {
         },
       });
 
+      if (res.status === 202 && res.data.job_id) {
+        // Student sheets are imported in the background; follow the job until it is done
+        setIsProcessing(true);
+        setMessage(res.data.message);
+        setMessageType("success");
+        const job = await waitForImportJob(res.data.job_id, (job) => {
+          setMessage(`Importing (${job.stage}): ${job.rows_processed} rows processed`);
+        });
+        setProgress(100);
+        setMessage(job.result?.unchanged
+          ? `${selectedSheet} workbook is unchanged since the last import, nothing to update`
+          : `${selectedSheet} processed and imported successfully`);
+        setMessageType("success");
+        return;
+      }
+
       setProgress(100);
       setMessage(res.data.message);
       setMessageType("success");
@@ -1,5 +1,6 @@
 import React, { useState } from "react";
 import { useNavigate } from "react-router-dom";
+import api from "../services/api";
 import { MdDeleteOutline, MdOutlineEdit, MdOutlineCancel, MdOutlineSaveAs } from "react-icons/md";
 
 
@@ -17,6 +18,17 @@ export default function StudentRow({ student, columns, shouldCenter, onUpdate, o
     });
   };
 
+  // The list only carries a masked IC; decrypt this student's IC when editing starts
+  const handleEdit = async () => {
+    setEditMode(true);
+    try {
+      const res = await api.get(`/students/${student.STUDENT_ID}/ic`);
+      setFormData((prev) => ({ ...prev, IC_NO: res.data.IC_NO }));
+    } catch (err) {
+      console.error("Failed to fetch IC number:", err);
+    }
+  };
+
   const handleSave = () => {
     onUpdate(formData);
     setEditMode(false);
@@ -157,7 +169,7 @@ export default function StudentRow({ student, columns, shouldCenter, onUpdate, o
             ) : (
             <>
                 <button
-                onClick={() => setEditMode(true)}
+                onClick={handleEdit}
                 style={{
                     marginRight: "6px",
                     padding: "4px 8px",
@@ -5,6 +5,8 @@ export default function useStudentsData() {
   const [data, setData] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  // STUDENT_SCORE change version of the loaded scores (for /students-scores/changes)
+  const [version, setVersion] = useState(null);
   const location = useLocation(); //new dont put location inside [] as the value is array-destructured
 
   // New
@@ -25,6 +27,8 @@ export default function useStudentsData() {
     fetch(url, { signal: controller.signal })
       .then((res) => {
         if (!res.ok) throw new Error(`Failed to fetch: ${res.status}`);
+        const header = res.headers.get("X-Scores-Version");
+        setVersion(header !== null ? Number(header) : null);
         return res.json();
       })
       .then((json) => {
@@ -40,5 +44,5 @@ export default function useStudentsData() {
     return () => controller.abort();
   }, [location.pathname]);
 
-  return { data, loading, error, setData };
+  return { data, loading, error, setData, version, setVersion };
 }
\ No newline at end of file
@@ -1,21 +1,285 @@
-import logging, os, pyodbc
+import logging, os, threading, time, pyodbc
+from collections import deque
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Pool sizing (override in .env when tuning under load)
+POOL_SIZE = int(os.getenv("MSSQL_POOL_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("MSSQL_POOL_TIMEOUT", "30"))         # seconds to wait for a free connection
+POOL_IDLE_SECONDS = float(os.getenv("MSSQL_POOL_IDLE_SECONDS", "300"))  # evict handles idle longer than this
+POOL_PING_AFTER = float(os.getenv("MSSQL_POOL_PING_AFTER", "30"))   # pre-ping handles idle longer than this
+
+
+def _connect():
+    """Open a raw pyodbc connection to the MSSQL database"""
+    return pyodbc.connect(
+        'DRIVER={ODBC Driver 17 for SQL Server};'
+        f'SERVER={os.getenv("MSSQL_SERVER")};'
+        f'DATABASE={os.getenv("MSSQL_DATABASE")};'
+        f'UID={os.getenv("MSSQL_USERNAME")};'
+        f'PWD={os.getenv("MSSQL_PASSWORD")}'
+    )
+
+
+class PooledConnection:
+    """
+    Thin wrapper around a pyodbc connection checked out from the pool.
+    Behaves like the raw connection (cursor/commit/rollback/execute/autocommit...),
+    but close() hands the handle back to the pool instead of tearing it down.
+    Also usable as a context manager: commits on success, rolls back on error, then releases.
+    """
+
+    def __init__(self, pool, raw):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_raw", raw)
+
+    def __getattr__(self, name):
+        raw = object.__getattribute__(self, "_raw")
+        if raw is None:
+            raise pyodbc.ProgrammingError("Attempt to use a closed connection.")
+        return getattr(raw, name)
+
+    def __setattr__(self, name, value):
+        # e.g. conn.autocommit = False
+        setattr(object.__getattribute__(self, "_raw"), name, value)
+
+    @property
+    def closed(self):
+        return object.__getattribute__(self, "_raw") is None
+
+    def close(self):
+        raw = object.__getattribute__(self, "_raw")
+        if raw is None:
+            return
+        object.__setattr__(self, "_raw", None)
+        self._pool._release(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if not self.closed:
+                if exc_type is None:
+                    self.commit()
+                else:
+                    self.rollback()
+        finally:
+            self.close()
+        return False
+
+    def __del__(self):
+        # Safety net for call sites that forget conn.close() on an early return
+        try:
+            raw = object.__getattribute__(self, "_raw")
+        except AttributeError:
+            return
+        if raw is not None:
+            logging.warning("Pooled DB connection was garbage collected without close(); returning it to the pool")
+            self.close()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of pyodbc connections.
+    - At most `size` handles exist at once; callers block up to `timeout` seconds for one
+    - Each checkout belongs to the calling thread until it is closed/released
+    - Idle handles older than `idle_seconds` are evicted
+    - Handles idle longer than `ping_after` are pre-pinged and transparently reconnected if stale
+    """
+
+    def __init__(self, connect=_connect, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 idle_seconds=POOL_IDLE_SECONDS, ping_after=POOL_PING_AFTER):
+        self._connect = connect
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self.idle_seconds = idle_seconds
+        self.ping_after = ping_after
+
+        self._idle = deque()        # (raw_conn, returned_at) - LIFO so warm handles are reused first
+        self._checked_out = {}      # id(raw_conn) -> owning thread ident
+        self._pending = 0           # slots reserved while a checkout is connecting/pinging
+        self._cond = threading.Condition()
+        self._stats = {
+            "hits": 0,              # checkout served from an idle handle
+            "misses": 0,            # checkout had to open a new handle
+            "waits": 0,             # checkout had to wait for a handle to be released
+            "wait_time_total": 0.0, # seconds spent waiting
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "evictions": 0,         # idle handles closed for age
+            "reconnects": 0,        # stale handles replaced after a failed pre-ping
+        }
+
+    # ---- internals ----
+
+    def _total(self):
+        return len(self._idle) + len(self._checked_out) + self._pending
+
+    def _evict_idle_locked(self, now):
+        keep = deque()
+        for raw, returned_at in self._idle:
+            if now - returned_at > self.idle_seconds:
+                self._stats["evictions"] += 1
+                self._close_quietly(raw)
+            else:
+                keep.append((raw, returned_at))
+        self._idle = keep
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _ping(raw):
+        try:
+            cur = raw.cursor()
+            try:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            finally:
+                cur.close()
+            return True
+        except pyodbc.Error:
+            return False
+
+    # ---- public API ----
+
+    def acquire(self):
+        start = time.monotonic()
+        waited = False
+        raw = None
+        idle_for = 0.0
+
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._evict_idle_locked(now)
+
+                if self._idle:
+                    raw, returned_at = self._idle.pop()
+                    idle_for = now - returned_at
+                    self._stats["hits"] += 1
+                    break
+
+                if self._total() < self.size:
+                    self._stats["misses"] += 1
+                    break
+
+                remaining = self.timeout - (now - start)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise TimeoutError(
+                        f"Timed out after {self.timeout}s waiting for a DB connection "
+                        f"(pool size {self.size}, all checked out)"
+                    )
+                if not waited:
+                    waited = True
+                    self._stats["waits"] += 1
+                self._cond.wait(remaining)
+
+            if waited:
+                wait_time = time.monotonic() - start
+                self._stats["wait_time_total"] += wait_time
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait_time)
+
+            # Reserve the slot before doing any network I/O outside the lock
+            self._pending += 1
+
+        try:
+            if raw is not None and idle_for > self.ping_after and not self._ping(raw):
+                logging.info("Stale pooled DB connection detected, reconnecting")
+                self._close_quietly(raw)
+                raw = None
+                with self._cond:
+                    self._stats["reconnects"] += 1
+            if raw is None:
+                raw = self._connect()
+                logging.debug("Successfully connected to MSSQL database")
+        except Exception:
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._pending -= 1
+            self._checked_out[id(raw)] = threading.get_ident()
+
+        return PooledConnection(self, raw)
+
+    def _release(self, raw):
+        healthy = True
+        try:
+            # Never hand an open transaction (or a flipped autocommit) to the next borrower
+            raw.rollback()
+            if raw.autocommit:
+                raw.autocommit = False
+        except pyodbc.Error:
+            healthy = False
+
+        with self._cond:
+            self._checked_out.pop(id(raw), None)
+            if healthy and self._total() < self.size:
+                self._idle.append((raw, time.monotonic()))
+            else:
+                self._close_quietly(raw)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        with conn:
+            yield conn
+
+    def stats(self):
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "size": self.size,
+                "idle": len(self._idle),
+                "checked_out": len(self._checked_out),
+                "checkouts": snapshot["hits"] + snapshot["misses"],
+            })
+        snapshot["wait_time_avg"] = (snapshot["wait_time_total"] / snapshot["waits"]) if snapshot["waits"] else 0.0
+        return snapshot
+
+    def dispose(self):
+        """Close all idle handles (checked-out handles are closed when released)"""
+        with self._cond:
+            while self._idle:
+                raw, _ = self._idle.pop()
+                self._close_quietly(raw)
+
+
+_pool = ConnectionPool()
+
+
 # Database connection function
 def get_db_connection():
-    """Establish connection to existing MSSQL database"""
+    """Check out a pooled connection to the existing MSSQL database (close() returns it to the pool)"""
     try:
-        conn = pyodbc.connect(
-            'DRIVER={ODBC Driver 17 for SQL Server};'
-            f'SERVER={os.getenv("MSSQL_SERVER")};'
-            f'DATABASE={os.getenv("MSSQL_DATABASE")};'
-            f'UID={os.getenv("MSSQL_USERNAME")};'
-            f'PWD={os.getenv("MSSQL_PASSWORD")}'
-        )
-        logging.debug("Successfully connected to MSSQL database")
-        return conn
+        return _pool.acquire()
     except Exception as e:
         logging.error(f"Database connection error: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+
+def db_connection():
+    """
+    Context manager around a pooled connection:
+        with db_connection() as conn:
+            ...
+    Commits on success, rolls back on error, always returns the handle to the pool.
+    """
+    return _pool.connection()
+
+
+def get_pool_stats():
+    """Pool hit/miss/wait counters, for sizing MSSQL_POOL_SIZE under load"""
+    return _pool.stats()
@@ -0,0 +1,26 @@
+# src/db/migrate.py
+#
+# One-off setup: create the columns, indexes, tables and triggers listed in src/db/schema.py.
+# Run after deploying and before starting the app, with a login allowed to ALTER tables and
+# CREATE TRIGGER; adding STUDENT_SCORE.ROW_VER rewrites that table, so pick a quiet window.
+#   python -m src.db.migrate [--list] [name ...]
+
+import argparse, logging
+from src.db.schema import MIGRATIONS, apply_migrations
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply the schema migrations the app requires")
+    parser.add_argument("names", nargs="*", help="only these migrations (default: all, in order)")
+    parser.add_argument("--list", action="store_true", help="list the migrations without applying them")
+    args = parser.parse_args()
+    unknown = [n for n in args.names if n not in MIGRATIONS]
+    if unknown:
+        parser.error(f"unknown migration(s): {', '.join(unknown)} (see --list)")
+
+    if args.list:
+        print("\n".join(MIGRATIONS))
+        raise SystemExit(0)
+
+    logging.basicConfig(level=logging.INFO)
+    applied = apply_migrations(args.names or None)
+    print(f"Schema up to date: {len(applied)} migration(s) applied" + (f" ({', '.join(applied)})" if applied else ""))
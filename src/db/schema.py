@@ -0,0 +1,335 @@
+import logging, threading
+from src.db.core import get_db_connection
+
+# Columns, indexes, tables and triggers added after the original schema, in the order they apply.
+# They are created only by the one-off setup command, run after deploying and before starting the
+# app, with a login allowed to ALTER tables and CREATE TRIGGER (some steps rewrite STUDENT_SCORE):
+#
+#   python -m src.db.migrate [--list]
+#
+# Request handlers call require_*(), which only checks the objects exist (once per process, until
+# it passes) and raises SchemaNotReady otherwise.
+
+# name -> (SQL condition that holds once applied, idempotent DDL statements)
+MIGRATIONS = {}
+
+_ready = set()
+_lock = threading.Lock()
+
+
+class SchemaNotReady(RuntimeError):
+    """The database lacks objects the app needs; run python -m src.db.migrate"""
+
+
+def _migration(name, check, statements):
+    MIGRATIONS[name] = (check, statements)
+
+
+def _require(name):
+    if name in _ready:
+        return
+    check, _ = MIGRATIONS[name]
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT CASE WHEN {check} THEN 1 ELSE 0 END")
+            applied = cur.fetchone()[0] == 1
+    finally:
+        conn.close()
+    if not applied:
+        raise SchemaNotReady(f"Database schema is out of date (migration '{name}' not applied); "
+                             f"run: python -m src.db.migrate")
+    with _lock:
+        _ready.add(name)
+
+
+def apply_migrations(names=None):
+    """
+    Apply the given migrations (all by default) in order, each in its own transaction.
+    Already applied steps are skipped by their IF guards. Returns the names that were missing.
+    """
+    applied = []
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            for name, (check, statements) in MIGRATIONS.items():
+                if names is not None and name not in names:
+                    continue
+                cur.execute(f"SELECT CASE WHEN {check} THEN 1 ELSE 0 END")
+                if cur.fetchone()[0] == 1:
+                    logging.info("Migration '%s' already applied", name)
+                    continue
+                try:
+                    # One execute per statement: a batch cannot reference a column it adds itself
+                    for sql in statements:
+                        cur.execute(sql)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                logging.info("Migration '%s' applied", name)
+                applied.append(name)
+    finally:
+        conn.close()
+    return applied
+
+
+_migration("ic_blind_index", """
+    COL_LENGTH('dbo.STUDENTS', 'IC_NO_BIDX') IS NOT NULL
+""", [
+    """
+    IF COL_LENGTH('dbo.STUDENTS', 'IC_NO_BIDX') IS NULL
+        ALTER TABLE dbo.STUDENTS ADD IC_NO_BIDX CHAR(64) NULL
+    """,
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes
+                   WHERE name = 'IX_STUDENTS_IC_NO_BIDX' AND object_id = OBJECT_ID('dbo.STUDENTS'))
+        CREATE INDEX IX_STUDENTS_IC_NO_BIDX ON dbo.STUDENTS (IC_NO_BIDX)
+    """,
+])
+
+
+def require_ic_blind_index():
+    """STUDENTS.IC_NO_BIDX: keyed HMAC of the normalized IC number, indexed for equality lookups"""
+    _require("ic_blind_index")
+
+
+_migration("score_change_tracking", """
+    COL_LENGTH('dbo.STUDENT_SCORE', 'ROW_VER') IS NOT NULL
+    AND OBJECT_ID('dbo.STUDENT_SCORE_TOMBSTONES', 'U') IS NOT NULL
+    AND OBJECT_ID('dbo.TR_STUDENT_SCORE_TOMBSTONE', 'TR') IS NOT NULL
+""", [
+    """
+    IF COL_LENGTH('dbo.STUDENT_SCORE', 'ROW_VER') IS NULL
+        ALTER TABLE dbo.STUDENT_SCORE ADD ROW_VER ROWVERSION
+    """,
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes
+                   WHERE name = 'IX_STUDENT_SCORE_ROW_VER' AND object_id = OBJECT_ID('dbo.STUDENT_SCORE'))
+        CREATE INDEX IX_STUDENT_SCORE_ROW_VER ON dbo.STUDENT_SCORE (ROW_VER)
+    """,
+    """
+    IF OBJECT_ID('dbo.STUDENT_SCORE_TOMBSTONES', 'U') IS NULL
+        CREATE TABLE dbo.STUDENT_SCORE_TOMBSTONES (
+            SCORE_ID INT NOT NULL,
+            MATRIC_NO NVARCHAR(100) NULL,
+            COURSE_CODE NVARCHAR(100) NULL,
+            DELETED_AT DATETIME NOT NULL DEFAULT GETDATE(),
+            ROW_VER ROWVERSION,
+            INDEX IX_STUDENT_SCORE_TOMBSTONES_ROW_VER (ROW_VER)
+        )
+    """,
+    # CREATE TRIGGER must be alone in its batch, hence the EXEC
+    """
+    IF OBJECT_ID('dbo.TR_STUDENT_SCORE_TOMBSTONE', 'TR') IS NULL
+        EXEC('CREATE TRIGGER dbo.TR_STUDENT_SCORE_TOMBSTONE ON dbo.STUDENT_SCORE AFTER DELETE AS
+              BEGIN
+                  SET NOCOUNT ON;
+                  INSERT INTO dbo.STUDENT_SCORE_TOMBSTONES (SCORE_ID, MATRIC_NO, COURSE_CODE)
+                  SELECT SCORE_ID, MATRIC_NO, COURSE_CODE FROM deleted;
+              END')
+    """,
+])
+
+
+def require_score_change_tracking():
+    """
+    STUDENT_SCORE.ROW_VER (rowversion, bumped by SQL Server on every insert/update from any writer)
+    plus STUDENT_SCORE_TOMBSTONES, filled by an AFTER DELETE trigger so deletions show up in the feed.
+    """
+    _require("score_change_tracking")
+
+
+_migration("student_change_tracking", """
+    COL_LENGTH('dbo.STUDENTS', 'ROW_VER') IS NOT NULL
+""", [
+    """
+    IF COL_LENGTH('dbo.STUDENTS', 'ROW_VER') IS NULL
+        ALTER TABLE dbo.STUDENTS ADD ROW_VER ROWVERSION
+    """,
+])
+
+
+def require_student_change_tracking():
+    """STUDENTS.ROW_VER (rowversion), so every student insert/update moves @@DBTS like score writes do"""
+    _require("student_change_tracking")
+
+
+# /api/students sort orders: (sort key columns, index). STUDENT_ID is the unique tie-breaker.
+STUDENT_SORT_INDEXES = {
+    'IX_STUDENTS_SORT_NAME': 'SORT_NAME, SORT_STATUS, STUDENT_ID',
+    'IX_STUDENTS_SORT_MATRIC': 'SORT_MATRIC, STUDENT_ID',
+    'IX_STUDENTS_SORT_COHORT': 'SORT_COHORT, SORT_NAME, STUDENT_ID',
+    'IX_STUDENTS_SORT_SEM': 'SORT_SEM, SORT_NAME, STUDENT_ID',
+    'IX_STUDENTS_SORT_STATUS': 'SORT_STATUS, SORT_NAME, STUDENT_ID',
+}
+
+# Persisted NULL-free sort key columns and the expressions they copy
+_SORT_KEY_COLUMNS = {
+    'SORT_NAME': "ISNULL(STUDENT_NAME, '')",
+    'SORT_STATUS': "ISNULL(STUDENT_STATUS, '')",
+    'SORT_MATRIC': "ISNULL(MATRIC_NO, '')",
+    'SORT_COHORT': "ISNULL(COHORT, DATEFROMPARTS(1900, 1, 1))",
+    'SORT_SEM': "ISNULL(SEM, '')",
+}
+
+
+_migration("student_sort_keys", """
+    COL_LENGTH('dbo.STUDENTS', 'SORT_SEM') IS NOT NULL
+""", [
+    f"""
+    IF COL_LENGTH('dbo.STUDENTS', '{name}') IS NULL
+        ALTER TABLE dbo.STUDENTS ADD {name} AS {expr} PERSISTED
+    """
+    for name, expr in _SORT_KEY_COLUMNS.items()
+] + [
+    f"""
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes
+                   WHERE name = '{index}' AND object_id = OBJECT_ID('dbo.STUDENTS'))
+        CREATE INDEX {index} ON dbo.STUDENTS ({keys})
+    """
+    for index, keys in STUDENT_SORT_INDEXES.items()
+])
+
+
+def require_student_sort_keys():
+    """
+    STUDENTS.SORT_*: persisted NULL-free copies of the /api/students sort columns, each with an index
+    in sort order, so keyset pages seek on plain columns instead of sorting ISNULL() expressions
+    """
+    _require("student_sort_keys")
+
+
+_migration("cohort_course_matrix", """
+    OBJECT_ID('dbo.COHORT_APPLICABLE_COURSES', 'U') IS NOT NULL
+    AND OBJECT_ID('dbo.COHORT_APPLICABLE_COURSES_STATE', 'U') IS NOT NULL
+    AND COL_LENGTH('dbo.STUDENT_SCORE', 'COURSE_CODE_KEY') IS NOT NULL
+""", [
+    """
+    IF OBJECT_ID('dbo.COHORT_APPLICABLE_COURSES', 'U') IS NULL
+        CREATE TABLE dbo.COHORT_APPLICABLE_COURSES (
+            COHORT_YEAR INT NOT NULL,
+            COURSE_CODE NVARCHAR(100) NOT NULL,
+            MODULE NVARCHAR(MAX) NULL,
+            COURSE_CLASSIFICATION NVARCHAR(255) NULL,
+            COURSE_LEVEL INT NULL,
+            COURSE_STATUS NVARCHAR(255) NULL,
+            COURSE_PRIORITY INT NULL,
+            INDEX IX_COHORT_APPLICABLE_COURSES CLUSTERED (COHORT_YEAR, COURSE_CODE)
+        )
+    """,
+    """
+    IF OBJECT_ID('dbo.COHORT_APPLICABLE_COURSES_STATE', 'U') IS NULL
+        CREATE TABLE dbo.COHORT_APPLICABLE_COURSES_STATE (
+            COHORT_YEAR INT NOT NULL PRIMARY KEY,
+            STRUCTURE_FINGERPRINT VARCHAR(64) NOT NULL,
+            REFRESHED_AT DATETIME NOT NULL DEFAULT GETDATE()
+        )
+    """,
+    """
+    IF COL_LENGTH('dbo.STUDENT_SCORE', 'COURSE_CODE_KEY') IS NULL
+        ALTER TABLE dbo.STUDENT_SCORE ADD COURSE_CODE_KEY AS LTRIM(RTRIM(COURSE_CODE)) PERSISTED
+    """,
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes
+                   WHERE name = 'IX_STUDENT_SCORE_MATRIC_COURSE_KEY' AND object_id = OBJECT_ID('dbo.STUDENT_SCORE'))
+        CREATE INDEX IX_STUDENT_SCORE_MATRIC_COURSE_KEY
+            ON dbo.STUDENT_SCORE (MATRIC_NO, COURSE_CODE_KEY)
+            INCLUDE (SCORE_ID, ATTEMPT_1, ATTEMPT_2, ATTEMPT_3)
+    """,
+])
+
+
+def require_cohort_course_matrix():
+    """
+    COHORT_APPLICABLE_COURSES: courses whose COURSE_VERSION window covers 1 Jan of each cohort year,
+    with trimmed COURSE_CODE; COHORT_APPLICABLE_COURSES_STATE records the COURSE_STRUCTURE fingerprint
+    each year was built from. STUDENT_SCORE.COURSE_CODE_KEY is the trimmed code, indexed with MATRIC_NO
+    so the cohort join can seek instead of trimming every row.
+    """
+    _require("cohort_course_matrix")
+
+
+_migration("student_features", """
+    OBJECT_ID('dbo.STUDENT_FEATURES', 'U') IS NOT NULL
+    AND OBJECT_ID('dbo.STUDENT_FEATURES_STATE', 'U') IS NOT NULL
+""", [
+    """
+    IF OBJECT_ID('dbo.STUDENT_FEATURES', 'U') IS NULL
+        CREATE TABLE dbo.STUDENT_FEATURES (
+            MATRIC_NO NVARCHAR(100) NOT NULL PRIMARY KEY,
+            entry_year_level INT NULL,
+            total_courses INT NULL,
+            exempted_courses INT NULL,
+            actual_courses_taken INT NULL,
+            courses_passed_first_attempt INT NULL,
+            courses_with_2_attempts INT NULL,
+            courses_with_3_attempts INT NULL,
+            total_courses_needing_resits INT NULL,
+            total_first_attempt_failures INT NULL,
+            courses_never_passed INT NULL,
+            courses_passed_after_failing INT NULL,
+            avg_first_attempt_score FLOAT NULL,
+            lowest_first_attempt_score FLOAT NULL,
+            first_attempt_score_std_dev FLOAT NULL,
+            avg_final_score FLOAT NULL,
+            lowest_final_score FLOAT NULL,
+            highest_final_score FLOAT NULL,
+            courses_with_distinction_first_attempt INT NULL,
+            courses_barely_passed_first_attempt INT NULL,
+            courses_capped_at_40 INT NULL,
+            courses_still_failing INT NULL,
+            first_attempt_pass_rate FLOAT NULL,
+            resit_rate FLOAT NULL,
+            first_attempt_failure_rate FLOAT NULL,
+            third_attempt_rate FLOAT NULL,
+            resit_success_rate FLOAT NULL,
+            SOURCE_ROW_VER BIGINT NULL,
+            SOURCE_UPDATED_AT DATETIME NULL,
+            REFRESHED_AT DATETIME NOT NULL DEFAULT GETDATE()
+        )
+    """,
+    """
+    IF OBJECT_ID('dbo.STUDENT_FEATURES_STATE', 'U') IS NULL
+        CREATE TABLE dbo.STUDENT_FEATURES_STATE (
+            ID INT NOT NULL PRIMARY KEY CHECK (ID = 1),
+            WATERMARK BIGINT NOT NULL,
+            REFRESHED_AT DATETIME NOT NULL DEFAULT GETDATE()
+        )
+    """,
+])
+
+
+def require_student_features():
+    """
+    STUDENT_FEATURES: one row of graduation-model features per student with score rows, kept current by
+    src/services/student_features.py. STUDENT_FEATURES_STATE holds the STUDENT_SCORE change version
+    (ROW_VER) the table was last refreshed up to. Applied after score_change_tracking.
+    """
+    _require("student_features")
+
+
+_migration("predictions", """
+    OBJECT_ID('dbo.PREDICTIONS', 'U') IS NOT NULL
+""", [
+    """
+    IF OBJECT_ID('dbo.PREDICTIONS', 'U') IS NULL
+        CREATE TABLE dbo.PREDICTIONS (
+            MATRIC_NO NVARCHAR(100) NOT NULL PRIMARY KEY,
+            PROB_ON_TIME FLOAT NOT NULL,
+            PROB_LATE FLOAT NOT NULL,
+            PREDICTION INT NOT NULL,
+            PREDICTION_LABEL NVARCHAR(20) NOT NULL,
+            RISK_LEVEL NVARCHAR(20) NULL,
+            MODEL_VERSION NVARCHAR(100) NOT NULL,
+            FEATURE_HASH CHAR(16) NOT NULL,
+            SCORED_AT DATETIME NOT NULL,
+            BATCH_ID CHAR(32) NULL
+        )
+    """,
+])
+
+
+def require_predictions_table():
+    """PREDICTIONS: latest stored graduation prediction per student, written by src/services/batch_scoring.py"""
+    _require("predictions")
@@ -4,6 +4,7 @@ import { useParams, useNavigate } from 'react-router-dom';
 import Sidebar from '../components/Sidebar';
 import StudentPredictionCard from '../components/StudentPredictionCard';
 import StudentScoresReport from '../components/StudentScoresReport';
+import api from '../services/api';
 import { ArrowBack } from '@mui/icons-material';
 import '../App.css';
 
@@ -31,6 +32,12 @@ export default function StudentDetailsPage() {
           : json;
         setStudentInfo(student);
         setLoading(false);
+        // The list endpoint masks IC numbers; decrypt just this one
+        if (student && student.STUDENT_ID) {
+          api.get(`/students/${student.STUDENT_ID}/ic`)
+            .then((res) => setStudentInfo((prev) => ({ ...prev, IC_NO: res.data.IC_NO })))
+            .catch((err) => console.error('Failed to fetch IC number:', err));
+        }
       })
       .catch((err) => {
         setError(err.message);
@@ -2,7 +2,6 @@ import React, { useState } from "react";
 import Sidebar from "../components/Sidebar";
 import StudentRow from "../components/StudentRow";
 import useCohorts from "../components/useCohorts";
-import useStudentsData from "../components/Students";
 import api from '../services/api';
 import AddNewStudent from "../services/add_new_student";
 import { BsPersonAdd } from "react-icons/bs";
@@ -11,6 +10,7 @@ import "../App.css";
 // Helper functions for localStorage
 const FILTER_STORAGE_KEY = 'studentsPageFilters';
 const HIDDEN_COLS_KEY = 'studentsPageHiddenColumns';
+const PAGE_SIZE = 100;
 
 const saveFiltersToStorage = (cohort, status) => {
   try {
@@ -31,10 +31,13 @@ const loadFiltersFromStorage = () => {
 };
 
 export default function StudentsPage() {
-  const { data, loading, error, setData } = useStudentsData();
-  //const [students, setStudents] = useState([]);
   const {cohorts,loadingCohorts,errorCohorts} = useCohorts();
   const [students, setStudents] = React.useState(null);
+  const [total, setTotal] = React.useState(0);
+  const [nextPageToken, setNextPageToken] = React.useState(null);
+  const [loading, setLoading] = React.useState(true);
+  const [loadingMore, setLoadingMore] = React.useState(false);
+  const [error, setError] = React.useState(null);
   
   // Initialise filters from localStorage
   const savedFilters = loadFiltersFromStorage();
@@ -55,6 +58,57 @@ export default function StudentsPage() {
     return () => clearTimeout(id);
   }, [query]);
 
+  // Filtering and paging happen on the server (/api/students keyset pages);
+  // a filter change reloads the first page, "Load more" appends the next one
+  const studentParams = React.useMemo(() => {
+    const params = { limit: PAGE_SIZE };
+    if (selectedCohort !== "All") params.cohort_year = selectedCohort;
+    if (selectedStatus !== "All") params.status = selectedStatus;
+    if (debouncedQuery) params.q = debouncedQuery;
+    return params;
+  }, [selectedCohort, selectedStatus, debouncedQuery]);
+
+  // Responses for an older filter are dropped
+  const requestId = React.useRef(0);
+
+  const loadFirstPage = React.useCallback(async () => {
+    const id = ++requestId.current;
+    setLoading(true);
+    setError(null);
+    try {
+      const res = await api.get('/students', { params: studentParams });
+      if (id !== requestId.current) return;
+      setStudents(res.data.items);
+      setTotal(res.data.total);
+      setNextPageToken(res.data.next_page_token);
+    } catch (err) {
+      if (id !== requestId.current) return;
+      setError(err.message);
+    } finally {
+      if (id === requestId.current) setLoading(false);
+    }
+  }, [studentParams]);
+
+  React.useEffect(() => {
+    loadFirstPage();
+  }, [loadFirstPage]);
+
+  const loadMore = async () => {
+    if (!nextPageToken || loadingMore) return;
+    const id = requestId.current;
+    setLoadingMore(true);
+    try {
+      const res = await api.get('/students', { params: { ...studentParams, page_token: nextPageToken } });
+      if (id !== requestId.current) return;
+      setStudents((prev) => [...prev, ...res.data.items]);
+      setNextPageToken(res.data.next_page_token);
+    } catch (err) {
+      console.error("Failed to load more students:", err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // Column visibility
   const HIDABLE_COLUMNS = [
     { key: "MOBILE_NO", label: "Mobile No" },
@@ -77,9 +131,7 @@ export default function StudentsPage() {
     setSuccessMessage(message);
     setTimeout(() => setSuccessMessage(""), 3000);
     // Refresh student list
-    api.get('/students')
-      .then(newData => setData(newData.data))
-      .catch(err => console.error("Failed to refetch students:", err));
+    loadFirstPage();
   };
 
   React.useEffect(() => {
@@ -110,58 +162,8 @@ export default function StudentsPage() {
     fetchStatuses();
   }, []);
 
-  React.useLayoutEffect(() => {
-    setStudents(Array.isArray(data) ? data : []);
-  }, [data]);
-
-  // Extract unique statuses from data
-  const statuses = React.useMemo(() => {
-    // Add safety check
-    if (!students || !Array.isArray(students)) return [];
-
-    const uniqueStatuses = [...new Set(students.map(s => s.STUDENT_STATUS).filter(Boolean))];
-    return uniqueStatuses.sort();
-  }, [students]);
-
-
-  // Filter by both cohort and status
-  const filtered = React.useMemo(() => {
-    if (!students || !Array.isArray(students)) return [];
-
-    let result = students;
-
-    // Filter by cohort
-    if (selectedCohort !== "All") {
-      result = result.filter(r => {
-        const raw = r?.COHORT;
-        if (!raw) return false;
-        const d = new Date(raw);
-        const y = Number.isFinite(d.getTime()) ? d.getFullYear() : Number(raw);
-        return String(y) === selectedCohort;
-      });
-    }
-
-    // Filter by status
-    if (selectedStatus !== "All") {
-      result = result.filter(r => r?.STUDENT_STATUS === selectedStatus);
-    }
-
-    return result;
-  }, [students, selectedCohort, selectedStatus]);
-
-  // React.useEffect(() => {
-  //   if (data.length) setStudents(data);
-  // }, [data]);
-
-  // Filter by search query
-  const searchFiltered = React.useMemo(() => {
-    if (!debouncedQuery) return filtered;
-    return filtered.filter((student) => {
-      const name = String(student?.STUDENT_NAME || "").toLowerCase();
-      const matric = String(student?.MATRIC_NO || "").toLowerCase();
-      return name.includes(debouncedQuery) || matric.includes(debouncedQuery);
-    });
-  }, [filtered, debouncedQuery]);
+  // Status filter options come from the admin-managed status list (the page holds only loaded rows)
+  const statuses = studentStatuses;
 
   // Highlight search matches
   const highlight = React.useCallback((text) => {
@@ -186,10 +188,11 @@ export default function StudentsPage() {
     saveFiltersToStorage(selectedCohort, selectedStatus);
   }, [selectedCohort, selectedStatus]);
 
-  if (loading) return <p>Loading...</p>;
-  if (error) return <p style={{ color: "red" }}>Error: {error}</p>;
-  if (students === null) return <p>Loading...</p> // Still loading
-  if (!students.length) return <p>No data found</p>; // Actually empty
+  // Full-page states only before the first page; later reloads keep the toolbar (and search focus)
+  if (students === null) {
+    if (error) return <p style={{ color: "red" }}>Error: {error}</p>;
+    return <p>Loading...</p>;
+  }
   // //if (!data.length) return <p>No data found.</p>;
 
   // Mapping: DB column name -> Display name
@@ -285,6 +288,7 @@ export default function StudentsPage() {
 
       // Update state
       setStudents((prev) => prev.filter((s) => s.STUDENT_ID !== studentId));
+      setTotal((prev) => Math.max(prev - 1, 0));
     } catch (err) {
       console.error("Delete failed:", err);
       alert("Failed to delete student");
@@ -600,7 +604,14 @@ return (
                 </tr>
               </thead>
               <tbody>
-                {searchFiltered.map((student) => (
+                {students.length === 0 && (
+                  <tr>
+                    <td colSpan={visibleColumns.length + 1} style={{ textAlign: "center", padding: 16 }}>
+                      {loading ? "Loading..." : "No data found"}
+                    </td>
+                  </tr>
+                )}
+                {students.map((student) => (
                   <StudentRow
                     key={student.STUDENT_ID}
                     student={student}
@@ -617,9 +628,26 @@ return (
           </div>
 
           {/* Filter Summary - Moved to bottom right after table */}
-          <div style={{ display: "flex", justifyContent: "flex-end", marginTop: 8 }}>
+          <div style={{ display: "flex", justifyContent: "flex-end", alignItems: "center", gap: 12, marginTop: 8 }}>
+            {error && <span style={{ color: "red", fontSize: "14px" }}>Error: {error}</span>}
+            {nextPageToken && (
+              <button
+                onClick={loadMore}
+                disabled={loadingMore || loading}
+                style={{
+                  padding: "4px 12px",
+                  borderRadius: "4px",
+                  border: "1px solid #ddd",
+                  background: "white",
+                  cursor: "pointer",
+                  fontSize: "13px",
+                }}
+              >
+                {loadingMore ? "Loading…" : "Load more"}
+              </button>
+            )}
             <span style={{ color: "#666", fontSize: "14px" }}>
-              Showing {searchFiltered.length} of {students.length} students
+              Showing {students.length} of {total} students
             </span>
           </div>
         </div>
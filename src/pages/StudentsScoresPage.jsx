@@ -1,23 +1,129 @@
 import React from "react";
-import { useLocation } from "react-router-dom";
 import Sidebar from "../components/Sidebar";
-import useStudentsData from "../components/Students";
 import useCohorts from "../components/useCohorts";
 import StudentScoresRow from "../components/StudentScoresRow";
-import api from "../services/api";
+import api, { waitForImportJob } from "../services/api";
 import "../App.css";
 
+const PAGE_SIZE = 100;
+
+// MATRIC_NO as the DB compares it (case-insensitive, trailing blanks ignored)
+const matricKey = (m) => String(m ?? "").trimEnd().toUpperCase();
+
+const cohortYear = (raw) => {
+  if (!raw) return "-";
+  const d = new Date(raw);
+  const y = Number.isFinite(d.getTime()) ? d.getFullYear() : Number(raw);
+  return Number.isFinite(y) ? String(y) : "-";
+};
+
 export default function StudentsScoresPage() {
-  const location = useLocation();
-  const { data, loading, error, setData } = useStudentsData();
+  const { cohorts, loadingCohorts, errorCohorts } = useCohorts();
+
+  // One row per student: {MATRIC_NO, STUDENT_NAME, COHORT, SEM, CU_ID, courses: {code: [a1, a2, a3]}},
+  // loaded in keyset pages from /api/students-scores (cohort and name search filtered on the server)
+  const [rows, setRows] = React.useState([]);
+  const [total, setTotal] = React.useState(0);
+  const [nextPageToken, setNextPageToken] = React.useState(null);
+  // STUDENT_SCORE change version of the loaded scores (for /students-scores/changes)
+  const [version, setVersion] = React.useState(null);
+  const [loading, setLoading] = React.useState(true);
+  const [loadingMore, setLoadingMore] = React.useState(false);
+  const [error, setError] = React.useState(null);
+
+  // Controlled UI state
+  const [selectedCohort, setSelectedCohort] = React.useState("");
+  React.useEffect(() => {
+    if (!selectedCohort && cohorts.length) setSelectedCohort(cohorts[0]);
+  }, [cohorts, selectedCohort]);
+
+  const [query, setQuery] = React.useState("");
+  const [debouncedQuery, setDebouncedQuery] = React.useState("");
+  React.useEffect(() => {
+    const id = setTimeout(() => setDebouncedQuery(query.trim().toLowerCase()), 180);
+    return () => clearTimeout(id);
+  }, [query]);
+
+  const pageParams = React.useMemo(() => {
+    const params = { limit: PAGE_SIZE };
+    if (selectedCohort) params.cohort_year = selectedCohort;
+    if (debouncedQuery) params.q = debouncedQuery;
+    return params;
+  }, [selectedCohort, debouncedQuery]);
+
+  // Responses for an older filter are dropped
+  const requestId = React.useRef(0);
+
+  const reloadScores = React.useCallback(async () => {
+    const id = ++requestId.current;
+    setLoading(true);
+    setError(null);
+    try {
+      const { data: page } = await api.get('/students-scores', { params: pageParams });
+      if (id !== requestId.current) return;
+      setRows(page.items);
+      setTotal(page.total);
+      setNextPageToken(page.next_page_token);
+      setVersion(page.version);
+    } catch (err) {
+      if (id !== requestId.current) return;
+      setError(err.message);
+    } finally {
+      if (id === requestId.current) setLoading(false);
+    }
+  }, [pageParams]);
+
+  // Wait for the cohort list so the first request already has the default cohort
+  React.useEffect(() => {
+    if (loadingCohorts || (!selectedCohort && cohorts.length)) return;
+    reloadScores();
+  }, [reloadScores, loadingCohorts, selectedCohort, cohorts]);
+
+  const loadMore = async () => {
+    if (!nextPageToken || loadingMore) return;
+    const id = requestId.current;
+    setLoadingMore(true);
+    try {
+      const { data: page } = await api.get('/students-scores', {
+        params: { ...pageParams, page_token: nextPageToken },
+      });
+      if (id !== requestId.current) return;
+      setRows((prev) => [...prev, ...page.items]);
+      setNextPageToken(page.next_page_token);
+    } catch (err) {
+      console.error("Failed to load more students:", err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // Pull only the score rows written/deleted since the loaded version and patch the loaded students
+  const applyScoreChanges = async () => {
+    if (version === null) return reloadScores();
+    const { data: feed } = await api.get('/students-scores/changes', { params: { since: version } });
+    if (feed.reset) return reloadScores();
+    if (feed.changed.length || feed.deleted.length) {
+      setRows((prev) => {
+        const byMatric = new Map(prev.map((r) => [matricKey(r.MATRIC_NO), { ...r, courses: { ...r.courses } }]));
+        for (const d of feed.deleted) {
+          const r = byMatric.get(matricKey(d.MATRIC_NO));
+          if (r) delete r.courses[d.COURSE_CODE];
+        }
+        // Students not loaded on this page are picked up when their page is loaded
+        for (const c of feed.changed) {
+          const r = byMatric.get(matricKey(c.MATRIC_NO));
+          if (r) r.courses[c.COURSE_CODE] = [c.ATTEMPT_1 ?? null, c.ATTEMPT_2 ?? null, c.ATTEMPT_3 ?? null];
+        }
+        return prev.map((r) => byMatric.get(matricKey(r.MATRIC_NO)));
+      });
+    }
+    setVersion(feed.version);
+  };
 
   const handleUpdateScores = async (updatedRec) => {
     try {
       await api.put('/students-scores', updatedRec);
-      
-      // Refetch data on success
-      const response = await api.get('/students-scores');
-      setData(response.data);
+      await applyScoreChanges();
 
     } catch (err) {
       // The 401 error will be handled by the interceptor.
@@ -28,56 +134,10 @@ export default function StudentsScoresPage() {
       }
     }
   };
-  const { cohorts, loadingCohorts, errorCohorts } = useCohorts();
   const [uploadOpen, setUploadOpen] = React.useState(false);
   const [selectedFile, setSelectedFile] = React.useState(null);
   const [uploadError, setUploadError] = React.useState("");
 
-
-  // Normalize API data to an array to keep iterables safe for memos
-  const safeData = Array.isArray(data) ? data : [];
-
-  // Track route transitions so we can avoid showing empty-state mid-transition
-  const [isTransitioning, setIsTransitioning] = React.useState(false);
-  const lastPathRef = React.useRef(location.pathname);
-
-  // Start a transition when the pathname changes
-  React.useEffect(() => {
-    if (location.pathname !== lastPathRef.current) {
-      lastPathRef.current = location.pathname;
-      setIsTransitioning(true);
-    }
-  }, [location.pathname]);
-
-  // End transition when the fetch settles (loading flips to false)
-  React.useEffect(() => {
-    if (!loading) setIsTransitioning(false);
-  }, [loading]);
-
-  // Cache the last non-empty dataset to display during transitions
-  const prevNonEmptyRef = React.useRef([]);
-  React.useEffect(() => {
-    if (safeData.length > 0) prevNonEmptyRef.current = safeData;
-  }, [safeData]);
-
-  // UI-facing data: keep previous non-empty while transitioning, else current
-  const scores = isTransitioning && prevNonEmptyRef.current.length
-    ? prevNonEmptyRef.current
-    : safeData;
-
-  // Controlled UI state
-  const [selectedCohort, setSelectedCohort] = React.useState("");
-  React.useEffect(() => {
-    if (!selectedCohort && cohorts.length) setSelectedCohort(cohorts[0]);
-  }, [cohorts, selectedCohort]);
-
-  const [query, setQuery] = React.useState("");
-  const [debouncedQuery, setDebouncedQuery] = React.useState("");
-  React.useEffect(() => {
-    const id = setTimeout(() => setDebouncedQuery(query.trim().toLowerCase()), 180);
-    return () => clearTimeout(id);
-  }, [query]);
-
   // Column visibility controls
   const HIDABLE_META = [
     { key: "COHORT", label: "Cohort" },
@@ -107,108 +167,48 @@ export default function StudentsScoresPage() {
     });
   };
 
-  // 1) Filter by cohort
-  // Derived data with safe iterables
-  const filteredScores = React.useMemo(() => {
-    const base = scores; // always an array
-    if (!selectedCohort) return base;
-    return base.filter((r) => {
-      const raw = r?.COHORT;
-      if (!raw) return false;
-      const d = new Date(raw);
-      const y = Number.isFinite(d.getTime()) ? d.getFullYear() : Number(raw);
-      return String(y) === selectedCohort;
-    });
-  }, [scores, selectedCohort]);
-
-  // 2) Build metadata
-  const metaByMatric = React.useMemo(() => {
-    const m = new Map();
-    for (const r of filteredScores) {
-      if (!r) continue;
-      const key = String(r.MATRIC_NO ?? "-");
-      if (!m.has(key)) {
-        m.set(key, {
-          MATRIC_NO: key,
-          STUDENT_NAME: r.STUDENT_NAME ?? "-",
-          COHORT: (() => {
-            const raw = r.COHORT;
-            if (!raw) return "-";
-            const d = new Date(raw);
-            const y = Number.isFinite(d.getTime()) ? d.getFullYear() : Number(raw);
-            return Number.isFinite(y) ? String(y) : "-";
-          })(),
-          SEM: r.SEM ?? "-",
-          CU_ID: r.CU_ID ?? "-",
-        });
-      }
-    }
-    return m;
-  }, [filteredScores]);
-
-  const nameIndex = React.useMemo(() => {
-    const idx = new Map();
-    for (const [matric, meta] of metaByMatric.entries()) {
-      idx.set(matric, String(meta?.STUDENT_NAME ?? "").toLowerCase());
-    }
-    return idx;
-  }, [metaByMatric]);
+  // 1) Rows in the shape StudentScoresRow expects, in server order (trimmed name, then MATRIC_NO)
+  const pivoted = React.useMemo(() => rows.map((r) => ({
+    MATRIC_NO: r.MATRIC_NO,
+    meta: {
+      MATRIC_NO: r.MATRIC_NO,
+      STUDENT_NAME: r.STUDENT_NAME ?? "-",
+      COHORT: cohortYear(r.COHORT),
+      SEM: r.SEM ?? "-",
+      CU_ID: r.CU_ID ?? "-",
+    },
+    courses: r.courses,
+  })), [rows]);
+
+  const metaByMatric = React.useMemo(
+    () => new Map(pivoted.map((r) => [String(r.MATRIC_NO), r.meta])),
+    [pivoted]
+  );
 
-  // 3) Course codes
+  // 2) Course codes of the loaded students
   const courseCodes = React.useMemo(() => {
     const set = new Set();
-    for (const r of filteredScores) {
-      if (r && r.COURSE_CODE) set.add(String(r.COURSE_CODE));
+    for (const r of rows) {
+      for (const code of Object.keys(r.courses || {})) set.add(code);
     }
     return Array.from(set).sort((a, b) => a.localeCompare(b));
-  }, [filteredScores]);
-
-  // 4) Pivot attempts and sort by student name
-  const pivoted = React.useMemo(() => {
-    const byMatric = {};
-    for (const r of filteredScores) {
-      if (!r) continue;
-      const m = String(r.MATRIC_NO ?? "-");
-      const c = String(r.COURSE_CODE ?? "");
-      if (!byMatric[m]) byMatric[m] = {};
-      byMatric[m][c] = [r.ATTEMPT_1 ?? null, r.ATTEMPT_2 ?? null, r.ATTEMPT_3 ?? null];
-    }
-    const rows = Object.keys(byMatric).map((m) => ({
-      MATRIC_NO: m,
-      meta:
-        metaByMatric.get(m) ?? {
-          MATRIC_NO: m,
-          STUDENT_NAME: "-",
-          COHORT: "-",
-          SEM: "-",
-          CU_ID: "-",
-        },
-      courses: byMatric[m],
-    }));
-    return rows.sort((a, b) => {
-      const an = (a.meta.STUDENT_NAME ?? "").trim();
-      const bn = (b.meta.STUDENT_NAME ?? "").trim();
-      const cmp = an.localeCompare(bn, undefined, { sensitivity: "base" });
-      if (cmp !== 0) return cmp;
-      return String(a.MATRIC_NO).localeCompare(String(b.MATRIC_NO), undefined, { sensitivity: "base" });
-    });
-  }, [filteredScores, metaByMatric]);
+  }, [rows]);
 
-  // 6) Hide attempt 3 for courses that contain any 'N/A' attempt_3
+  // 3) Hide attempt 3 for courses that contain any 'N/A' attempt_3
   const hideAttempt3ByCourse = React.useMemo(() => {
     const m = new Map();
-    for (const r of filteredScores) {
-      if (!r || !r.COURSE_CODE) continue;
-      const code = String(r.COURSE_CODE);
-      const v3 = r.ATTEMPT_3;
-      if (typeof v3 === "string" && v3.trim().toUpperCase() === "N/A") {
-        m.set(code, true);
-      } else if (!m.has(code)) {
-        m.set(code, false);
+    for (const r of rows) {
+      for (const [code, attempts] of Object.entries(r.courses || {})) {
+        const v3 = attempts?.[2];
+        if (typeof v3 === "string" && v3.trim().toUpperCase() === "N/A") {
+          m.set(code, true);
+        } else if (!m.has(code)) {
+          m.set(code, false);
+        }
       }
     }
     return m;
-  }, [filteredScores]);
+  }, [rows]);
 
   // 5) Formatting helper
   const fmt = (v) => {
@@ -357,13 +357,8 @@ export default function StudentsScoresPage() {
     return <>{parts}</>;
   }, [debouncedQuery]);
 
-  const visibleRows = React.useMemo(() => {
-    if (!debouncedQuery) return pivoted;
-    return pivoted.filter((r) => {
-      const nm = nameIndex.get(r.MATRIC_NO) || "";
-      return nm.includes(debouncedQuery);
-    });
-  }, [pivoted, debouncedQuery, nameIndex]);
+  // Name search is applied by the server (q)
+  const visibleRows = pivoted;
 
   // Upload submit handler
   const handleUploadSubmit = async () => {
@@ -390,23 +385,23 @@ export default function StudentsScoresPage() {
         throw new Error(`Upload failed: ${res.status} ${text}`);
       }
       const json = await res.json();
-      console.log("Import result:", json);
+      // The marksheet is imported in the background; wait for the job before reloading
+      const job = json.job_id ? await waitForImportJob(json.job_id) : null;
+      console.log("Import result:", job ? job.result : json);
       setUploadOpen(false);
       setSelectedFile(null);
       setUploadError("");
-      // Trigger data reload
-      const response = await api.get('/students-scores');
-      setData(response.data);
+      // Pick up the imported scores
+      await applyScoreChanges();
     } catch (e) {
       setUploadError(e.message || "Upload failed");
     }
   };
 
 
-  // Early returns: suppress empty-state while transitioning/loading without prior data
-  if (error) return <p style={{ color: "red" }}>Error: {error}</p>;
-  if (loading && prevNonEmptyRef.current.length === 0) return <p>Loading...</p>;
-  if (!loading && scores.length === 0) return <p>No data found</p>;
+  // Early returns only before anything is loaded; filter changes keep the toolbar (and search focus)
+  if (error && rows.length === 0) return <p style={{ color: "red" }}>Error: {error}</p>;
+  if (loading && rows.length === 0 && !debouncedQuery) return <p>Loading...</p>;
 
   return (
     <div className="flex h-screen w-screen">
@@ -630,6 +625,30 @@ export default function StudentsScoresPage() {
                 </tbody>
               </table>
             </div>
+
+            <div style={{ display: "flex", justifyContent: "flex-end", alignItems: "center", gap: 12, marginTop: 8 }}>
+              {error && <span style={{ color: "red", fontSize: "14px" }}>Error: {error}</span>}
+              {!loading && rows.length === 0 && <span style={{ fontSize: "14px" }}>No data found</span>}
+              {nextPageToken && (
+                <button
+                  onClick={loadMore}
+                  disabled={loadingMore || loading}
+                  style={{
+                    padding: "4px 12px",
+                    borderRadius: "4px",
+                    border: "1px solid #ddd",
+                    background: "white",
+                    cursor: "pointer",
+                    fontSize: "13px",
+                  }}
+                >
+                  {loadingMore ? "Loading…" : "Load more"}
+                </button>
+              )}
+              <span style={{ color: "#666", fontSize: "14px" }}>
+                Showing {rows.length} of {total} students
+              </span>
+            </div>
           </div>
         </div>
       </div>
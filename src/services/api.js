@@ -100,4 +100,15 @@ api.interceptors.response.use(
   }
 );
 
+// Poll a background import job until it finishes; onUpdate receives each job snapshot
+export async function waitForImportJob(jobId, onUpdate, intervalMs = 1000) {
+  for (;;) {
+    const { data: job } = await api.get(`/import/jobs/${jobId}`);
+    if (onUpdate) onUpdate(job);
+    if (job.status === 'succeeded') return job;
+    if (job.status === 'failed') throw new Error(job.error || 'Import failed');
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+}
+
 export default api;
\ No newline at end of file
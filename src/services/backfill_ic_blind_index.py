@@ -0,0 +1,18 @@
+# src/services/backfill_ic_blind_index.py
+#
+# One-off job: populate STUDENTS.IC_NO_BIDX for rows imported before the blind index existed.
+#   python -m src.services.backfill_ic_blind_index [--recompute] [--batch-size N]
+
+import argparse, logging
+from src.services.data_processing import backfill_ic_blind_index
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill the IC_NO blind index column")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--recompute", action="store_true",
+                        help="rewrite every row, e.g. after changing IC_BLIND_INDEX_KEY")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    updated, undecryptable = backfill_ic_blind_index(batch_size=args.batch_size, recompute=args.recompute)
+    print(f"Backfill complete: {updated} rows indexed, {undecryptable} IC values could not be decrypted")
@@ -0,0 +1,197 @@
+# src/services/batch_scoring.py
+#
+# Batch scoring for the graduation model.
+# Scores every student of a status with the current model and stores the result in PREDICTIONS
+# (one row per student: probabilities, risk level, model version, hash of the features scored, SCORED_AT),
+# so the /api/predictions endpoints read a table instead of running the model per request.
+# Meant to run nightly, after the day's score imports, e.g. from cron:
+#
+#   0 2 * * *  cd /path/to/app && python -m src.services.batch_scoring
+#   python -m src.services.batch_scoring --matric A12345 B67890     (rescore just these students)
+
+import argparse, logging, time, uuid
+from datetime import datetime
+import pandas as pd
+from src.db.core import get_db_connection
+from src.db.schema import require_predictions_table
+from src.services import graduation_prediction
+from src.services.feature_engine import FEATURE_COLUMNS
+from src.services.import_state import row_fingerprints
+from src.services.student_features import refresh_student_features
+
+logger = logging.getLogger(__name__)
+
+INSERT_PREDICTION_SQL = """
+INSERT INTO PREDICTIONS (MATRIC_NO, PROB_ON_TIME, PROB_LATE, PREDICTION, PREDICTION_LABEL, RISK_LEVEL,
+                         MODEL_VERSION, FEATURE_HASH, SCORED_AT, BATCH_ID)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# A full run replaces the rows of every student with this status, and drops rows of students
+# that no longer exist; rows of students with another status are left alone
+CLEAR_STATUS_SQL = """
+DELETE p FROM PREDICTIONS p
+WHERE NOT EXISTS (SELECT 1 FROM STUDENTS s WHERE s.MATRIC_NO = p.MATRIC_NO AND s.STUDENT_STATUS <> ?)
+"""
+
+# Stored predictions with the same columns predict_graduation() returns. Academic figures come from
+# STUDENT_FEATURES as of now; the prediction is as of SCORED_AT. Students without a stored row come
+# back with NULL prediction columns unless filtered out.
+STORED_PREDICTIONS_SQL = f"""
+SELECT
+    s.MATRIC_NO,
+    s.STUDENT_NAME,
+    s.COHORT,
+    s.STUDENT_STATUS,
+    {', '.join('f.' + c for c in FEATURE_COLUMNS)},
+    p.PROB_ON_TIME AS prob_on_time,
+    p.PROB_LATE AS prob_late,
+    p.PREDICTION AS prediction,
+    p.PREDICTION_LABEL AS prediction_label,
+    p.RISK_LEVEL AS risk_level,
+    p.MODEL_VERSION AS model_version,
+    p.FEATURE_HASH AS feature_hash,
+    p.SCORED_AT AS scored_at
+FROM STUDENTS s
+INNER JOIN STUDENT_FEATURES f ON f.MATRIC_NO = s.MATRIC_NO
+LEFT JOIN PREDICTIONS p ON p.MATRIC_NO = s.MATRIC_NO
+WHERE s.STUDENT_STATUS = ?
+"""
+
+
+def feature_hashes(df):
+    """FEATURE_HASH of each row: fingerprint of the values the model scores"""
+    return row_fingerprints(df[graduation_prediction.feature_cols])
+
+
+def stale_predictions(df):
+    """
+    Boolean Series over stored predictions: True where the row no longer matches the student's
+    current features or the loaded model (or there is no stored prediction at all)
+    """
+    graduation_prediction.reload_model_if_changed()
+    if df.empty or graduation_prediction.feature_cols is None:
+        return df['prob_on_time'].isna()
+    current = pd.Series(feature_hashes(df), index=df.index)
+    return (df['prob_on_time'].isna()
+            | (current != df['feature_hash'].astype(str).str.strip())
+            | (df['model_version'] != graduation_prediction.model_label))
+
+
+def _prediction_rows(df, scored_at, batch_id):
+    hashes = feature_hashes(df)
+    risk = df['risk_level'].astype(object).where(df['risk_level'].notna(), None)
+    return [
+        (matric_no, float(p_on_time), float(p_late), int(pred), label, risk_level,
+         graduation_prediction.model_label, feature_hash, scored_at, batch_id)
+        for matric_no, p_on_time, p_late, pred, label, risk_level, feature_hash in zip(
+            df['MATRIC_NO'], df['prob_on_time'], df['prob_late'], df['prediction'],
+            df['prediction_label'], risk, hashes)
+    ]
+
+
+def score_students(matric_no=None, student_status='Active'):
+    """
+    Score students with the current model and persist the results to PREDICTIONS.
+
+    Args:
+        matric_no: Optional. If provided, rescore only this student (their stored row is replaced).
+        student_status: 'Active' (default) or 'Graduate'
+
+    Returns:
+        dict: {students, model_version, batch_id, scored_at, seconds}, or None if the model is not
+        loaded or nothing was scored (no such students, or prediction failed)
+    """
+    require_predictions_table()
+    graduation_prediction.reload_model_if_changed()
+    if graduation_prediction.model is None or graduation_prediction.feature_cols is None:
+        logger.error("Model not loaded. Cannot score students.")
+        return None
+
+    start = time.perf_counter()
+    df = graduation_prediction._predict(matric_no, student_status)
+    if df is None:
+        # No such students or the model failed; keep the stored rows rather than wipe them
+        return None
+    scored_at = datetime.now()
+    batch_id = uuid.uuid4().hex
+    rows = _prediction_rows(df, scored_at, batch_id)
+
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        if matric_no:
+            cur.execute("DELETE FROM PREDICTIONS WHERE MATRIC_NO = ?", (matric_no,))
+        else:
+            cur.execute(CLEAR_STATUS_SQL, (student_status,))
+        cur.fast_executemany = True
+        cur.executemany(INSERT_PREDICTION_SQL, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    seconds = time.perf_counter() - start
+    logger.info(f"Stored predictions for {len(rows)} {student_status} students "
+                f"with model {graduation_prediction.model_label} ({seconds:.2f}s)")
+    return {
+        "students": len(rows),
+        "model_version": graduation_prediction.model_label,
+        "batch_id": batch_id,
+        "scored_at": scored_at,
+        "seconds": seconds,
+    }
+
+
+def load_stored_predictions(student_status='Active', matric_no=None, include_unscored=False, matric_nos=None):
+    """
+    Stored predictions for students with this status (or just matric_no, or up to
+    MAX_BATCH_STUDENTS matric_nos), ordered by MATRIC_NO.
+    STUDENT_FEATURES is refreshed first, so the academic figures and stale_predictions() are current.
+
+    Args:
+        include_unscored: Also return students with features but no stored prediction (NULL prediction columns)
+
+    Returns:
+        DataFrame in the predict_graduation() layout plus model_version, feature_hash and scored_at;
+        empty when nothing has been scored yet
+    """
+    require_predictions_table()
+    refresh_student_features()
+    query = STORED_PREDICTIONS_SQL
+    params = [student_status]
+    if not include_unscored:
+        query += " AND p.MATRIC_NO IS NOT NULL"
+    if matric_no:
+        query += " AND s.MATRIC_NO = ?"
+        params.append(matric_no)
+    if matric_nos is not None:
+        if not 0 < len(matric_nos) <= graduation_prediction.MAX_BATCH_STUDENTS:
+            raise ValueError(f"matric_nos must have 1 to {graduation_prediction.MAX_BATCH_STUDENTS} entries")
+        query += f" AND s.MATRIC_NO IN ({', '.join('?' * len(matric_nos))})"
+        params.extend(matric_nos)
+    query += " ORDER BY s.MATRIC_NO"
+
+    conn = get_db_connection()
+    try:
+        df = pd.read_sql(query, conn, params=params)
+    finally:
+        conn.close()
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score students with the graduation model and store the predictions")
+    parser.add_argument("--status", default="Active", help="STUDENT_STATUS to score (default: Active)")
+    parser.add_argument("--matric", nargs="+", help="rescore only these students")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    for target in (args.matric or [None]):
+        result = score_students(target, args.status)
+        if result is None:
+            raise SystemExit(f"Nothing scored for {target or args.status + ' students'} (see log)")
+        print(f"Scored {result['students']} students with {result['model_version']} "
+              f"(batch {result['batch_id']}) in {result['seconds']:.2f}s")
@@ -0,0 +1,171 @@
+# src/services/cohort_scores.py
+#
+# Backing query for /api/students-scores-by-cohort.
+# The cohort x applicable-course list is materialized in COHORT_APPLICABLE_COURSES (one slice per
+# cohort year, rebuilt when COURSE_STRUCTURE's fingerprint changes) and whole responses are cached
+# per year until a score, student or course-structure write changes their validation key.
+
+import logging, threading
+from src.db.core import get_db_connection
+from src.db.schema import require_cohort_course_matrix, require_score_change_tracking
+from src.services.db_helpers import SCORES_STAMP_SQL
+
+# Includes every column the version windows and the response read
+STRUCTURE_FINGERPRINT_SQL = """
+SELECT COUNT_BIG(*), CHECKSUM_AGG(CHECKSUM(COURSE_CODE, MODULE, COURSE_CLASSIFICATION, COURSE_LEVEL,
+                                           COURSE_STATUS, COURSE_PRIORITY, COURSE_VERSION))
+FROM COURSE_STRUCTURE
+"""
+
+# Same version-window rule as the original per-request CTE: a course applies to a cohort if
+# 1 Jan of the cohort year falls in [COURSE_VERSION, next COURSE_VERSION of that code)
+REFRESH_COHORT_COURSES_SQL = """
+SET NOCOUNT ON;
+DECLARE @cohortYear INT = ?;
+DECLARE @cohortDate DATE = DATEFROMPARTS(@cohortYear, 1, 1);
+
+DELETE FROM COHORT_APPLICABLE_COURSES WHERE COHORT_YEAR = @cohortYear;
+
+WITH CleanStructure AS (
+  SELECT DISTINCT
+    LTRIM(RTRIM(cs.COURSE_CODE)) AS COURSE_CODE,
+    cs.MODULE,
+    cs.COURSE_CLASSIFICATION,
+    cs.COURSE_LEVEL,
+    cs.COURSE_STATUS,
+    cs.COURSE_PRIORITY,
+    cs.COURSE_VERSION
+  FROM COURSE_STRUCTURE cs
+  WHERE cs.COURSE_VERSION IS NOT NULL AND cs.COURSE_CODE IS NOT NULL
+),
+VersionWindows AS (
+  SELECT
+    c.*,
+    LEAD(c.COURSE_VERSION) OVER (PARTITION BY c.COURSE_CODE ORDER BY c.COURSE_VERSION) AS next_version_start
+  FROM CleanStructure c
+)
+INSERT INTO COHORT_APPLICABLE_COURSES (
+  COHORT_YEAR, COURSE_CODE, MODULE, COURSE_CLASSIFICATION, COURSE_LEVEL, COURSE_STATUS, COURSE_PRIORITY
+)
+SELECT @cohortYear, vw.COURSE_CODE, vw.MODULE, vw.COURSE_CLASSIFICATION,
+       vw.COURSE_LEVEL, vw.COURSE_STATUS, vw.COURSE_PRIORITY
+FROM VersionWindows vw
+WHERE @cohortDate >= vw.COURSE_VERSION
+  AND @cohortDate < COALESCE(vw.next_version_start, '9999-12-31');
+
+MERGE COHORT_APPLICABLE_COURSES_STATE AS t
+USING (SELECT @cohortYear AS COHORT_YEAR, ? AS STRUCTURE_FINGERPRINT) AS s
+ON t.COHORT_YEAR = s.COHORT_YEAR
+WHEN MATCHED THEN UPDATE SET STRUCTURE_FINGERPRINT = s.STRUCTURE_FINGERPRINT, REFRESHED_AT = GETDATE()
+WHEN NOT MATCHED THEN INSERT (COHORT_YEAR, STRUCTURE_FINGERPRINT) VALUES (s.COHORT_YEAR, s.STRUCTURE_FINGERPRINT);
+"""
+
+# COHORT range instead of YEAR(COHORT) so an index on COHORT can seek
+COHORT_SCORES_SQL = """
+SELECT
+  st.STUDENT_NAME,
+  CAST(? AS INT) AS REQUEST_YEAR,
+  YEAR(st.COHORT) AS COHORT,
+  st.SEM,
+  st.CU_ID,
+  ac.COURSE_CODE,
+  sc.SCORE_ID,
+  st.MATRIC_NO,
+  sc.ATTEMPT_1,
+  sc.ATTEMPT_2,
+  sc.ATTEMPT_3
+FROM STUDENTS st
+JOIN COHORT_APPLICABLE_COURSES ac
+  ON ac.COHORT_YEAR = ?
+LEFT JOIN STUDENT_SCORE sc
+  ON sc.MATRIC_NO = st.MATRIC_NO
+ AND sc.COURSE_CODE_KEY = ac.COURSE_CODE
+WHERE st.COHORT >= DATEFROMPARTS(?, 1, 1)
+  AND st.COHORT < DATEFROMPARTS(? + 1, 1, 1)
+ORDER BY st.STUDENT_NAME, ac.COURSE_CODE;
+"""
+
+# Cheap checks that together decide whether a cached response is still current. Scores are keyed on
+# SCORES_STAMP_SQL rather than MIN_ACTIVE_ROWVERSION() alone, which stands still for as long as any
+# transaction is open and would keep serving the old rows past edits committed meanwhile.
+CACHE_KEY_SQL = f"""
+SELECT
+  v.MIN_ACTIVE, v.COMMITTED_ABOVE, v.COMMITTED_CHECKSUM,
+  (SELECT COUNT_BIG(*) FROM STUDENTS WHERE COHORT >= DATEFROMPARTS(?, 1, 1) AND COHORT < DATEFROMPARTS(? + 1, 1, 1)),
+  (SELECT CHECKSUM_AGG(CHECKSUM(MATRIC_NO, STUDENT_NAME, SEM, CU_ID)) FROM STUDENTS
+    WHERE COHORT >= DATEFROMPARTS(?, 1, 1) AND COHORT < DATEFROMPARTS(? + 1, 1, 1))
+FROM ({SCORES_STAMP_SQL}) AS v
+"""
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def structure_fingerprint(cursor):
+    cursor.execute(STRUCTURE_FINGERPRINT_SQL)
+    count, checksum = cursor.fetchone()
+    return f"{count}:{checksum}"
+
+
+def refresh_cohort_courses(conn, year, fingerprint):
+    """
+    Rebuild the COHORT_APPLICABLE_COURSES slice for one cohort year if it was built from a different
+    COURSE_STRUCTURE. An app lock serializes concurrent refreshes (also across server processes).
+    Returns True if the slice was rebuilt.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT STRUCTURE_FINGERPRINT FROM COHORT_APPLICABLE_COURSES_STATE WHERE COHORT_YEAR = ?", (year,))
+        row = cur.fetchone()
+        if row and row[0] == fingerprint:
+            return False
+        try:
+            cur.execute("EXEC sp_getapplock @Resource = 'COHORT_APPLICABLE_COURSES', "
+                        "@LockMode = 'Exclusive', @LockOwner = 'Transaction', @LockTimeout = 30000")
+            # Re-check under the lock: another request may have just rebuilt it
+            cur.execute("SELECT STRUCTURE_FINGERPRINT FROM COHORT_APPLICABLE_COURSES_STATE WHERE COHORT_YEAR = ?", (year,))
+            row = cur.fetchone()
+            if row and row[0] == fingerprint:
+                conn.commit()
+                return False
+            cur.execute(REFRESH_COHORT_COURSES_SQL, (year, fingerprint))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    logging.info("Rebuilt applicable courses for cohort %s", year)
+    return True
+
+
+def get_cohort_scores(year):
+    """
+    Rows for /api/students-scores-by-cohort: every student of the cohort year x every course that
+    applies to that cohort, with the student's attempts (NULL if no score row).
+    Served from the per-year cache while scores, the cohort's students and COURSE_STRUCTURE are unchanged.
+    """
+    require_score_change_tracking()
+    require_cohort_course_matrix()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            fingerprint = structure_fingerprint(cur)
+            cur.execute(CACHE_KEY_SQL, (year, year, year, year))
+            *stamp, student_count, student_checksum = cur.fetchone()
+        cache_key = (fingerprint, tuple(int(v) for v in stamp), int(student_count), student_checksum)
+
+        with _cache_lock:
+            cached = _cache.get(year)
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
+
+        refresh_cohort_courses(conn, year, fingerprint)
+        with conn.cursor() as cur:
+            cur.execute(COHORT_SCORES_SQL, (year, year, year, year))
+            cols = [c[0] for c in cur.description]
+            rows = [dict(zip(cols, r)) for r in cur.fetchall()]
+    finally:
+        conn.close()
+
+    with _cache_lock:
+        _cache[year] = (cache_key, rows)
+    return rows
+
@@ -2,12 +2,17 @@
 # CSV_FOLDER = "csv files"
 # os.makedirs(CSV_FOLDER, exist_ok=True)  # Create if doesn't exist
 
-import datetime, logging, os, pyodbc, re, warnings
+import base64, datetime, hashlib, hmac, logging, os, pyodbc, re, warnings
 from cryptography.fernet import Fernet
 from datetime import date,datetime
 from src.db.core import get_db_connection
-from src.services.db_helpers import get_year_1_course_codes
+from src.db.schema import require_ic_blind_index, require_score_change_tracking, require_student_change_tracking
+from src.services import ic_crypto
+from src.services.import_state import changed_rows, file_sha256, load_import_state, save_import_state, state_lock
+from src.services.db_helpers import get_course_code_resolver, get_year_1_course_codes, invalidate_course_code_resolver
 from dotenv import load_dotenv
+import numpy as np
+import openpyxl
 import pandas as pd
 
 # I've disabled the warnings when trying to parse through the marksheet, just comment it out if you wish to see the warnings in terminal
@@ -27,6 +32,16 @@ if not key:
 
 cipher = Fernet(key.encode())
 
+# Separate key for the IC blind index (deterministic HMAC, so equal ICs can be found with one indexed query)
+bidx_key = os.getenv("IC_BLIND_INDEX_KEY")
+
+if not bidx_key:
+    bidx_key = base64.urlsafe_b64encode(os.urandom(32)).decode()
+
+    with open(".env", "a") as f:
+        f.write(f"\nIC_BLIND_INDEX_KEY = {bidx_key}")
+    print("New IC blind index key generated, saving to .env file...")
+
 COURSE_SHEET_RE = re.compile(r"^([A-Za-z0-9][A-Za-z0-9\-_]{2,})\s*-\s*BCSCU$", re.IGNORECASE)
 
 def encrypt_ic(plain_ic: str) -> str:
@@ -35,7 +50,30 @@ def encrypt_ic(plain_ic: str) -> str:
 def decrypt_ic(encrypted_ic: str) -> str:
     return cipher.decrypt(encrypted_ic.encode()).decode()
 
-def process_student_datasheet(file_path, sheet_info, output_folder):
+def normalize_ic(plain_ic) -> str:
+    """IC number as compared for lookups: no spaces/dashes, upper case"""
+    return re.sub(r"[\s\-]", "", str(plain_ic)).upper()
+
+def ic_blind_index(plain_ic) -> str | None:
+    """Keyed HMAC-SHA256 (hex) of the normalized IC; stored in STUDENTS.IC_NO_BIDX next to the ciphertext"""
+    if plain_ic is None or not normalize_ic(plain_ic):
+        return None
+    return hmac.new(bidx_key.encode(), normalize_ic(plain_ic).encode(), hashlib.sha256).hexdigest()
+
+def encrypt_ic_batch(plain_ics, parallel=None):
+    """Encrypt a list of IC numbers (None stays None); large lists fan out over a process pool"""
+    return ic_crypto.encrypt_batch(plain_ics, key.encode(), parallel=parallel)
+
+def decrypt_ic_batch(encrypted_ics, parallel=None):
+    """Decrypt a list of IC_NO tokens; empty or undecryptable values come back as None"""
+    return ic_crypto.decrypt_batch(encrypted_ics, key.encode(), parallel=parallel)
+
+def parse_student_datasheet(file_path, sheet_info):
+    """
+    Parse an Active/Graduate/Withdraw datasheet into (student_df, score_df).
+    score_df keeps the Excel sub-header as its first row, same as the exported score CSV.
+    Returns None (or False for missing required columns) if the sheet cannot be processed.
+    """
     sheet_name = sheet_info['name']
 
     def col_letter_to_index(col):
@@ -119,10 +157,6 @@ def process_student_datasheet(file_path, sheet_info, output_folder):
         for col in student_df.select_dtypes(include=['object']).columns:
             student_df[col] = student_df[col].apply(lambda x: x.strip() if isinstance(x, str) else x)
 
-        student_file = os.path.join(output_folder, f"{sheet_name}_Student.csv")
-        student_df.to_csv(student_file, index=False, encoding='utf-8-sig')
-        print(f"\n✅ Saved {len(student_df)} student records to {student_file}")
-
         # -------------------------------
         # Student Score
         # Rule: student info goes up to col M; scores start from N and continue
@@ -223,25 +257,38 @@ def process_student_datasheet(file_path, sheet_info, output_folder):
             for c in target_cols:
                 score_df.loc[empty_mask[c], c] = "-"
 
-        # -------------------------------
-        # Save
-        # -------------------------------
         # Strip spaces from all string columns in score_df
         for col in score_df.select_dtypes(include=['object']).columns:
             score_df[col] = score_df[col].apply(lambda x: x.strip() if isinstance(x, str) else x)
 
-        score_file = os.path.join(output_folder, f"{sheet_name}_Student_Score.csv")
-        score_df.to_csv(score_file, index=False, encoding='utf-8-sig')
-        print(f"✅ Saved {len(score_df)} score records to {score_file}")
-        print("\nScore file structure:")
-        print(score_df.head(1).to_string(index=False))
-
-        return [student_file, score_file]
+        return student_df, score_df
 
     except Exception as e:
         print(f"\n❌ Error processing {sheet_name} sheet: {str(e)}")
         return None
 
+def write_student_datasheet_csvs(student_df, score_df, sheet_name, output_folder):
+    """Write the parsed frames as {sheet}_Student.csv and {sheet}_Student_Score.csv; returns both paths"""
+    student_file = os.path.join(output_folder, f"{sheet_name}_Student.csv")
+    student_df.to_csv(student_file, index=False, encoding='utf-8-sig')
+    print(f"\n✅ Saved {len(student_df)} student records to {student_file}")
+
+    score_file = os.path.join(output_folder, f"{sheet_name}_Student_Score.csv")
+    score_df.to_csv(score_file, index=False, encoding='utf-8-sig')
+    print(f"✅ Saved {len(score_df)} score records to {score_file}")
+    print("\nScore file structure:")
+    print(score_df.head(1).to_string(index=False))
+
+    return [student_file, score_file]
+
+def process_student_datasheet(file_path, sheet_info, output_folder):
+    """Parse a student datasheet and export it as two CSVs (Student + Student_Score)"""
+    parsed = parse_student_datasheet(file_path, sheet_info)
+    if not parsed:
+        return parsed
+    student_df, score_df = parsed
+    return write_student_datasheet_csvs(student_df, score_df, sheet_info['name'], output_folder)
+
 def process_course_str(file_path, sheet_info, output_folder, is_legacy=False):
     """Process the Course-Str sheet and export course structure data."""
     print("\n[DEBUG] Starting process_course_str.")
@@ -366,42 +413,9 @@ def resolve_course_code(conn, short_code: str) -> str | None:
       2) Startswith / endswith match
       3) Contains match
     Returns a single COURSE_CODE or None if ambiguous/not found.
+    Backed by the cached CourseCodeResolver; bulk callers should fetch the resolver once instead.
     """
-    sc = short_code.upper().strip()
-
-    q_exact = "SELECT DISTINCT COURSE_CODE FROM COURSE_STRUCTURE WHERE UPPER(COURSE_CODE) = ?"
-    q_sw = "SELECT DISTINCT COURSE_CODE FROM COURSE_STRUCTURE WHERE UPPER(COURSE_CODE) LIKE ?"
-    with conn.cursor() as cur:
-        # 1) exact
-        cur.execute(q_exact, (sc,))
-        rows = [r[0] for r in cur.fetchall()]
-        if len(rows) == 1:
-            return rows[0]
-
-        # 2) startswith / endswith
-        # startswith: INT120CT; endswith: 120CTXYZ
-        candidates = set()
-        cur.execute(q_sw, (sc + '%',))
-        candidates.update(r[0] for r in cur.fetchall())
-        cur.execute(q_sw, ('%' + sc,))
-        candidates.update(r[0] for r in cur.fetchall())
-        if len(candidates) == 1:
-            return next(iter(candidates))
-        if len(candidates) > 1:
-            # Prefer ones that look like a prefix before the code (e.g., INT + code)
-            pref = [c for c in candidates if c.upper().endswith(sc)]
-            if len(pref) == 1:
-                return pref[0]
-
-        # 3) contains (broadest)
-        cur.execute(q_sw, ('%' + sc + '%',))
-        contains = [r[0] for r in cur.fetchall()]
-        contains = list({c for c in contains})  # unique
-        if len(contains) == 1:
-            return contains[0]
-
-        # Not found or ambiguous
-        return None
+    return get_course_code_resolver(conn).resolve(short_code)
 
 def import_course_structure(csv_file_path, course_version):
     """
@@ -536,6 +550,7 @@ def import_course_structure(csv_file_path, course_version):
             
             print("[DEBUG]   Committing transaction...")
             conn.commit()
+            invalidate_course_code_resolver()
             print(f"Import results:")
             print(f"- {insert_count} new records inserted")
             print(f"- {update_count} existing records updated")
@@ -553,12 +568,149 @@ def import_course_structure(csv_file_path, course_version):
     
     return insert_count, update_count, error_count
 
-def import_student_info(csv_file_path='Active_Student.csv'):
+STUDENT_VALUE_COLUMNS = ['STUDENT_NAME', 'COHORT', 'SEM', 'CU_ID', 'IC_NO',
+                         'MOBILE_NO', 'EMAIL', 'BM', 'ENGLISH', 'ENTRY_Q']
+STUDENT_COMPARE_COLUMNS = STUDENT_VALUE_COLUMNS + ['STUDENT_STATUS', 'GRADUATED_ON', 'IC_NO_BIDX']
+
+def _db_values(series, convert=None):
+    """Object Series with None for NaN/NA (pyodbc sends NULL), other values optionally converted"""
+    return pd.Series([None if pd.isna(v) else (convert(v) if convert else v) for v in series],
+                     index=series.index, dtype=object)
+
+def _student_compare_frame(frame):
+    """Trimmed text of every value ('' for NULL/NaN), the form rows are compared in"""
+    return frame.apply(lambda s: s.where(s.notna(), '').astype(str).str.strip())
+
+def _matric_key(matric_nos):
+    """MATRIC_NO as the DB compares it (case-insensitive collation, trailing blanks ignored)"""
+    return matric_nos.astype(str).str.rstrip().str.upper()
+
+def fetch_existing_students(cursor, matric_nos):
+    """
+    Existing STUDENTS rows for the given MATRIC_NOs, loaded through a staged key table in one query.
+    Returns a DataFrame indexed by _matric_key(MATRIC_NO) with the stored MATRIC_NO and
+    STUDENT_COMPARE_COLUMNS; IC_NO is decrypted (left as stored if it is not a valid token).
+    Callers must pass MATRIC_NOs that are already unique by _matric_key (#student_keys' key).
+    """
+    if not matric_nos:
+        return pd.DataFrame(columns=['MATRIC_NO'] + STUDENT_COMPARE_COLUMNS, index=pd.Index([], name='MATRIC_KEY'))
+
+    cursor.execute("IF OBJECT_ID('tempdb..#student_keys') IS NOT NULL DROP TABLE #student_keys")
+    cursor.execute("CREATE TABLE #student_keys (MATRIC_NO NVARCHAR(100) COLLATE DATABASE_DEFAULT PRIMARY KEY)")
+    try:
+        cursor.fast_executemany = True
+        cursor.executemany("INSERT INTO #student_keys (MATRIC_NO) VALUES (?)", [(m,) for m in matric_nos])
+        cursor.fast_executemany = False
+        cursor.execute(f"""
+            SELECT s.MATRIC_NO, {', '.join('s.' + c for c in STUDENT_COMPARE_COLUMNS)}
+            FROM STUDENTS s
+            JOIN #student_keys k ON k.MATRIC_NO = s.MATRIC_NO
+        """)
+        rows = [tuple(r) for r in cursor.fetchall()]
+    finally:
+        try:
+            cursor.execute("IF OBJECT_ID('tempdb..#student_keys') IS NOT NULL DROP TABLE #student_keys")
+        except pyodbc.Error:
+            pass
+
+    # dtype=object keeps DB values as fetched (no int -> float upcast around NULLs)
+    existing = pd.DataFrame(rows, columns=['MATRIC_NO'] + STUDENT_COMPARE_COLUMNS, dtype=object)
+    existing['MATRIC_KEY'] = _matric_key(existing['MATRIC_NO'])
+    existing = existing.drop_duplicates('MATRIC_KEY').set_index('MATRIC_KEY')
+
+    stored = existing['IC_NO'].tolist()
+    plain = decrypt_ic_batch(stored)
+    # Values that are not valid tokens are compared as stored
+    existing['IC_NO'] = pd.Series([p if p is not None else v for p, v in zip(plain, stored)],
+                                  index=existing.index, dtype=object)
+    return existing
+
+def find_students_by_ic(plain_ic):
+    """Students whose IC matches, via one indexed lookup on IC_NO_BIDX (no table-wide decryption)"""
+    bidx = ic_blind_index(plain_ic)
+    if bidx is None:
+        return []
+    require_ic_blind_index()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT STUDENT_ID, MATRIC_NO, STUDENT_NAME, STUDENT_STATUS
+                FROM STUDENTS
+                WHERE IC_NO_BIDX = ?
+            """, (bidx,))
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+def backfill_ic_blind_index(batch_size=1000, recompute=False):
     """
-    Import student data from CSV to SQL Server database.
+    One-off job: fill IC_NO_BIDX for existing students by decrypting their IC_NO.
+    Only rows with a NULL index are touched unless recompute=True (e.g. after rotating IC_BLIND_INDEX_KEY).
+    Returns (updated, undecryptable).
+    """
+    require_ic_blind_index()
+    updated = 0
+    undecryptable = 0
+    last_id = None
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            while True:
+                # Keyset walk by STUDENT_ID so each batch is a short indexed range read
+                cursor.execute(f"""
+                    SELECT TOP ({int(batch_size)}) STUDENT_ID, IC_NO
+                    FROM STUDENTS
+                    WHERE IC_NO IS NOT NULL
+                      {"" if recompute else "AND IC_NO_BIDX IS NULL"}
+                      {"" if last_id is None else "AND STUDENT_ID > ?"}
+                    ORDER BY STUDENT_ID
+                """, () if last_id is None else (last_id,))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+
+                plain = decrypt_ic_batch([r[1] for r in rows])
+                params = [(ic_blind_index(ic), r[0]) for r, ic in zip(rows, plain) if ic is not None]
+                undecryptable += len(rows) - len(params)
+                if params:
+                    cursor.fast_executemany = True
+                    cursor.executemany("UPDATE STUDENTS SET IC_NO_BIDX = ? WHERE STUDENT_ID = ?", params)
+                    cursor.fast_executemany = False
+                conn.commit()
+                updated += len(params)
+                logging.info("IC blind index backfill: %d updated, %d undecryptable", updated, undecryptable)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return updated, undecryptable
+
+def student_status_from_name(name):
+    """Map a sheet name or file name ('Active', 'Graduate_Student.csv', ...) to a STUDENT_STATUS"""
+    lowered = os.path.basename(str(name)).lower()
+    if "active" in lowered:
+        return "Active"
+    elif "graduate" in lowered:
+        return "Graduate"
+    elif "withdraw" in lowered:
+        return "Withdraw"
+    raise ValueError(f"Unable to determine student status from filename: {name}")
+
+def import_student_info(csv_file_path='Active_Student.csv', student_status=None):
+    """
+    Import student data from CSV (or an already parsed DataFrame) to SQL Server database.
     
     Args:
-        csv_file_path (str): Path to the CSV file. Defaults to 'Active_Student.csv'.
+        csv_file_path (str | DataFrame): Path to the CSV file, or the student frame from
+            parse_student_datasheet. Defaults to 'Active_Student.csv'.
+        student_status (str): STUDENT_STATUS to apply; derived from the filename when omitted.
+
+    Existing rows are fetched in one query and compared in bulk (IC_NO by plaintext), then
+    changed and new rows are written with two executemany batches.
     
     Returns:
         tuple: (success_count, error_count) of records processed
@@ -568,22 +720,19 @@ def import_student_info(csv_file_path='Active_Student.csv'):
     update_count = 0
     error_count = 0
     
-    # Determine student status based on filename
-    filename = os.path.basename(csv_file_path).lower()
-    if "active" in filename:
-        student_status = "Active"
-    elif "graduate" in filename:
-        student_status = "Graduate"
-    elif "withdraw" in filename:
-        student_status = "Withdraw"
-    else:
-        raise ValueError(f"Unable to determine student status from filename: {csv_file_path}")
+    from_frame = isinstance(csv_file_path, pd.DataFrame)
+    if student_status is None:
+        if from_frame:
+            raise ValueError("student_status is required when importing from a DataFrame")
+        # Determine student status based on filename
+        student_status = student_status_from_name(csv_file_path)
     
     try:
+        require_ic_blind_index()
         conn = get_db_connection()
         
-        # Read and prepare CSV data
-        df = pd.read_csv(csv_file_path)
+        # Read and prepare CSV data (frames are copied so the caller's parse result is untouched)
+        df = csv_file_path.copy() if from_frame else pd.read_csv(csv_file_path)
         
         # Clean and transform data
         df = df.rename(columns={
@@ -619,7 +768,8 @@ def import_student_info(csv_file_path='Active_Student.csv'):
         update_query = """
         UPDATE STUDENTS SET
             STUDENT_NAME=?, COHORT=?, SEM=?, CU_ID=?, IC_NO=?, 
-            MOBILE_NO=?, EMAIL=?, BM=?, ENGLISH=?, ENTRY_Q=?, STUDENT_STATUS=?, GRADUATED_ON=?
+            MOBILE_NO=?, EMAIL=?, BM=?, ENGLISH=?, ENTRY_Q=?, STUDENT_STATUS=?, GRADUATED_ON=?,
+            IC_NO_BIDX=?
         WHERE MATRIC_NO=?
         """
 
@@ -627,69 +777,81 @@ def import_student_info(csv_file_path='Active_Student.csv'):
         INSERT INTO STUDENTS (
             STUDENT_NAME, COHORT, SEM, CU_ID, IC_NO, 
             MOBILE_NO, EMAIL, BM, ENGLISH, ENTRY_Q, 
-            MATRIC_NO, STUDENT_STATUS, GRADUATED_ON
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            MATRIC_NO, STUDENT_STATUS, GRADUATED_ON, IC_NO_BIDX
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
         
-        # Process each row
+        # One frame of DB-ready values, last row wins for a repeated MATRIC_NO (compared like the DB does)
+        values = pd.DataFrame({
+            col: _db_values(df[col], str if col in ('CU_ID', 'IC_NO', 'MOBILE_NO') else None)
+            for col in STUDENT_VALUE_COLUMNS
+        })
+        values['STUDENT_STATUS'] = student_status
+        values['GRADUATED_ON'] = df['GRADUATED_ON']
+        values['IC_NO_BIDX'] = _db_values(values['IC_NO'], ic_blind_index)
+        values['MATRIC_NO'] = _db_values(df['MATRIC_NO'], str)
+
+        missing_matric = values['MATRIC_NO'].isna()
+        error_count += int(missing_matric.sum())
+        values = values[~missing_matric].copy()
+        values['MATRIC_KEY'] = _matric_key(values['MATRIC_NO'])
+        values = values.drop_duplicates('MATRIC_KEY', keep='last').reset_index(drop=True)
 
         with conn.cursor() as cursor:
-            for idx, row in df.iterrows():
-                try:
-                    values_common = [
-                        row['STUDENT_NAME'],
-                        row['COHORT'] if pd.notna(row['COHORT']) else None,
-                        row['SEM'] if pd.notna(row['SEM']) else None,
-                        str(row['CU_ID']) if pd.notna(row['CU_ID']) else None,
-                        # str(row['IC_NO']) if pd.notna(row['IC_NO']) else None,
-                        encrypt_ic(str(row['IC_NO'])) if pd.notna(row['IC_NO']) else None, # Encrypted IC No
-                        str(row['MOBILE_NO']) if pd.notna(row['MOBILE_NO']) else None,
-                        row['EMAIL'] if pd.notna(row['EMAIL']) else None,
-                        row['BM'] if pd.notna(row['BM']) else None,
-                        row['ENGLISH'] if pd.notna(row['ENGLISH']) else None,
-                        row['ENTRY_Q'] if pd.notna(row['ENTRY_Q']) else None,
-                    ]
-                    matric_no = str(row['MATRIC_NO']) if pd.notna(row['MATRIC_NO']) else None
-                    graduated_on = row['GRADUATED_ON']
-
-                    # Check if record exists and get current values
-                    cursor.execute("""
-                        SELECT STUDENT_NAME, COHORT, SEM, CU_ID, IC_NO, MOBILE_NO, 
-                            EMAIL, BM, ENGLISH, ENTRY_Q, STUDENT_STATUS, GRADUATED_ON
-                        FROM STUDENTS 
-                        WHERE MATRIC_NO = ?
-                    """, (matric_no,))
-                    
-                    existing = cursor.fetchone()
-
-                    if existing:
-                        # Compare current values with new values
-                        new_values = values_common + [student_status, graduated_on]
-                        existing_values = list(existing)
-                        
-                        # Check if any value has changed (handle None comparisons)
-                        has_changes = False
-                        for old_val, new_val in zip(existing_values, new_values):
-                            # Normalize None and empty string comparisons
-                            old_normalized = str(old_val).strip() if old_val is not None else ""
-                            new_normalized = str(new_val).strip() if new_val is not None else ""
-                            if old_normalized != new_normalized:
-                                has_changes = True
-                                break
-                        
-                        if has_changes:
-                            # Only update if there are actual changes
-                            cursor.execute(update_query, values_common + [student_status, graduated_on, matric_no])
-                            update_count += 1
-                        # else: skip, no changes needed
-                    else:
-                        # Record doesn't exist, insert it
-                        cursor.execute(insert_query, values_common + [matric_no, student_status, graduated_on])
-                        insert_count += 1
-                        
-                except Exception as row_ex:
-                    error_count += 1
-                    logging.warning(f"Error processing row {idx + 2}: {str(row_ex)}")
+            # Existing rows for this sheet's students in one round trip (IC decrypted for comparison)
+            existing = fetch_existing_students(cursor, values['MATRIC_NO'].tolist())
+
+            # Vectorized change detection on trimmed text, same normalization as the old per-row compare
+            # Aligned on the normalized key, so 'a123 ' in the sheet matches a stored 'A123'
+            incoming = _student_compare_frame(values.set_index('MATRIC_KEY')[STUDENT_COMPARE_COLUMNS])
+            current = _student_compare_frame(existing[STUDENT_COMPARE_COLUMNS].reindex(incoming.index).astype(object))
+            is_existing = incoming.index.isin(existing.index)
+            is_changed = is_existing & (incoming != current).any(axis=1).to_numpy()
+
+            to_update = values[is_changed].copy()
+            to_insert = values[~is_existing]
+            # UPDATE by the stored spelling of the key
+            to_update['MATRIC_NO'] = existing['MATRIC_NO'].reindex(to_update['MATRIC_KEY']).to_numpy()
+
+            # Encrypt only what is written, in one batch
+            ic_tokens = encrypt_ic_batch(to_update['IC_NO'].tolist() + to_insert['IC_NO'].tolist())
+            update_rows = [
+                (*r[:4], ic, *r[5:])
+                for r, ic in zip(to_update[STUDENT_VALUE_COLUMNS + ['STUDENT_STATUS', 'GRADUATED_ON', 'IC_NO_BIDX', 'MATRIC_NO']].itertuples(index=False),
+                                 ic_tokens[:len(to_update)])
+            ]
+            insert_rows = [
+                (*r[:4], ic, *r[5:])
+                for r, ic in zip(to_insert[STUDENT_VALUE_COLUMNS + ['MATRIC_NO', 'STUDENT_STATUS', 'GRADUATED_ON', 'IC_NO_BIDX']].itertuples(index=False),
+                                 ic_tokens[len(to_update):])
+            ]
+
+            try:
+                if update_rows or insert_rows:
+                    cursor.fast_executemany = True
+                    if update_rows:
+                        cursor.executemany(update_query, update_rows)
+                    if insert_rows:
+                        cursor.executemany(insert_query, insert_rows)
+                    cursor.fast_executemany = False
+                update_count += len(update_rows)
+                insert_count += len(insert_rows)
+            except pyodbc.Error as bulk_ex:
+                # A bad row fails the whole batch; redo row by row so the good rows still land
+                logging.warning(f"Bulk student write failed ({str(bulk_ex)}), retrying row by row")
+                conn.rollback()
+                cursor.fast_executemany = False
+                for query, rows, kind in ((update_query, update_rows, 'update'), (insert_query, insert_rows, 'insert')):
+                    for params in rows:
+                        try:
+                            cursor.execute(query, params)
+                            if kind == 'update':
+                                update_count += 1
+                            else:
+                                insert_count += 1
+                        except Exception as row_ex:
+                            error_count += 1
+                            logging.warning(f"Error processing student {params[-1] if kind == 'update' else params[10]}: {str(row_ex)}")
 
             conn.commit()
 
@@ -704,7 +866,387 @@ def import_student_info(csv_file_path='Active_Student.csv'):
 
     return insert_count, update_count, error_count
 
+SCORE_SEED_INSERT_SQL = """
+INSERT INTO STUDENT_SCORE (
+    MATRIC_NO, COURSE_CODE, ATTEMPT_1, ATTEMPT_2, ATTEMPT_3,
+    A1_UPDATED_AT, A2_UPDATED_AT, A3_UPDATED_AT
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _program_key(program_code):
+    return str(program_code).rstrip().upper()
+
+def load_program_courses(cursor, program_codes):
+    """{program key: [(COURSE_CODE, COURSE_CLASSIFICATION), ...]} for the given programs in one query"""
+    program_codes = sorted({str(p).strip() for p in program_codes})
+    courses = {_program_key(p): [] for p in program_codes}
+    if not program_codes:
+        return courses
+    cursor.execute(f"""
+        SELECT PROGRAM_CODE, COURSE_CODE, COURSE_CLASSIFICATION
+        FROM COURSE_STRUCTURE
+        WHERE PROGRAM_CODE IN ({', '.join('?' * len(program_codes))})
+    """, program_codes)
+    for program_code, course_code, classification in cursor.fetchall():
+        courses.setdefault(_program_key(program_code), []).append((course_code, classification))
+    return courses
+
+def seed_student_scores(cursor, students, program_courses=None):
+    """
+    Insert the blank STUDENT_SCORE rows for new students with one fast_executemany statement.
+    MPU courses start as '-', '-', 'N/A' with A3_UPDATED_AT = today, everything else '-', '-', '-'.
+    Caller owns the transaction.
+
+    Args:
+        cursor: pyodbc cursor
+        students: [(MATRIC_NO, PROGRAM_CODE), ...]
+        program_courses: result of load_program_courses, fetched here if None
+
+    Returns:
+        dict: {MATRIC_NO: number of course rows seeded}
+    """
+    if program_courses is None:
+        program_courses = load_program_courses(cursor, [p for _, p in students])
+    today = date.today()
+    rows, seeded = [], {}
+    for matric_no, program_code in students:
+        courses = program_courses.get(_program_key(program_code), [])
+        seeded[matric_no] = len(courses)
+        for course_code, classification in courses:
+            if bool(classification) and str(classification).upper().startswith("MPU"):
+                rows.append((matric_no, course_code, "-", "-", "N/A", None, None, today))
+            else:
+                rows.append((matric_no, course_code, "-", "-", "-", None, None, None))
+    if rows:
+        cursor.fast_executemany = True
+        cursor.setinputsizes([(pyodbc.SQL_WVARCHAR, 100, 0)] * 5 + [(pyodbc.SQL_TYPE_DATE, 10, 0)] * 3)
+        cursor.executemany(SCORE_SEED_INSERT_SQL, rows)
+        cursor.setinputsizes(None)
+        cursor.fast_executemany = False
+    return seeded
+
+NEW_STUDENT_REQUIRED = ["STUDENT_NAME", "COHORT", "SEM", "CU_ID", "IC_NO", "MATRIC_NO", "PROGRAM_CODE"]
+NEW_STUDENT_OPTIONAL = ["MOBILE_NO", "EMAIL", "BM", "ENGLISH", "ENTRY_Q"]
+
+def _text_column(df, column):
+    if column not in df.columns:
+        return pd.Series([""] * len(df), index=df.index, dtype=object)
+    return pd.Series(["" if v is None or (isinstance(v, float) and np.isnan(v)) else str(v).strip()
+                      for v in df[column]], index=df.index, dtype=object)
+
+def validate_new_students(df):
+    """
+    Vectorized checks for a batch of new students (same rules as /api/add-student).
+
+    Returns:
+        tuple: (clean DataFrame with typed COHORT/CU_ID and '-' defaults, [{row, MATRIC_NO, error}, ...])
+               row is the 1-based position in the submitted batch
+    """
+    df = df.reset_index(drop=True)
+    text = pd.DataFrame({c: _text_column(df, c) for c in NEW_STUDENT_REQUIRED + NEW_STUDENT_OPTIONAL})
+    problems = pd.Series([[] for _ in range(len(text))], index=text.index, dtype=object)
+
+    def flag(mask, message):
+        for i in mask[mask].index:
+            problems[i].append(message)
+
+    for column in NEW_STUDENT_REQUIRED:
+        flag(text[column] == "", f"Missing {column}")
+
+    cohort = pd.to_datetime(text["COHORT"], format="%Y-%m-%d", errors="coerce")
+    flag((text["COHORT"] != "") & cohort.isna(), "COHORT must be YYYY-MM-DD")
+
+    cu_id = pd.to_numeric(text["CU_ID"], errors="coerce")
+    flag((text["CU_ID"] != "") & (cu_id.isna() | (cu_id % 1 != 0)), "CU_ID must be an integer")
+
+    matric_key = text["MATRIC_NO"].str.upper()
+    flag((text["MATRIC_NO"] != "") & matric_key.duplicated(keep=False), "MATRIC_NO repeated in this batch")
+
+    errors = [{"row": i + 1, "MATRIC_NO": text.at[i, "MATRIC_NO"], "error": "; ".join(msgs)}
+              for i, msgs in problems.items() if msgs]
+
+    clean = text.copy()
+    clean["COHORT"] = _db_values(cohort, lambda v: v.date())
+    clean["CU_ID"] = _db_values(cu_id, int)
+    for column in NEW_STUDENT_OPTIONAL:
+        clean[column] = clean[column].where(clean[column] != "", "-")
+    return clean, errors
+
+def add_students_bulk(df):
+    """
+    Add a batch of new (Active) students and seed their course rows in one transaction.
+    Nothing is written unless every row is valid, its MATRIC_NO is new and its program has courses.
+
+    Args:
+        df: DataFrame with the /api/add-student fields (NEW_STUDENT_REQUIRED + optional NEW_STUDENT_OPTIONAL)
+
+    Returns:
+        tuple: (result dict {students, score_rows}, errors list); errors non-empty means nothing was written
+    """
+    if df.empty:
+        return {"students": 0, "score_rows": 0}, [{"row": 0, "MATRIC_NO": "", "error": "No students submitted"}]
+    clean, errors = validate_new_students(df)
+    if errors:
+        return None, errors
+
+    require_ic_blind_index()
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+
+        matric_nos = clean["MATRIC_NO"].tolist()
+        existing = set()
+        for start in range(0, len(matric_nos), 1000):
+            chunk = matric_nos[start:start + 1000]
+            cursor.execute(f"SELECT MATRIC_NO FROM STUDENTS WHERE MATRIC_NO IN ({', '.join('?' * len(chunk))})", chunk)
+            existing.update(str(m).rstrip().upper() for (m,) in cursor.fetchall())
+        program_courses = load_program_courses(cursor, clean["PROGRAM_CODE"])
+        for i, row in clean.iterrows():
+            if row["MATRIC_NO"].upper() in existing:
+                errors.append({"row": i + 1, "MATRIC_NO": row["MATRIC_NO"], "error": "Matric number already exists"})
+            elif not program_courses.get(_program_key(row["PROGRAM_CODE"])):
+                errors.append({"row": i + 1, "MATRIC_NO": row["MATRIC_NO"],
+                               "error": f"No courses found for program: {row['PROGRAM_CODE']}"})
+        if errors:
+            conn.rollback()
+            return None, errors
+
+        ic_enc = encrypt_ic_batch(clean["IC_NO"].tolist())
+        ic_bidx = [ic_blind_index(ic) for ic in clean["IC_NO"]]
+        student_rows = [
+            (r.STUDENT_NAME, r.COHORT, r.SEM, r.CU_ID, enc,
+             r.MOBILE_NO, r.EMAIL, r.BM, r.ENGLISH, r.ENTRY_Q,
+             r.MATRIC_NO, "Active", bidx)
+            for r, enc, bidx in zip(clean.itertuples(index=False), ic_enc, ic_bidx)
+        ]
+        cursor.fast_executemany = True
+        cursor.executemany("""
+            INSERT INTO STUDENTS (
+              STUDENT_NAME, COHORT, SEM, CU_ID, IC_NO,
+              MOBILE_NO, EMAIL, BM, ENGLISH, ENTRY_Q,
+              MATRIC_NO, STUDENT_STATUS, IC_NO_BIDX
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, student_rows)
+        cursor.fast_executemany = False
+
+        seeded = seed_student_scores(cursor, list(zip(matric_nos, clean["PROGRAM_CODE"])), program_courses)
+        conn.commit()
+        logging.info(f"Bulk add: {len(student_rows)} students, {sum(seeded.values())} score rows")
+        return {"students": len(student_rows), "score_rows": sum(seeded.values())}, []
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+ATTEMPT_COLUMNS = ['ATTEMPT_1', 'ATTEMPT_2', 'ATTEMPT_3']
+SCORE_ATTEMPT_COL_RE = re.compile(r"^(.*?)_Attempt(\d+)$")
+
+def normalize_score_value(value):
+    """Round numeric marks to 2 decimal places, keep text codes ('-', 'Exempted', 'R1-2023', ...) as-is"""
+    try:
+        return round(float(value), 2)
+    except (ValueError, TypeError):
+        return value
+
+def pivot_student_scores(df):
+    """
+    Vectorized wide-to-long transform of a score sheet.
+
+    Args:
+        df: DataFrame indexed by MATRIC_NO with one column per single-attempt course ('CODE')
+            or per attempt ('CODE_Attempt1', 'CODE_Attempt2', ...)
+
+    Returns:
+        DataFrame with one row per (MATRIC_NO, COURSE_CODE) and columns
+        MATRIC_NO, COURSE_CODE, ATTEMPT_1, ATTEMPT_2, ATTEMPT_3 (None where blank).
+        Numeric marks are rounded to 2 decimals, other values kept as-is,
+        and MPU courses always get ATTEMPT_3 = 'N/A'.
+    """
+    result_cols = ['MATRIC_NO', 'COURSE_CODE'] + ATTEMPT_COLUMNS
+    if df.empty:
+        return pd.DataFrame(columns=result_cols)
+
+    # Column-level parsing: column -> (course id, attempt index 0..2)
+    names = [str(c) for c in df.columns]
+    matches = [SCORE_ATTEMPT_COL_RE.match(n) for n in names]
+    col_course = [m.group(1) if m else n for m, n in zip(matches, names)]
+    col_attempt = np.array([int(m.group(2)) if m else 1 for m in matches]) - 1
+    col_course_id, course_codes = pd.factorize(pd.Index(col_course))
+    row_matric_id, matrics = pd.factorize(df.index, use_na_sentinel=False)
+    n_courses = len(course_codes)
+
+    # Sheets repeat a small vocabulary of values ('-', 'Exempted', 0-100, session codes), so
+    # normalize each distinct value once and broadcast back through the factorized codes
+    value_codes, distinct = pd.factorize(df.to_numpy(dtype=object).ravel())
+    normalized = np.array([normalize_score_value(v) for v in distinct] + [None], dtype=object)
+    blank = np.array([v == '' for v in distinct] + [True])
+    value_codes = value_codes.reshape(df.shape)  # NaN/None cells get code -1 -> trailing blank slot
+
+    keep = ~blank[value_codes] & ((col_attempt >= 0) & (col_attempt <= 2))[None, :]
+    rows, cols = np.nonzero(keep)  # row-major, i.e. the sheet's reading order
+    if rows.size == 0:
+        return pd.DataFrame(columns=result_cols)
+
+    # Cell -> slot in a (student, course, attempt) grid; a later cell for the same slot wins
+    slots = (row_matric_id[rows] * n_courses + col_course_id[cols]) * 3 + col_attempt[cols]
+    latest = ~pd.Series(slots).duplicated(keep='last').to_numpy()
+    slots = slots[latest]
+
+    grid = np.full(len(matrics) * n_courses * 3, None, dtype=object)
+    grid[slots] = normalized[value_codes[rows[latest], cols[latest]]]
+    pairs = np.unique(slots // 3)
+    attempts = grid.reshape(-1, 3)[pairs]
+
+    records = pd.DataFrame(attempts, columns=ATTEMPT_COLUMNS, dtype=object)
+    records.insert(0, 'COURSE_CODE', np.asarray(course_codes, dtype=object)[pairs % n_courses])
+    records.insert(0, 'MATRIC_NO', np.asarray(matrics, dtype=object)[pairs // n_courses])
+
+    # Force MPU ATTEMPT_3 value to "N/A"
+    is_mpu = np.array([str(c).strip().upper().startswith('MPU') for c in course_codes])
+    records.loc[is_mpu[pairs % n_courses], 'ATTEMPT_3'] = 'N/A'
+
+    return records[result_cols]
+
+def score_to_db_text(value):
+    """
+    Render an attempt value exactly as it ends up in the NVARCHAR ATTEMPT_n columns.
+    Floats are formatted the way SQL Server converts a bound FLOAT (e.g. 85.0 -> '85', 72.5 -> '72.5'),
+    so staged values compare equal to what an earlier import stored.
+    """
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if value != value:  # NaN
+            return None
+        return format(value, 'g')
+    return str(value)
+
+# Staging table for set-based STUDENT_SCORE upserts (COLLATE avoids tempdb collation conflicts)
+SCORE_STAGE_DDL = """
+CREATE TABLE #score_stage (
+    MATRIC_NO NVARCHAR(100) COLLATE DATABASE_DEFAULT NOT NULL,
+    COURSE_CODE NVARCHAR(100) COLLATE DATABASE_DEFAULT NOT NULL,
+    ATTEMPT_1 NVARCHAR(100) COLLATE DATABASE_DEFAULT NULL,
+    ATTEMPT_2 NVARCHAR(100) COLLATE DATABASE_DEFAULT NULL,
+    ATTEMPT_3 NVARCHAR(100) COLLATE DATABASE_DEFAULT NULL,
+    PRIMARY KEY (MATRIC_NO, COURSE_CODE)
+)
+"""
+
+# One MERGE applying the same rules the row-by-row import used:
+# - existing row is only touched if any trimmed attempt value differs (case-sensitive)
+# - An_UPDATED_AT moves to GETDATE() only when the new value is set, isn't '-', and differs
+# - new rows get GETDATE() for every attempt that is set and isn't '-'
+SCORE_MERGE_SQL = """
+SET NOCOUNT ON;
+DECLARE @actions TABLE (ACTION NVARCHAR(10));
+
+MERGE dbo.STUDENT_SCORE WITH (HOLDLOCK) AS t
+USING #score_stage AS s
+   ON t.MATRIC_NO = s.MATRIC_NO AND t.COURSE_CODE = s.COURSE_CODE
+WHEN MATCHED AND (
+       ISNULL(LTRIM(RTRIM(t.ATTEMPT_1)), '') COLLATE Latin1_General_BIN2 <> ISNULL(LTRIM(RTRIM(s.ATTEMPT_1)), '')
+    OR ISNULL(LTRIM(RTRIM(t.ATTEMPT_2)), '') COLLATE Latin1_General_BIN2 <> ISNULL(LTRIM(RTRIM(s.ATTEMPT_2)), '')
+    OR ISNULL(LTRIM(RTRIM(t.ATTEMPT_3)), '') COLLATE Latin1_General_BIN2 <> ISNULL(LTRIM(RTRIM(s.ATTEMPT_3)), '')
+) THEN UPDATE SET
+    ATTEMPT_1 = s.ATTEMPT_1,
+    A1_UPDATED_AT = CASE WHEN s.ATTEMPT_1 IS NOT NULL AND LTRIM(RTRIM(s.ATTEMPT_1)) <> '-'
+                          AND (t.ATTEMPT_1 IS NULL OR t.ATTEMPT_1 COLLATE Latin1_General_BIN2 <> s.ATTEMPT_1)
+                         THEN GETDATE() ELSE t.A1_UPDATED_AT END,
+    ATTEMPT_2 = s.ATTEMPT_2,
+    A2_UPDATED_AT = CASE WHEN s.ATTEMPT_2 IS NOT NULL AND LTRIM(RTRIM(s.ATTEMPT_2)) <> '-'
+                          AND (t.ATTEMPT_2 IS NULL OR t.ATTEMPT_2 COLLATE Latin1_General_BIN2 <> s.ATTEMPT_2)
+                         THEN GETDATE() ELSE t.A2_UPDATED_AT END,
+    ATTEMPT_3 = s.ATTEMPT_3,
+    A3_UPDATED_AT = CASE WHEN s.ATTEMPT_3 IS NOT NULL AND LTRIM(RTRIM(s.ATTEMPT_3)) <> '-'
+                          AND (t.ATTEMPT_3 IS NULL OR t.ATTEMPT_3 COLLATE Latin1_General_BIN2 <> s.ATTEMPT_3)
+                         THEN GETDATE() ELSE t.A3_UPDATED_AT END
+WHEN NOT MATCHED BY TARGET THEN
+    INSERT (MATRIC_NO, COURSE_CODE, ATTEMPT_1, ATTEMPT_2, ATTEMPT_3, A1_UPDATED_AT, A2_UPDATED_AT, A3_UPDATED_AT)
+    VALUES (
+        s.MATRIC_NO, s.COURSE_CODE, s.ATTEMPT_1, s.ATTEMPT_2, s.ATTEMPT_3,
+        CASE WHEN s.ATTEMPT_1 IS NOT NULL AND LTRIM(RTRIM(s.ATTEMPT_1)) <> '-' THEN GETDATE() END,
+        CASE WHEN s.ATTEMPT_2 IS NOT NULL AND LTRIM(RTRIM(s.ATTEMPT_2)) <> '-' THEN GETDATE() END,
+        CASE WHEN s.ATTEMPT_3 IS NOT NULL AND LTRIM(RTRIM(s.ATTEMPT_3)) <> '-' THEN GETDATE() END
+    )
+OUTPUT $action INTO @actions;
+
+SELECT
+    ISNULL(SUM(CASE WHEN ACTION = 'INSERT' THEN 1 ELSE 0 END), 0) AS INSERTED,
+    ISNULL(SUM(CASE WHEN ACTION = 'UPDATE' THEN 1 ELSE 0 END), 0) AS UPDATED
+FROM @actions;
+"""
+
+def merge_student_scores(cursor, records):
+    """
+    Set-based upsert of score records into STUDENT_SCORE.
+    Stages every record in #score_stage with one fast_executemany load, then applies a single MERGE.
+    Caller owns the transaction (commit/rollback).
+
+    Args:
+        cursor: pyodbc cursor on the import connection
+        records: DataFrame with MATRIC_NO, COURSE_CODE, ATTEMPT_1..3 (see pivot_student_scores)
+
+    Returns:
+        tuple: (inserted_count, updated_count); unchanged rows are neither
+    """
+    # The stage key, like STUDENT_SCORE's, ignores case and trailing blanks; keep the last of any
+    # such duplicates (what the row-by-row import ended up storing) instead of failing the whole load
+    key = (records['MATRIC_NO'].astype(str).str.rstrip().str.upper() + '\x1f'
+           + records['COURSE_CODE'].astype(str).str.rstrip().str.upper())
+    duplicated = key.duplicated(keep='last')
+    if duplicated.any():
+        dropped = records.loc[duplicated, ['MATRIC_NO', 'COURSE_CODE']]
+        logging.warning(f"Score import: dropped {len(dropped)} duplicate rows (same MATRIC_NO/COURSE_CODE "
+                        f"ignoring case and trailing blanks), kept the last one: "
+                        f"{list(dropped.itertuples(index=False, name=None))[:20]}")
+        records = records.loc[~duplicated]
+
+    rows = list(zip(
+        records['MATRIC_NO'].astype(str),
+        records['COURSE_CODE'].astype(str),
+        *(records[col].map(score_to_db_text) for col in ATTEMPT_COLUMNS)
+    ))
+    if not rows:
+        return 0, 0
+
+    cursor.execute("IF OBJECT_ID('tempdb..#score_stage') IS NOT NULL DROP TABLE #score_stage")
+    cursor.execute(SCORE_STAGE_DDL)
+    try:
+        cursor.fast_executemany = True
+        # Explicit sizes: skip driver parameter discovery on the temp table and keep NULLs typed
+        cursor.setinputsizes([(pyodbc.SQL_WVARCHAR, 100, 0)] * 5)
+        cursor.executemany("""
+            INSERT INTO #score_stage (MATRIC_NO, COURSE_CODE, ATTEMPT_1, ATTEMPT_2, ATTEMPT_3)
+            VALUES (?, ?, ?, ?, ?)
+        """, rows)
+        cursor.setinputsizes(None)
+        cursor.fast_executemany = False
+
+        cursor.execute(SCORE_MERGE_SQL)
+        inserted, updated = cursor.fetchone()
+    finally:
+        try:
+            cursor.execute("IF OBJECT_ID('tempdb..#score_stage') IS NOT NULL DROP TABLE #score_stage")
+        except pyodbc.Error:
+            pass  # pooled sessions also clear it at the start of the next merge
+
+    return int(inserted), int(updated)
+
 def import_student_scores(csv_file_path):
+    """
+    Import the wide score sheet into STUDENT_SCORE.
+
+    Args:
+        csv_file_path (str | DataFrame): Path to the score CSV, or the score frame from
+            parse_student_datasheet. Either way the first data row is the sheet's sub-header
+            and is skipped, and the first column holds MATRIC_NO.
+
+    Returns:
+        tuple: (insert_count, update_count, error_count); error_count is the number of
+        unknown matric numbers when the import is aborted
+    """
     conn = None
     insert_count = 0
     update_count = 0
@@ -718,10 +1260,14 @@ def import_student_scores(csv_file_path):
         cursor.execute("SELECT MATRIC_NO FROM STUDENTS")
         db_matrics = {row.MATRIC_NO for row in cursor.fetchall()}
         
-        # Read CSV and find missing
-        df = pd.read_csv(csv_file_path, skiprows=lambda x: x == 1)
-        #df = pd.read_csv(csv_file_path)
-        csv_matrics = set(df.iloc[:, 0].unique())
+        # Read CSV (or take the parsed frame) without the sub-header row, MATRIC_NO as index
+        if isinstance(csv_file_path, pd.DataFrame):
+            df = csv_file_path.iloc[1:].set_index(csv_file_path.columns[0])
+        else:
+            df = pd.read_csv(csv_file_path, index_col=0, skiprows=lambda x: x == 1)
+
+        # Find missing
+        csv_matrics = set(df.index.unique())
         #csv_matrics = set(df.iloc[:, 0].astype(str).str.strip().unique())
         missing_matrics = csv_matrics - db_matrics
         
@@ -741,150 +1287,14 @@ def import_student_scores(csv_file_path):
             
             return 0, 0, len(missing_matrics)  # Abort import
 
-        # Read CSV with first column as matric_no
-        df = pd.read_csv(csv_file_path, index_col=0, skiprows=lambda x: x == 1)
-        #df = pd.read_csv(csv_file_path, index_col=0)
-        
-        # Initialize list to hold transformed data
-        records = []
-        
-        # Process each student (row)
-        for matric_no, row in df.iterrows():
-            # Process each course (column)
-            for col in df.columns:
-                if pd.isna(row[col]) or row[col] == '':
-                    continue
-                    
-                # Extract course code and attempt number
-                if '_Attempt' in col:
-                    course_code, attempt_str = col.split('_Attempt')
-                    attempt_num = int(attempt_str)
-                else:
-                    course_code = col
-                    attempt_num = 1  # Default to attempt 1
-                
-                # Find or create record for this student/course
-                record = next(
-                    (r for r in records 
-                     if r['MATRIC_NO'] == matric_no and r['COURSE_CODE'] == course_code), 
-                    None
-                )
-                
-                if not record:
-                    record = {
-                        'MATRIC_NO': matric_no,
-                        'COURSE_CODE': course_code,
-                        'ATTEMPT_1': None,
-                        'ATTEMPT_2': None,
-                        'ATTEMPT_3': None
-                    }
-                    records.append(record)
-
-                value = row[col]
-                try:
-                    # Round numeric values to 2 decimal places
-                    value = round(float(value), 2)
-                except (ValueError, TypeError):
-                    # Keep non-numeric values as is
-                    pass
-                
-                record[f'ATTEMPT_{attempt_num}'] = value
-
-        # Force MPU ATTEMPT_3 value to "N/A"
-        for r in records:
-            code = r.get('COURSE_CODE')
-            if isinstance(code, str) and code.strip().upper().startswith('MPU'):
-                r['ATTEMPT_3'] = 'N/A'
+        # Wide sheet -> one row per (MATRIC_NO, COURSE_CODE) with ATTEMPT_1..3
+        records = pivot_student_scores(df)
 
         with conn.cursor() as cursor:
-            def should_update_timestamp(value):
-                return value is not None and str(value).strip() != '-'
-
-            for record in records:
-                try:
-                    # Check if record exists and get current values
-                    cursor.execute("""
-                        SELECT ATTEMPT_1, ATTEMPT_2, ATTEMPT_3, A1_UPDATED_AT, A2_UPDATED_AT, A3_UPDATED_AT
-                        FROM STUDENT_SCORE 
-                        WHERE MATRIC_NO = ? AND COURSE_CODE = ?
-                    """, (record['MATRIC_NO'], record['COURSE_CODE']))
-                    
-                    existing = cursor.fetchone()
-                    
-                    if existing:
-                        current_attempt1, current_attempt2, current_attempt3, \
-                        current_a1_updated_at, current_a2_updated_at, current_a3_updated_at = existing
-
-                        new_values = [record['ATTEMPT_1'], record['ATTEMPT_2'], record['ATTEMPT_3']]
-                        existing_values = [current_attempt1, current_attempt2, current_attempt3]
-
-                        # Check if any value has changed
-                        has_changes = False
-                        for old_val, new_val in zip(existing_values, new_values):
-                            old_normalized = str(old_val).strip() if old_val is not None else ""
-                            new_normalized = str(new_val).strip() if new_val is not None else ""
-                            if old_normalized != new_normalized:
-                                has_changes = True
-                                break
-                        
-                        if has_changes:
-                            update_set_parts = []
-                            update_values = []
-
-                            # ATTEMPT_1
-                            update_set_parts.append("ATTEMPT_1 = ?")
-                            update_values.append(new_values[0])
-                            if should_update_timestamp(new_values[0]) and str(new_values[0]) != str(current_attempt1):
-                                update_set_parts.append("A1_UPDATED_AT = GETDATE()")
-                            else:
-                                update_set_parts.append("A1_UPDATED_AT = ?")
-                                update_values.append(current_a1_updated_at)
-                            
-                            # ATTEMPT_2
-                            update_set_parts.append("ATTEMPT_2 = ?")
-                            update_values.append(new_values[1])
-                            if should_update_timestamp(new_values[1]) and str(new_values[1]) != str(current_attempt2):
-                                update_set_parts.append("A2_UPDATED_AT = GETDATE()")
-                            else:
-                                update_set_parts.append("A2_UPDATED_AT = ?")
-                                update_values.append(current_a2_updated_at)
-
-                            # ATTEMPT_3
-                            update_set_parts.append("ATTEMPT_3 = ?")
-                            update_values.append(new_values[2])
-                            if should_update_timestamp(new_values[2]) and str(new_values[2]) != str(current_attempt3):
-                                update_set_parts.append("A3_UPDATED_AT = GETDATE()")
-                            else:
-                                update_set_parts.append("A3_UPDATED_AT = ?")
-                                update_values.append(current_a3_updated_at)
-
-                            update_query = f"""
-                                UPDATE STUDENT_SCORE
-                                SET {', '.join(update_set_parts)}
-                                WHERE MATRIC_NO = ? AND COURSE_CODE = ?
-                            """
-                            final_params = update_values + [record['MATRIC_NO'], record['COURSE_CODE']]
-                            cursor.execute(update_query, final_params)
-                            update_count += 1
-                        else:
-                            skip_count += 1
-                    else:
-                        # Record doesn't exist, insert it
-                        today = datetime.now()
-                        cursor.execute("""
-                            INSERT INTO STUDENT_SCORE (MATRIC_NO, COURSE_CODE, ATTEMPT_1, ATTEMPT_2, ATTEMPT_3, A1_UPDATED_AT, A2_UPDATED_AT, A3_UPDATED_AT)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (
-                            record['MATRIC_NO'], record['COURSE_CODE'], record['ATTEMPT_1'], record['ATTEMPT_2'], record['ATTEMPT_3'],
-                            today if should_update_timestamp(record['ATTEMPT_1']) else None,
-                            today if should_update_timestamp(record['ATTEMPT_2']) else None,
-                            today if should_update_timestamp(record['ATTEMPT_3']) else None
-                        ))
-                        insert_count += 1
-
-                except Exception as e:
-                    error_count += 1
-                    logging.warning(f"Error on {record['MATRIC_NO']} {record['COURSE_CODE']}: {str(e)}")
+            inserted, updated = merge_student_scores(cursor, records)
+            insert_count += inserted
+            update_count += updated
+            skip_count = len(records) - inserted - updated
 
             conn.commit()
 
@@ -903,52 +1313,264 @@ def import_student_scores(csv_file_path):
 
     return insert_count, update_count, error_count
 
-def import_student_data(file_path, sheet_info, output_folder):
+def import_student_data(file_path, sheet_info, output_folder, export_csv=False, progress=None, force=False):
     """
-    Wrapper: process Excel -> generate 2 CSVs (Student + Student_Score) -> import both into DB.
+    Wrapper: parse Excel once -> import Student + Student_Score frames into DB.
+    With export_csv, the two CSVs are also written to output_folder as an audit copy.
+    progress(stage, rows_processed) is called between stages when given (see import_jobs).
+
+    Delta import: per-row content hashes of what was last committed to STUDENTS / STUDENT_SCORE,
+    from any sheet or workbook, are kept in one import_state scope. Re-importing the file and sheet
+    that were imported last is skipped outright, otherwise only new/changed student and score rows
+    are sent to the DB. The hashes only hold while nothing else has written to the tables: once
+    datasheet_db_version() differs from the one saved with them (a marksheet import, an edit in the
+    app or in the DB, a deleted student...), every row is imported again. force=True ignores them too.
+    Imports into the scope run one at a time (state_lock), from loading the state to saving it.
     Returns a dict summarizing the results.
     """
-    output_files = process_student_datasheet(file_path, sheet_info, output_folder)
-    if not output_files:
+    with state_lock(DATASHEET_STATE_SCOPE):
+        return _import_student_data(file_path, sheet_info, output_folder, export_csv, progress, force)
+
+# import_state scope of the datasheet import: its target tables
+DATASHEET_STATE_SCOPE = "STUDENTS+STUDENT_SCORE"
+
+# Where the target tables stand: @@DBTS moves with every write to STUDENTS or STUDENT_SCORE (both
+# carry a rowversion, score deletes add a tombstone), even uncommitted or rolled back ones, and the
+# STUDENTS count moves with student deletes
+DATASHEET_DB_VERSION_SQL = "SELECT CAST(@@DBTS AS BIGINT), (SELECT COUNT_BIG(*) FROM STUDENTS)"
+
+def datasheet_db_version():
+    """Version of STUDENTS + STUDENT_SCORE as a JSON-friendly list; changes after any write to them"""
+    require_score_change_tracking()
+    require_student_change_tracking()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(DATASHEET_DB_VERSION_SQL)
+            return [int(v) for v in cursor.fetchone()]
+    finally:
+        conn.close()
+
+def _import_student_data(file_path, sheet_info, output_folder, export_csv, progress, force):
+    progress = progress or (lambda stage, rows_processed=None: None)
+    sheet_name = sheet_info['name']
+
+    progress("fingerprinting")
+    file_hash = file_sha256(file_path)
+    state = {} if force else load_import_state(DATASHEET_STATE_SCOPE)
+    if state and state.get("db_version") != datasheet_db_version():
+        logging.info("[INGEST] %s: STUDENTS/STUDENT_SCORE written since the import of %s, importing every row",
+                     sheet_name, state.get("saved_at"))
+        state = {}
+    if state.get("file_sha256") == file_hash and state.get("sheet") == sheet_name:
+        logging.info("[INGEST] %s: workbook unchanged since %s, skipping import", sheet_name, state.get("saved_at"))
+        return {
+            "files": [],
+            "unchanged": True,
+            "students": {"inserted": 0, "updated": 0, "errors": 0},
+            "scores": {"inserted": 0, "updated": 0, "errors": 0},
+        }
+
+    progress("parsing")
+    parsed = parse_student_datasheet(file_path, sheet_info)
+    if not parsed:
         return None
+    student_df, score_df = parsed
+
+    output_files = []
+    if export_csv:
+        output_files = write_student_datasheet_csvs(student_df, score_df, sheet_name, output_folder)
 
-    # Identify which file is which, robustly
-    student_csv = None
-    score_csv = None
-    for fpath in output_files:
-        fname = os.path.basename(fpath).lower()
-        if fname.endswith('_student.csv'):
-            student_csv = fpath
-        elif fname.endswith('_student_score.csv'):
-            score_csv = fpath
+    # Only rows whose normalized content differs from the last import go to the DB
+    student_keys = student_df['Matric No'] if 'Matric No' in student_df.columns else student_df.index
+    # The sheet decides STUDENT_STATUS, so it is part of a student row's hash
+    student_mask, student_section = changed_rows(student_df, student_keys, state.get("students", {}),
+                                                 context=sheet_name)
+    score_rows = score_df.iloc[1:]  # first row is the sheet's sub-header
+    score_mask, score_section = changed_rows(score_rows, score_rows.iloc[:, 0], state.get("scores", {}))
 
     results = {
         "files": output_files,
-        "students": {"inserted": 0, "updated": 0, "errors": 0},
-        "scores": {"inserted": 0, "updated": 0, "errors": 0},
+        "unchanged": False,
+        "students": {"inserted": 0, "updated": 0, "errors": 0, "unchanged": int((~student_mask).sum())},
+        "scores": {"inserted": 0, "updated": 0, "errors": 0, "unchanged": int((~score_mask).sum())},
     }
 
     # Import into STUDENTS first (so scores can safely reference MATRIC_NO)
-    if student_csv:
-        student_inserts, student_updates, student_errors = import_student_info(student_csv)
-        results["students"] = {"inserted": student_inserts, "updated": student_updates, "errors": student_errors}
+    progress("students", 0)
+    student_errors = 0
+    if student_mask.any():
+        student_inserts, student_updates, student_errors = import_student_info(
+            student_df[student_mask], student_status=student_status_from_name(sheet_name))
+        results["students"].update({"inserted": student_inserts, "updated": student_updates, "errors": student_errors})
 
     # Then import into STUDENT_SCORE
-    if score_csv:
-        score_inserts, score_updates, score_errors = import_student_scores(score_csv)
-        results["scores"] = {"inserted": score_inserts, "updated": score_updates, "errors": score_errors}
+    progress("scores", len(student_df))
+    score_errors = 0
+    if score_mask.any():
+        score_inserts, score_updates, score_errors = import_student_scores(
+            pd.concat([score_df.iloc[:1], score_rows[score_mask]]))
+        results["scores"].update({"inserted": score_inserts, "updated": score_updates, "errors": score_errors})
+    progress("scores", len(student_df) + len(score_rows))
+
+    # Both imports have committed (they raise otherwise, leaving the saved state alone).
+    # Remember what is now in the DB; a section with errors keeps its old hashes so those rows are retried.
+    # The version is read after the commits, so any later write elsewhere invalidates the hashes
+    new_state = {
+        "students": student_section if student_errors == 0 else state.get("students", {}),
+        "scores": score_section if score_errors == 0 else state.get("scores", {}),
+        "db_version": datasheet_db_version(),
+    }
+    if student_errors == 0 and score_errors == 0:
+        new_state.update({"file_sha256": file_hash, "sheet": sheet_name})
+    save_import_state(DATASHEET_STATE_SCOPE, new_state)
 
     return results
 
 
-def import_marksheet(xlsm_path: str, batch_size: int = 200):
+# Marksheet columns by index (0-based): F = CU-ID, J = score, K = note ('Mark copied')
+MARKSHEET_CU_ID_COL = 5
+MARKSHEET_SCORE_COL = 9
+MARKSHEET_NOTE_COL = 10
+
+def _cell_value(value):
+    """Match pandas' openpyxl cell handling: whole-number floats come back as int"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def _iter_marksheet_rows(ws):
+    """
+    Stream (cu_id, score, note) from columns F, J and K of one worksheet, header row skipped.
+    Blank rows between data rows are yielded as (None, None, None) so they count as skipped,
+    trailing blank rows are dropped (same row set pd.read_excel would produce).
+    """
+    rows = ws.iter_rows(values_only=True)
+    if next(rows, None) is None:
+        return
+
+    pending_blank = 0
+    for row in rows:
+        if all(v is None for v in row):
+            pending_blank += 1
+            continue
+        for _ in range(pending_blank):
+            yield None, None, None
+        pending_blank = 0
+
+        width = len(row)
+        yield tuple(
+            _cell_value(row[idx]) if idx < width else None
+            for idx in (MARKSHEET_CU_ID_COL, MARKSHEET_SCORE_COL, MARKSHEET_NOTE_COL)
+        )
+
+def iter_marksheet_sheets(xlsm_path):
+    """
+    Open a marksheet workbook once (read-only, streamed) and yield
+    (sheet_name, short_code, rows) for each '{COURSE_CODE} - BCSCU' sheet.
+    `rows` lazily yields (cu_id, score, note) tuples; only one row is materialized at a time.
+    """
+    wb = openpyxl.load_workbook(xlsm_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        for sheet_name in wb.sheetnames:
+            m = COURSE_SHEET_RE.match(sheet_name)
+            if not m:
+                continue
+            ws = wb[sheet_name]
+            # Read-only sheets trust the stored <dimension>, which macro workbooks often get wrong
+            ws.reset_dimensions()
+            yield sheet_name, m.group(1).upper().strip(), _iter_marksheet_rows(ws)
+    finally:
+        wb.close()
+
+# Writes only the attempts the marksheet set (SET_n = 1), so score edits or imports committed
+# since the sheet's rows were read are not overwritten with that snapshot
+MARKSHEET_SCORE_UPDATE_SQL = """
+    UPDATE s
+       SET ATTEMPT_1 = CASE WHEN p.SET_1 = 1 THEN p.ATTEMPT_1 ELSE s.ATTEMPT_1 END,
+           ATTEMPT_2 = CASE WHEN p.SET_2 = 1 THEN p.ATTEMPT_2 ELSE s.ATTEMPT_2 END,
+           ATTEMPT_3 = CASE WHEN p.SET_3 = 1 THEN p.ATTEMPT_3 ELSE s.ATTEMPT_3 END,
+           A1_UPDATED_AT = CASE WHEN p.SET_1 = 1 THEN p.UPDATED_AT ELSE s.A1_UPDATED_AT END,
+           A2_UPDATED_AT = CASE WHEN p.SET_2 = 1 THEN p.UPDATED_AT ELSE s.A2_UPDATED_AT END,
+           A3_UPDATED_AT = CASE WHEN p.SET_3 = 1 THEN p.UPDATED_AT ELSE s.A3_UPDATED_AT END
+      FROM dbo.STUDENT_SCORE s
+      JOIN (SELECT ? AS SET_1, ? AS SET_2, ? AS SET_3, ? AS ATTEMPT_1, ? AS ATTEMPT_2, ? AS ATTEMPT_3,
+                   ? AS UPDATED_AT, ? AS SCORE_ID) AS p
+        ON s.SCORE_ID = p.SCORE_ID
+"""
+
+def load_cu_id_map(cursor):
+    """
+    CU_ID -> MATRIC_NO for every student, loaded in one scan.
+    Keys follow TRY_CONVERT(INT, CU_ID) semantics: only CU_IDs that parse as an integer are mapped.
+    """
+    cu_map = {}
+    cursor.execute("SELECT CU_ID, MATRIC_NO FROM dbo.STUDENTS WHERE CU_ID IS NOT NULL")
+    for cu_id, matric_no in cursor.fetchall():
+        try:
+            key = int(str(cu_id).strip())
+        except ValueError:
+            continue
+        cu_map.setdefault(key, matric_no)
+    return cu_map
+
+def load_course_score_rows(cursor, course_code):
+    """
+    Existing STUDENT_SCORE rows for one course, keyed by MATRIC_NO.rstrip().upper() (the DB matches
+    MATRIC_NO ignoring case and trailing blanks):
+    [SCORE_ID, ATTEMPT_1, ATTEMPT_2, ATTEMPT_3, A1_UPDATED_AT, A2_UPDATED_AT, A3_UPDATED_AT, COURSE_CLASSIFICATION]
+    """
+    cursor.execute("""
+        SELECT s.MATRIC_NO, s.SCORE_ID, s.ATTEMPT_1, s.ATTEMPT_2, s.ATTEMPT_3,
+               s.A1_UPDATED_AT, s.A2_UPDATED_AT, s.A3_UPDATED_AT,
+               cs.COURSE_CLASSIFICATION
+        FROM dbo.STUDENT_SCORE s
+        LEFT JOIN dbo.COURSE_STRUCTURE cs ON cs.COURSE_CODE = s.COURSE_CODE
+        WHERE s.COURSE_CODE = ?
+    """, (course_code,))
+    rows = {}
+    for r in cursor.fetchall():
+        rows.setdefault(str(r[0]).rstrip().upper(), list(r[1:]))
+    return rows
+
+def _is_dash(v):
+    return (v is None) or (str(v).strip() == "-")
+
+def pick_marksheet_attempt(rec):
+    """
+    Index (0, 1, 2) of the attempt a marksheet score goes into, or None if every attempt is taken.
+    - MPU: first empty of A1/A2, otherwise whichever of A1/A2 was updated longest ago (A1 if no timestamps)
+    - Others: first empty of A1/A2/A3
+    """
+    attempts = rec[1:4]
+    stamps = rec[4:7]
+    if (rec[7] or "").upper() == "MPU":
+        for idx in (0, 1):
+            if _is_dash(attempts[idx]):
+                return idx
+        updated_times = [(idx, stamps[idx]) for idx in (0, 1) if stamps[idx] is not None]
+        if updated_times:
+            updated_times.sort(key=lambda x: x[1])
+            return updated_times[0][0]
+        return 0
+    for idx in (0, 1, 2):
+        if _is_dash(attempts[idx]):
+            return idx
+    return None
+
+def import_marksheet(xlsm_path: str, batch_size: int = 200, progress=None):
     """
     Imports marks from an .xlsm file:
     - Processes sheets named '{COURSE_CODE} - BCSCU'
     - Valid row: col F (CU-ID) is int AND col K contains 'Mark copied'
     - Writes score from col J into STUDENT_SCORE for (MATRIC_NO, COURSE_CODE)
       following core vs MPU attempt rules.
+    CU_ID -> MATRIC_NO is loaded once per import and the course's score rows once per sheet;
+    targets are decided in memory and each sheet is written with one batched UPDATE keyed by SCORE_ID
+    that touches only the attempts the sheet set.
+    progress(stage, rows_processed) is called once per sheet when given (see import_jobs).
     """
+    progress = progress or (lambda stage, rows_processed=None: None)
     conn = None
     cur = None
     updated = 0
@@ -958,103 +1580,38 @@ def import_marksheet(xlsm_path: str, batch_size: int = 200):
     # Generate timestamp for UPDATED_AT
     import_timestamp = datetime.now()
 
-    # Mapping to prevent SQL injection
-    ATTEMPT_UPDATES = {
-        "ATTEMPT_1": """
-            UPDATE dbo.STUDENT_SCORE
-            SET ATTEMPT_1 = ?, A1_UPDATED_AT = ?
-            WHERE MATRIC_NO = ? AND COURSE_CODE = ?
-        """,
-        "ATTEMPT_2": """
-            UPDATE dbo.STUDENT_SCORE
-            SET ATTEMPT_2 = ?, A2_UPDATED_AT = ?
-            WHERE MATRIC_NO = ? AND COURSE_CODE = ?
-        """,
-        "ATTEMPT_3": """
-            UPDATE dbo.STUDENT_SCORE
-            SET ATTEMPT_3 = ?, A3_UPDATED_AT = ?
-            WHERE MATRIC_NO = ? AND COURSE_CODE = ?
-        """
-    }
-
     try:
-        # Discover sheet names then close handle immediately
-        wb = pd.ExcelFile(xlsm_path, engine="openpyxl")
-        try:
-            sheet_names = list(wb.sheet_names)
-        finally:
-            try: wb.close()
-            except Exception: pass
-
-        matching = [sn for sn in sheet_names if COURSE_SHEET_RE.match(sn)]
-        if not matching:
-            logging.info("[INGEST] No matching sheets found in %s", xlsm_path)
-            return {"updated": 0, "skipped": 0, "sheets": 0}
-
         # Connect
         conn = get_db_connection()
         cur = conn.cursor()
         logging.debug("Connected to DB for import_marksheet")
 
-        # Precompiled queries
-        # q_get_matric = """
-        #   SELECT MATRIC_NO FROM STUDENTS WHERE TRY_CONVERT(INT, CU_ID) = ?
-        # """
-        q_get_matric = "SELECT MATRIC_NO FROM STUDENTS WHERE TRY_CONVERT(INT, CU_ID) = ?"
-        q_get_row = """
-          SELECT s.SCORE_ID, s.ATTEMPT_1, s.ATTEMPT_2, s.ATTEMPT_3,
-                 s.A1_UPDATED_AT, s.A2_UPDATED_AT, s.A3_UPDATED_AT,
-                 cs.COURSE_CLASSIFICATION
-          FROM dbo.STUDENT_SCORE s
-          LEFT JOIN dbo.COURSE_STRUCTURE cs ON cs.COURSE_CODE = s.COURSE_CODE
-          WHERE s.MATRIC_NO = ? AND s.COURSE_CODE = ?
-        """
-        # q_update_attempt = lambda col: f"""
-        #   UPDATE dbo.STUDENT_SCORE
-        #      SET {col} = ?, LAST_UPDATED = ?
-        #    WHERE MATRIC_NO = ? AND COURSE_CODE = ?
-        # """
-
-        # processed_sheets = 0
+        cu_map = load_cu_id_map(cur)
+        resolver = get_course_code_resolver(conn)
+        logging.debug("[INGEST] Loaded %d CU_ID mappings", len(cu_map))
 
-        for sheet_name in matching:
-            m = COURSE_SHEET_RE.match(sheet_name)
-            short_code = m.group(1).upper().strip()
+        # Single streaming pass over the workbook: only '{CODE} - BCSCU' sheets, only columns F/J/K
+        for sheet_name, short_code, rows in iter_marksheet_sheets(xlsm_path):
 
             # 1) Resolve the sheet short code to the canonical DB COURSE_CODE once per sheet
-            resolved_code = resolve_course_code(conn, short_code)
+            resolved_code = resolver.resolve(short_code)
             if not resolved_code:
                 logging.warning("[INGEST] Sheet %s: cannot resolve course code for '%s', skipping sheet",
                                 sheet_name, short_code)
                 # Count all rows in this sheet as skipped to keep tallies honest
-                # We need the DF to know how many rows; load then skip.
-                df_tmp = pd.read_excel(xlsm_path, sheet_name=sheet_name, engine="openpyxl", header=0)
-                skipped += len(df_tmp)
+                skipped += sum(1 for _ in rows)
                 processed_sheets += 1
                 logging.info("[INGEST] Sheet %s processed. cumulative updated=%d skipped=%d",
                              sheet_name, updated, skipped)
+                progress(f"sheet {sheet_name}", updated + skipped)
                 continue
 
-            # Load sheet data (after resolution)
-            df = pd.read_excel(xlsm_path, sheet_name=sheet_name, engine="openpyxl", header=0)
-
-            # Column positions by index (0-based): F=5, J=9, K=10
-            col_f_idx = 5
-            col_j_idx = 9
-            col_k_idx = 10
-            ncols = df.shape[1]
-            if ncols <= max(col_f_idx, col_j_idx, col_k_idx):
-                logging.warning("[INGEST] Sheet %s: not enough columns, skipping", sheet_name)
-                skipped += len(df)
-                processed_sheets += 1
-                logging.info("[INGEST] Sheet %s processed. cumulative updated=%d skipped=%d",
-                             sheet_name, updated, skipped)
-                continue
+            # 2) Existing attempts for this course, by MATRIC_NO
+            score_rows = load_course_score_rows(cur, resolved_code)
+            changed = {}   # SCORE_ID -> (row state after this sheet, attempt indexes it set)
 
-            for _, row in df.iterrows():
-                cu_raw = row.iloc[col_f_idx]
-                note = str(row.iloc[col_k_idx]).strip().lower() if pd.notna(row.iloc[col_k_idx]) else ""
-                score_raw = row.iloc[col_j_idx]
+            for cu_raw, score_raw, note_raw in rows:
+                note = str(note_raw).strip().lower() if note_raw is not None else ""
 
                 # Validations
                 try:
@@ -1074,109 +1631,56 @@ def import_marksheet(xlsm_path: str, batch_size: int = 200):
                     if score_val == "":
                         score_val = "-"
 
-                # CU_ID -> MATRIC_NO
-                cur.execute(q_get_matric, (cu_id,))
-                r = cur.fetchone()
-                if not r:
-                    skipped += 1
-                    continue
-                matric_no = r[0]
-
-                # 2) Use resolved_code for DB lookups/updates instead of the sheet short code
-                cur.execute(q_get_row, (matric_no, resolved_code))
-                rec = cur.fetchone()
-                if not rec:
+                # CU_ID -> MATRIC_NO -> score row
+                matric_no = cu_map.get(cu_id)
+                rec = score_rows.get(str(matric_no).rstrip().upper()) if matric_no is not None else None
+                if rec is None:
                     skipped += 1
                     continue
 
-                (_score_id, a1, a2, a3, s1, s2, s3, cls) = rec
-                cls = (cls or "").upper()
-
-                def is_dash(v):
-                    return (v is None) or (str(v).strip() == "-")
-
-                # Decide target
-                target = None
-                if cls == "MPU":
-                    if is_dash(a1):
-                        target = "ATTEMPT_1"
-                    elif is_dash(a2):
-                        target = "ATTEMPT_2"
-                    else:
-                        # Both A1 and A2 are filled, find the oldest updated one
-                        # Only consider A1_UPDATED_AT and A2_UPDATED_AT
-                        updated_times = []
-                        if s1 is not None: updated_times.append(("ATTEMPT_1", s1))
-                        if s2 is not None: updated_times.append(("ATTEMPT_2", s2))
-
-                        if updated_times:
-                            # Sort by timestamp (oldest first)
-                            updated_times.sort(key=lambda x: x[1])
-                            target = updated_times[0][0]
-                        else:
-                            # If no timestamps, default to ATTEMPT_1 (or skip if no clear rule)
-                            target = "ATTEMPT_1" # Default to A1 if no timestamps to compare
-
-                    # For MPU, ATTEMPT_3 is always N/A, so we need to ensure it's set if not already
-                    # This will be handled by the ATTEMPT_UPDATES dict if target is A1 or A2
-                    # If target is A1 or A2, we also need to ensure A3 is N/A
-                    # This requires a slightly different update query for MPU
-                    # For simplicity, let's ensure A3 is N/A in the update query itself
-                    # This will be handled by a separate update if needed, or by the main update if A3 is part of it
-
-                else: # Non-MPU
-                    if is_dash(a1):
-                        target = "ATTEMPT_1"
-                    elif is_dash(a2):
-                        target = "ATTEMPT_2"
-                    elif is_dash(a3):
-                        target = "ATTEMPT_3"
-                    # If all are filled, target remains None, and we skip the update
-
-                if target is None:
+                idx = pick_marksheet_attempt(rec)
+                if idx is None:
                     skipped += 1
                     continue
 
-                # Construct the update query dynamically based on target and MPU status
-                update_query_parts = []
-                update_params = []
-
-                # Always update the target attempt and its timestamp
-                update_query_parts.append(f"{target} = ?")
-                update_query_parts.append(f"A{target.split('_')[1]}_UPDATED_AT = ?")
-                update_params.append(score_val)
-                update_params.append(import_timestamp)
-
-                # Special handling for MPU ATTEMPT_3
-                if cls == "MPU" and str(a3).strip().upper() != "N/A":
-                    update_query_parts.append("ATTEMPT_3 = ?")
-                    update_query_parts.append("A3_UPDATED_AT = ?")
-                    update_params.append("N/A")
-                    update_params.append(import_timestamp)
-
-                final_update_query = f"""
-                    UPDATE dbo.STUDENT_SCORE
-                    SET {', '.join(update_query_parts)}
-                    WHERE MATRIC_NO = ? AND COURSE_CODE = ?
-                """
-                cur.execute(final_update_query, (*update_params, matric_no, resolved_code))
-            
-            # Log details of the update
-            if cur.rowcount > 0:
-                logging.info("[INGEST] Updated %s for %s (%s) with score %s",
-                             matric_no, resolved_code, target, score_val)
+                # Apply in memory so a repeated student on the same sheet sees the new state
+                rec[1 + idx] = score_to_db_text(score_val)
+                rec[4 + idx] = import_timestamp
+                touched = changed.setdefault(rec[0], (rec, set()))[1]
+                touched.add(idx)
+                # For MPU, ATTEMPT_3 is always N/A
+                if (rec[7] or "").upper() == "MPU" and str(rec[3]).strip().upper() != "N/A":
+                    rec[3] = "N/A"
+                    rec[6] = import_timestamp
+                    touched.add(2)
+
+                logging.debug("[INGEST] Updated %s for %s (ATTEMPT_%d) with score %s",
+                              matric_no, resolved_code, idx + 1, score_val)
                 updated += 1
-            else:
-                logging.warning("[INGEST] No rows updated for %s (Course: %s, Attempt: %s) with score %s. Check if record exists or score is identical.",
-                                matric_no, resolved_code, target, score_val)
-                skipped += 1 # Count as skipped if no row was affected
 
-            if updated % batch_size == 0:
+            # 3) One batched UPDATE per sheet
+            if changed:
+                params = [
+                    (*(int(i in touched) for i in (0, 1, 2)), *rec[1:4], import_timestamp, score_id)
+                    for score_id, (rec, touched) in changed.items()
+                ]
+                cur.fast_executemany = True
+                cur.setinputsizes([(pyodbc.SQL_INTEGER, 0, 0)] * 3
+                                  + [(pyodbc.SQL_WVARCHAR, 100, 0)] * 3
+                                  + [(pyodbc.SQL_TYPE_TIMESTAMP, 23, 3), (pyodbc.SQL_INTEGER, 0, 0)])
+                for start in range(0, len(params), batch_size):
+                    cur.executemany(MARKSHEET_SCORE_UPDATE_SQL, params[start:start + batch_size])
+                cur.fast_executemany = False
+                cur.setinputsizes(None)
                 conn.commit()
 
             processed_sheets += 1
             logging.info("[INGEST] Sheet %s processed. cumulative updated=%d skipped=%d",
                          sheet_name, updated, skipped)
+            progress(f"sheet {sheet_name}", updated + skipped)
+
+        if processed_sheets == 0:
+            logging.info("[INGEST] No matching sheets found in %s", xlsm_path)
 
         conn.commit()
         logging.info("[INGEST] Completed import_marksheet. updated=%d skipped=%d sheets=%d",
@@ -1196,4 +1700,4 @@ def import_marksheet(xlsm_path: str, batch_size: int = 200):
         try:
             if conn: conn.close()
         except Exception:
-            pass
\ No newline at end of file
+            pass
@@ -1,4 +1,5 @@
-import pyodbc
+import pyodbc, threading
+from bisect import bisect_left
 from src.db.core import get_db_connection
 
 def get_year_1_course_codes():
@@ -23,4 +24,138 @@ def get_year_1_course_codes():
                 cursor.close()
         finally:
             if conn is not None:
-                conn.close()
\ No newline at end of file
+                conn.close()
+
+class CourseCodeResolver:
+    """
+    In-memory index over the distinct COURSE_STRUCTURE.COURSE_CODEs, used to map marksheet
+    short codes like '120CT' to canonical codes like 'INT120CT' without LIKE scans.
+    Precedence and ambiguity rules match the original SQL lookups:
+      1) Exact (case-insensitive) match
+      2) Startswith / endswith match (on a tie, a single endswith candidate wins)
+      3) Contains match
+    """
+
+    def __init__(self, codes, fingerprint=None):
+        self.fingerprint = fingerprint
+        self._exact = {}
+        entries = set()
+        for code in codes:
+            if code is None:
+                continue
+            code = str(code)
+            upper = code.upper()
+            # '=' ignores trailing spaces in SQL Server, LIKE does not
+            self._exact.setdefault(upper.rstrip(), set()).add(code)
+            entries.add((upper, code))
+        self._entries = sorted(entries)
+        self._prefix_keys = [u for u, _ in self._entries]
+        self._suffix = sorted((u[::-1], c) for u, c in self._entries)
+        self._suffix_keys = [r for r, _ in self._suffix]
+
+    @staticmethod
+    def _range(keys, values, needle):
+        i = bisect_left(keys, needle)
+        out = set()
+        while i < len(keys) and keys[i].startswith(needle):
+            out.add(values[i][1])
+            i += 1
+        return out
+
+    def resolve(self, short_code: str) -> str | None:
+        """Single COURSE_CODE for the short code, or None if ambiguous/not found"""
+        sc = short_code.upper().strip()
+
+        # 1) exact
+        exact = self._exact.get(sc.rstrip(), ())
+        if len(exact) == 1:
+            return next(iter(exact))
+
+        # 2) startswith / endswith
+        startswith = self._range(self._prefix_keys, self._entries, sc)
+        endswith = self._range(self._suffix_keys, self._suffix, sc[::-1])
+        candidates = startswith | endswith
+        if len(candidates) == 1:
+            return next(iter(candidates))
+        if len(candidates) > 1:
+            # Prefer ones that look like a prefix before the code (e.g., INT + code)
+            if len(endswith) == 1:
+                return next(iter(endswith))
+
+        # 3) contains (broadest)
+        contains = {c for u, c in self._entries if sc in u}
+        if len(contains) == 1:
+            return next(iter(contains))
+
+        # Not found or ambiguous
+        return None
+
+
+_COURSE_CODE_RESOLVER = None
+_COURSE_CODE_RESOLVER_LOCK = threading.Lock()
+
+
+def _course_structure_fingerprint(cursor):
+    cursor.execute("SELECT COUNT_BIG(*), CHECKSUM_AGG(CHECKSUM(COURSE_CODE)) FROM COURSE_STRUCTURE")
+    return tuple(cursor.fetchone())
+
+
+def get_course_code_resolver(conn):
+    """
+    Shared CourseCodeResolver, rebuilt only when COURSE_STRUCTURE's course codes change.
+    Costs one aggregate query per call; fetch it once per import and reuse it across sheets.
+    """
+    global _COURSE_CODE_RESOLVER
+    with conn.cursor() as cur:
+        fingerprint = _course_structure_fingerprint(cur)
+        with _COURSE_CODE_RESOLVER_LOCK:
+            resolver = _COURSE_CODE_RESOLVER
+            if resolver is not None and resolver.fingerprint == fingerprint:
+                return resolver
+        cur.execute("SELECT DISTINCT COURSE_CODE FROM COURSE_STRUCTURE WHERE COURSE_CODE IS NOT NULL")
+        resolver = CourseCodeResolver((r[0] for r in cur.fetchall()), fingerprint)
+    with _COURSE_CODE_RESOLVER_LOCK:
+        _COURSE_CODE_RESOLVER = resolver
+    return resolver
+
+
+def invalidate_course_code_resolver():
+    """Drop the cached resolver (call after writing COURSE_STRUCTURE)"""
+    global _COURSE_CODE_RESOLVER
+    with _COURSE_CODE_RESOLVER_LOCK:
+        _COURSE_CODE_RESOLVER = None
+
+
+def current_scores_version(cursor):
+    """
+    Highest STUDENT_SCORE change version (ROW_VER) that is safe to hand out: every row version at or
+    below it belongs to a committed transaction, so a later ?since= never skips an in-flight write.
+    """
+    cursor.execute("SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) - 1")
+    return int(cursor.fetchone()[0])
+
+
+
+# Cache key for STUDENT_SCORE: MIN_ACTIVE_ROWVERSION() plus the count and checksum of the committed
+# row versions at or above it (score rows and delete tombstones; READPAST skips rows an open
+# transaction still holds). MIN_ACTIVE_ROWVERSION() alone stands still while any transaction is
+# open, and MAX(ROW_VER) misses a commit whose rows got their versions before the newest committed
+# one; together they change with every commit. With nothing in flight the range is empty.
+SCORES_STAMP_SQL = """
+SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) AS MIN_ACTIVE,
+       COUNT_BIG(*) AS COMMITTED_ABOVE,
+       ISNULL(CHECKSUM_AGG(CHECKSUM(ROW_VER)), 0) AS COMMITTED_CHECKSUM
+FROM (
+    SELECT CAST(ROW_VER AS BIGINT) AS ROW_VER FROM STUDENT_SCORE WITH (READPAST)
+    WHERE ROW_VER >= MIN_ACTIVE_ROWVERSION()
+    UNION ALL
+    SELECT CAST(ROW_VER AS BIGINT) FROM STUDENT_SCORE_TOMBSTONES WITH (READPAST)
+    WHERE ROW_VER >= MIN_ACTIVE_ROWVERSION()
+) AS committed
+"""
+
+
+def scores_stamp(cursor):
+    """(min active version, committed changes above it, their checksum); see SCORES_STAMP_SQL"""
+    cursor.execute(SCORES_STAMP_SQL)
+    return tuple(int(v) for v in cursor.fetchone())
@@ -0,0 +1,394 @@
+# src/services/feature_engine.py
+#
+# Graduation-model feature engine shared by training (train_graduation_prediction_model*.py)
+# and serving (student_features.refresh_student_features).
+# Raw ATTEMPT_1..3 text is pulled once, parsed into a numeric score matrix plus a matrix of
+# sentinel codes, and every per-student feature is computed with array/groupby operations.
+# The rules mirror the original T-SQL (ISNUMERIC/CAST, NOT IN on case-insensitive text);
+# REFERENCE_FEATURE_SQL keeps that query so parity_check() can compare the two.
+#
+# Parity check: python -m src.services.feature_engine [--status Active]
+
+import argparse, logging
+import numpy as np
+import pandas as pd
+from src.db.core import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+ATTEMPT_COLUMNS = ['ATTEMPT_1', 'ATTEMPT_2', 'ATTEMPT_3']
+
+# Model feature columns, in STUDENT_FEATURES / extract_student_features order
+FEATURE_COLUMNS = [
+    'entry_year_level', 'total_courses', 'exempted_courses', 'actual_courses_taken',
+    'courses_passed_first_attempt', 'courses_with_2_attempts', 'courses_with_3_attempts',
+    'total_courses_needing_resits', 'total_first_attempt_failures', 'courses_never_passed',
+    'courses_passed_after_failing', 'avg_first_attempt_score', 'lowest_first_attempt_score',
+    'first_attempt_score_std_dev', 'avg_final_score', 'lowest_final_score', 'highest_final_score',
+    'courses_with_distinction_first_attempt', 'courses_barely_passed_first_attempt',
+    'courses_capped_at_40', 'courses_still_failing', 'first_attempt_pass_rate', 'resit_rate',
+    'first_attempt_failure_rate', 'third_attempt_rate', 'resit_success_rate',
+]
+
+# Sentinel codes for a parsed attempt cell
+KIND_SCORE = 0       # numeric mark (value in the score matrix)
+KIND_DASH = 1        # '-' (not attempted)
+KIND_EXEMPTED = 2    # 'Exempted'
+KIND_NA = 3          # 'N/A' (e.g. MPU third attempt)
+KIND_NULL_TEXT = 4   # the literal text 'NULL'
+KIND_SESSION = 5     # any other text: session codes, deferrals, notes
+KIND_MISSING = 6     # SQL NULL
+
+_TEXT_KINDS = {'-': KIND_DASH, 'EXEMPTED': KIND_EXEMPTED, 'N/A': KIND_NA, 'NULL': KIND_NULL_TEXT}
+
+RAW_SCORES_SQL = """
+SELECT MATRIC_NO, COURSE_CODE, ATTEMPT_1, ATTEMPT_2, ATTEMPT_3
+FROM STUDENT_SCORE
+WHERE MATRIC_NO IS NOT NULL
+"""
+
+
+def _parse_cell(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return KIND_MISSING, np.nan
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return KIND_SCORE, float(value)
+    text = str(value)
+    # SQL Server '=' / NOT IN: case-insensitive, trailing blanks ignored
+    kind = _TEXT_KINDS.get(text.rstrip().upper())
+    if kind is not None:
+        return kind, np.nan
+    if "_" in text:
+        return KIND_SESSION, np.nan  # float() accepts '1_000', ISNUMERIC does not
+    try:
+        number = float(text.strip())
+    except ValueError:
+        return KIND_SESSION, np.nan
+    if not np.isfinite(number):
+        return KIND_SESSION, np.nan  # ISNUMERIC('inf') / ('nan') is 0
+    return KIND_SCORE, number
+
+
+def parse_attempts(frame):
+    """
+    ATTEMPT_1..3 text -> (kinds int8 matrix, scores float matrix), both shaped (rows, 3).
+    Each distinct cell value is parsed once; scores is NaN wherever kinds != KIND_SCORE.
+    """
+    values = frame[ATTEMPT_COLUMNS].to_numpy(dtype=object)
+    codes, distinct = pd.factorize(values.ravel(), use_na_sentinel=True)
+    parsed = [_parse_cell(v) for v in distinct] + [(KIND_MISSING, np.nan)]  # code -1 -> last entry
+    kinds = np.array([k for k, _ in parsed], dtype=np.int8)[codes].reshape(values.shape)
+    scores = np.array([s for _, s in parsed], dtype=float)[codes].reshape(values.shape)
+    return kinds, scores
+
+
+def compute_student_features(raw):
+    """
+    Per-student graduation features from raw STUDENT_SCORE rows.
+
+    Args:
+        raw: DataFrame with MATRIC_NO, COURSE_CODE, ATTEMPT_1, ATTEMPT_2, ATTEMPT_3 (one row per score row)
+
+    Returns:
+        DataFrame indexed by MATRIC_NO with FEATURE_COLUMNS (same values the reference SQL produces)
+    """
+    if raw.empty:
+        return pd.DataFrame(columns=FEATURE_COLUMNS, index=pd.Index([], name='MATRIC_NO'))
+
+    kinds, scores = parse_attempts(raw)
+    k1, k2, k3 = kinds[:, 0], kinds[:, 1], kinds[:, 2]
+    s1, s2, s3 = scores[:, 0], scores[:, 1], scores[:, 2]
+
+    # CASE WHEN x NOT IN (...) / x != '-' is false for SQL NULL
+    attempts = ((k1 != KIND_DASH) & (k1 != KIND_EXEMPTED) & (k1 != KIND_MISSING)).astype(np.int8) \
+        + ((k2 != KIND_DASH) & (k2 != KIND_MISSING)).astype(np.int8) \
+        + ((k3 != KIND_DASH) & (k3 != KIND_NULL_TEXT) & (k3 != KIND_MISSING)).astype(np.int8)
+    is_exempted = (k1 == KIND_EXEMPTED)
+    first = s1  # numeric first attempts only; '-' / 'Exempted' / text are NaN already
+    final = np.where(~np.isnan(s3), s3, np.where(~np.isnan(s2), s2, s1))
+    failed_first = first < 40
+    passed = (s3 >= 40) | (s2 >= 40) | (s1 >= 40)
+
+    # GROUP BY MATRIC_NO / COUNT(DISTINCT COURSE_CODE) compare case-insensitively without trailing blanks
+    matric_key = raw['MATRIC_NO'].astype(str).str.rstrip().str.upper().to_numpy()
+    course_key = raw['COURSE_CODE'].map(lambda c: None if c is None or c != c else str(c).rstrip().upper())
+
+    rows = pd.DataFrame({
+        'key': matric_key,
+        'course': course_key.to_numpy(),
+        'attempts': attempts,
+        'is_exempted': is_exempted.astype(np.int64),
+        'failed_first': failed_first.astype(np.int64),
+        'first': first,
+        'final': final,
+        'one': (attempts == 1).astype(np.int64),
+        'two': (attempts == 2).astype(np.int64),
+        'three': (attempts == 3).astype(np.int64),
+        'resit': (attempts >= 2).astype(np.int64),
+        'never_passed': (failed_first & ~passed).astype(np.int64),
+        'passed_after_failing': (failed_first & passed).astype(np.int64),
+        'distinction': (first >= 70).astype(np.int64),
+        'barely': ((first >= 40) & (first < 50)).astype(np.int64),
+        'capped': ((final == 40) & (attempts > 1)).astype(np.int64),
+        'still_failing': (final < 40).astype(np.int64),
+    })
+    g = rows.groupby('key', sort=True)
+    sums = g[['is_exempted', 'one', 'two', 'three', 'resit', 'failed_first', 'never_passed',
+              'passed_after_failing', 'distinction', 'barely', 'capped', 'still_failing']].sum()
+    total_courses = g['course'].nunique()
+
+    out = pd.DataFrame(index=sums.index)
+    out['entry_year_level'] = np.where(sums['is_exempted'] > 0, 2, 1)
+    out['total_courses'] = total_courses
+    out['exempted_courses'] = sums['is_exempted']
+    out['actual_courses_taken'] = total_courses - sums['is_exempted']
+    out['courses_passed_first_attempt'] = sums['one']
+    out['courses_with_2_attempts'] = sums['two']
+    out['courses_with_3_attempts'] = sums['three']
+    out['total_courses_needing_resits'] = sums['resit']
+    out['total_first_attempt_failures'] = sums['failed_first']
+    out['courses_never_passed'] = sums['never_passed']
+    out['courses_passed_after_failing'] = sums['passed_after_failing']
+    out['avg_first_attempt_score'] = g['first'].mean()
+    out['lowest_first_attempt_score'] = g['first'].min()
+    out['first_attempt_score_std_dev'] = g['first'].std(ddof=1)  # STDEV: sample, NULL below 2 values
+    out['avg_final_score'] = g['final'].mean()
+    out['lowest_final_score'] = g['final'].min()
+    out['highest_final_score'] = g['final'].max()
+    out['courses_with_distinction_first_attempt'] = sums['distinction']
+    out['courses_barely_passed_first_attempt'] = sums['barely']
+    out['courses_capped_at_40'] = sums['capped']
+    out['courses_still_failing'] = sums['still_failing']
+
+    taken = out['actual_courses_taken'].where(out['actual_courses_taken'] != 0).astype(float)
+    resits = out['total_courses_needing_resits'].where(out['total_courses_needing_resits'] != 0).astype(float)
+    out['first_attempt_pass_rate'] = out['courses_passed_first_attempt'] / taken
+    out['resit_rate'] = out['total_courses_needing_resits'] / taken
+    out['first_attempt_failure_rate'] = out['total_first_attempt_failures'] / taken
+    out['third_attempt_rate'] = out['courses_with_3_attempts'] / resits
+    out['resit_success_rate'] = out['courses_capped_at_40'] / resits
+
+    # Report each student under the first MATRIC_NO spelling seen
+    first_spelling = pd.Series(raw['MATRIC_NO'].to_numpy(), index=matric_key)
+    first_spelling = first_spelling[~first_spelling.index.duplicated()]
+    out.index = pd.Index(first_spelling.reindex(out.index).to_numpy(), name='MATRIC_NO')
+    return out[FEATURE_COLUMNS]
+
+
+def fetch_raw_scores(conn, where=None, params=()):
+    """Raw STUDENT_SCORE rows (MATRIC_NO, COURSE_CODE, ATTEMPT_1..3), optionally filtered by a WHERE fragment"""
+    sql = RAW_SCORES_SQL + (f" AND {where}" if where else "")
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, list(params))
+        rows = [tuple(r) for r in cur.fetchall()]
+    finally:
+        cur.close()
+    return pd.DataFrame(rows, columns=['MATRIC_NO', 'COURSE_CODE'] + ATTEMPT_COLUMNS, dtype=object)
+
+
+def graduation_labels(students, features):
+    """
+    Training labels for graduates, same rules as the original SQL:
+    GRADUATED_ON like 'S23/4...' -> graduated 2023, month 4; expected_years is 2 for exempted
+    (year-2 entry) students, else 3; on time if graduated no later than COHORT + expected_years
+    (same month or earlier).
+
+    Args:
+        students: DataFrame with MATRIC_NO, COHORT, GRADUATED_ON (graduates only)
+        features: compute_student_features output
+
+    Returns:
+        DataFrame: label columns + FEATURE_COLUMNS for students that have score rows
+    """
+    students = students[students['GRADUATED_ON'].notna() & (students['GRADUATED_ON'] != '-')].copy()
+    students = students[students['MATRIC_NO'].isin(features.index)]
+
+    entry_level = features['entry_year_level'].reindex(students['MATRIC_NO']).to_numpy()
+    cohort = pd.to_datetime(students['COHORT'])
+    graduated = students['GRADUATED_ON'].astype(str)
+    grad_year = 2000 + pd.to_numeric(graduated.str[1:3], errors='coerce')
+    grad_month = pd.to_numeric(graduated.str[4:5], errors='coerce')
+
+    labels = pd.DataFrame({
+        'MATRIC_NO': students['MATRIC_NO'].to_numpy(),
+        'COHORT': students['COHORT'].to_numpy(),
+        'GRADUATED_ON': graduated.to_numpy(),
+        'entry_year_level': entry_level,
+        'expected_years': np.where(entry_level == 2, 2, 3),
+        'entry_year': cohort.dt.year.to_numpy(),
+        'entry_month': cohort.dt.month.to_numpy(),
+        'grad_year': grad_year.to_numpy(),
+        'grad_month': grad_month.to_numpy(),
+    })
+    unparsed = labels['grad_year'].isna() | labels['grad_month'].isna()
+    if unparsed.any():
+        # The SQL version failed the whole query on these; skip them instead
+        logger.warning(f"Skipping {int(unparsed.sum())} graduates with unparseable GRADUATED_ON")
+        labels = labels[~unparsed]
+    labels['grad_year'] = labels['grad_year'].astype(int)
+    labels['grad_month'] = labels['grad_month'].astype(int)
+    labels['expected_grad_year'] = labels['entry_year'] + labels['expected_years']
+    labels['expected_grad_month'] = labels['entry_month']
+    labels['on_time'] = (
+        (labels['grad_year'] < labels['expected_grad_year'])
+        | ((labels['grad_year'] == labels['expected_grad_year'])
+           & (labels['grad_month'] <= labels['expected_grad_month']))
+    ).astype(int)
+
+    feature_part = features.drop(columns=['entry_year_level']).reindex(labels['MATRIC_NO']).reset_index(drop=True)
+    return pd.concat([labels.reset_index(drop=True), feature_part], axis=1).sort_values('MATRIC_NO').reset_index(drop=True)
+
+
+def extract_training_frame():
+    """Features + on-time labels for every graduate (training set for both model scripts)"""
+    conn = get_db_connection()
+    try:
+        features = compute_student_features(fetch_raw_scores(conn))
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT MATRIC_NO, COHORT, GRADUATED_ON
+            FROM STUDENTS
+            WHERE STUDENT_STATUS = 'Graduate' AND GRADUATED_ON != '-' AND GRADUATED_ON IS NOT NULL
+        """)
+        students = pd.DataFrame([tuple(r) for r in cur.fetchall()],
+                                columns=['MATRIC_NO', 'COHORT', 'GRADUATED_ON'], dtype=object)
+        cur.close()
+    finally:
+        conn.close()
+    return graduation_labels(students, features)
+
+
+# Original per-request feature query (kept only as the parity reference for compute_student_features)
+REFERENCE_FEATURE_SQL = """
+WITH course_attempt_details AS (
+    SELECT
+        MATRIC_NO,
+        COURSE_CODE,
+        CASE WHEN ATTEMPT_1 NOT IN ('-', 'Exempted') THEN 1 ELSE 0 END +
+        CASE WHEN ATTEMPT_2 != '-' THEN 1 ELSE 0 END +
+        CASE WHEN ATTEMPT_3 NOT IN ('-', 'NULL') THEN 1 ELSE 0 END AS attempts_for_course,
+        CASE
+            WHEN ATTEMPT_1 NOT IN ('Exempted', '-') AND ISNUMERIC(ATTEMPT_1) = 1 AND CAST(ATTEMPT_1 AS FLOAT) < 40
+            THEN 1 ELSE 0
+        END AS failed_first_attempt,
+        CASE WHEN ATTEMPT_1 = 'Exempted' THEN 1 ELSE 0 END AS is_exempted,
+        CASE
+            WHEN ATTEMPT_1 NOT IN ('Exempted', '-') AND ISNUMERIC(ATTEMPT_1) = 1 THEN CAST(ATTEMPT_1 AS FLOAT)
+        END AS first_attempt_score,
+        CASE
+            WHEN ATTEMPT_3 NOT IN ('-', 'NULL') AND ISNUMERIC(ATTEMPT_3) = 1 THEN CAST(ATTEMPT_3 AS FLOAT)
+            WHEN ATTEMPT_2 != '-' AND ISNUMERIC(ATTEMPT_2) = 1 THEN CAST(ATTEMPT_2 AS FLOAT)
+            WHEN ATTEMPT_1 NOT IN ('Exempted', '-') AND ISNUMERIC(ATTEMPT_1) = 1 THEN CAST(ATTEMPT_1 AS FLOAT)
+        END AS final_score,
+        CASE
+            WHEN (
+                (ATTEMPT_3 NOT IN ('-', 'NULL') AND ISNUMERIC(ATTEMPT_3) = 1 AND CAST(ATTEMPT_3 AS FLOAT) >= 40)
+                OR (ATTEMPT_2 != '-' AND ISNUMERIC(ATTEMPT_2) = 1 AND CAST(ATTEMPT_2 AS FLOAT) >= 40)
+                OR (ATTEMPT_1 NOT IN ('Exempted', '-') AND ISNUMERIC(ATTEMPT_1) = 1 AND CAST(ATTEMPT_1 AS FLOAT) >= 40)
+            )
+            THEN 1 ELSE 0
+        END AS eventually_passed
+    FROM STUDENT_SCORE
+    WHERE MATRIC_NO IS NOT NULL
+),
+student_features_enhanced AS (
+    SELECT
+        MATRIC_NO,
+        CASE WHEN MAX(is_exempted) = 1 THEN 2 ELSE 1 END AS entry_year_level,
+        COUNT(DISTINCT COURSE_CODE) AS total_courses,
+        SUM(is_exempted) AS exempted_courses,
+        COUNT(DISTINCT COURSE_CODE) - SUM(is_exempted) AS actual_courses_taken,
+        SUM(CASE WHEN attempts_for_course = 1 THEN 1 ELSE 0 END) AS courses_passed_first_attempt,
+        SUM(CASE WHEN attempts_for_course = 2 THEN 1 ELSE 0 END) AS courses_with_2_attempts,
+        SUM(CASE WHEN attempts_for_course = 3 THEN 1 ELSE 0 END) AS courses_with_3_attempts,
+        SUM(CASE WHEN attempts_for_course >= 2 THEN 1 ELSE 0 END) AS total_courses_needing_resits,
+        SUM(failed_first_attempt) AS total_first_attempt_failures,
+        SUM(CASE WHEN failed_first_attempt = 1 AND eventually_passed = 0 THEN 1 ELSE 0 END) AS courses_never_passed,
+        SUM(CASE WHEN failed_first_attempt = 1 AND eventually_passed = 1 THEN 1 ELSE 0 END) AS courses_passed_after_failing,
+        AVG(first_attempt_score) AS avg_first_attempt_score,
+        MIN(first_attempt_score) AS lowest_first_attempt_score,
+        STDEV(first_attempt_score) AS first_attempt_score_std_dev,
+        AVG(final_score) AS avg_final_score,
+        MIN(final_score) AS lowest_final_score,
+        MAX(final_score) AS highest_final_score,
+        SUM(CASE WHEN first_attempt_score >= 70 THEN 1 ELSE 0 END) AS courses_with_distinction_first_attempt,
+        SUM(CASE WHEN first_attempt_score >= 40 AND first_attempt_score < 50 THEN 1 ELSE 0 END) AS courses_barely_passed_first_attempt,
+        SUM(CASE WHEN final_score = 40 AND attempts_for_course > 1 THEN 1 ELSE 0 END) AS courses_capped_at_40,
+        SUM(CASE WHEN final_score < 40 THEN 1 ELSE 0 END) AS courses_still_failing
+    FROM course_attempt_details
+    GROUP BY MATRIC_NO
+)
+SELECT
+    sfe.*,
+    CAST(sfe.courses_passed_first_attempt AS FLOAT) / NULLIF(sfe.actual_courses_taken, 0) AS first_attempt_pass_rate,
+    CAST(sfe.total_courses_needing_resits AS FLOAT) / NULLIF(sfe.actual_courses_taken, 0) AS resit_rate,
+    CAST(sfe.total_first_attempt_failures AS FLOAT) / NULLIF(sfe.actual_courses_taken, 0) AS first_attempt_failure_rate,
+    CAST(sfe.courses_with_3_attempts AS FLOAT) / NULLIF(sfe.total_courses_needing_resits, 0) AS third_attempt_rate,
+    CAST(sfe.courses_capped_at_40 AS FLOAT) / NULLIF(sfe.total_courses_needing_resits, 0) AS resit_success_rate
+FROM student_features_enhanced sfe
+"""
+
+
+def compare_features(expected, actual, tolerance=1e-9):
+    """
+    Column-by-column mismatch report between two feature frames indexed by MATRIC_NO.
+
+    Returns:
+        dict: {'missing': [...], 'extra': [...], 'mismatches': {column: [MATRIC_NO, ...]}} (empty lists = parity)
+    """
+    expected = expected.copy()
+    actual = actual.copy()
+    expected.index = expected.index.astype(str).str.rstrip().str.upper()
+    actual.index = actual.index.astype(str).str.rstrip().str.upper()
+    common = expected.index.intersection(actual.index)
+    report = {
+        'missing': sorted(set(expected.index) - set(actual.index)),
+        'extra': sorted(set(actual.index) - set(expected.index)),
+        'mismatches': {},
+    }
+    for column in FEATURE_COLUMNS:
+        e = pd.to_numeric(expected.loc[common, column], errors='coerce').astype(float).to_numpy()
+        a = pd.to_numeric(actual.loc[common, column], errors='coerce').astype(float).to_numpy()
+        same = (np.isnan(e) & np.isnan(a)) | np.isclose(e, a, rtol=tolerance, atol=tolerance)
+        if not same.all():
+            report['mismatches'][column] = list(common[~same])
+    return report
+
+
+def parity_check(status=None):
+    """
+    Run the reference SQL and compute_student_features on the same database and compare them.
+    status limits both sides to students with that STUDENT_STATUS.
+    """
+    conn = get_db_connection()
+    try:
+        where, params = None, []
+        sql = REFERENCE_FEATURE_SQL
+        if status:
+            where = "MATRIC_NO IN (SELECT MATRIC_NO FROM STUDENTS WHERE STUDENT_STATUS = ?)"
+            params = [status]
+            sql = REFERENCE_FEATURE_SQL.replace("WHERE MATRIC_NO IS NOT NULL", f"WHERE MATRIC_NO IS NOT NULL AND {where}")
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        columns = [c[0] for c in cur.description]
+        expected = pd.DataFrame([tuple(r) for r in cur.fetchall()], columns=columns, dtype=object).set_index('MATRIC_NO')
+        cur.close()
+        actual = compute_student_features(fetch_raw_scores(conn, where, params))
+    finally:
+        conn.close()
+    return compare_features(expected, actual)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the pandas feature engine with the reference SQL")
+    parser.add_argument("--status", help="only students with this STUDENT_STATUS")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = parity_check(args.status)
+    print(f"missing in engine: {len(report['missing'])}, extra in engine: {len(report['extra'])}")
+    for column, keys in report['mismatches'].items():
+        print(f"  {column}: {len(keys)} students differ (e.g. {keys[:5]})")
+    if not (report['missing'] or report['extra'] or report['mismatches']):
+        print("Parity OK")
@@ -1,9 +1,13 @@
 # Backend service to handle ML operations and queries for predictions
-import os
+import json, os, threading
 import joblib
 import pandas as pd
 import logging
 from src.db.core import get_db_connection
+from src.db.schema import require_score_change_tracking
+from src.services.db_helpers import SCORES_STAMP_SQL
+from src.services.feature_engine import FEATURE_COLUMNS
+from src.services.student_features import refresh_student_features
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -14,191 +18,177 @@ MODEL_DIR = os.path.join(os.path.dirname(__file__), '../../models')
 MODEL_PATH = os.path.join(MODEL_DIR, 'graduation_model_latest.joblib')
 FEATURE_COLS_PATH = os.path.join(MODEL_DIR, 'feature_columns.joblib')
 SCALER_PATH = os.path.join(MODEL_DIR, 'scaler_latest.joblib')
+METADATA_PATH = os.path.join(MODEL_DIR, 'model_metadata.json')
 
-try:
-    model = joblib.load(MODEL_PATH)
-    feature_cols = joblib.load(FEATURE_COLS_PATH)
-    logger.info("✓ Graduation prediction model loaded successfully")
-    logger.info(f"✓ Using {len(feature_cols)} features for prediction")
-except Exception as e:
-    logger.warning(f"⚠ Could not load prediction model: {e}")
-    model = None
-    feature_cols = None
-
-# For scaling because Linear Regression using scaled features
-try:
-    scaler = joblib.load(SCALER_PATH)
-    logger.info("✓ Feature scaler loaded successfully")
-except Exception as e:
-    logger.warning(f"⚠ Could not load scaler: {e}")
-    logger.warning("⚠ Predictions may be inaccurate if model requires scaled features!")
-    scaler = None
-
-def extract_student_features(matric_no=None, student_status='Active'):
+def _model_files_version():
+    """mtimes of the model artifacts (None for a missing file); retraining changes this"""
+    version = []
+    for path in (MODEL_PATH, FEATURE_COLS_PATH, SCALER_PATH):
+        try:
+            version.append(os.path.getmtime(path))
+        except OSError:
+            version.append(None)
+    return tuple(version)
+
+
+def _model_label():
+    """Human-readable model version stored with persisted predictions, e.g. 'Logistic Regression 20251028_033631'"""
+    try:
+        with open(METADATA_PATH, encoding='utf-8') as f:
+            metadata = json.load(f)
+        return f"{metadata.get('model_type', 'model')} {metadata['timestamp']}"
+    except (OSError, ValueError, KeyError):
+        mtime = model_version[0]
+        return f"mtime {int(mtime)}" if mtime else "unknown"
+
+
+def _load_model():
+    global model, feature_cols, scaler, model_version, model_label
+    model_version = _model_files_version()
+    model_label = _model_label()
+    try:
+        model = joblib.load(MODEL_PATH)
+        feature_cols = joblib.load(FEATURE_COLS_PATH)
+        logger.info("✓ Graduation prediction model loaded successfully")
+        logger.info(f"✓ Using {len(feature_cols)} features for prediction")
+    except Exception as e:
+        logger.warning(f"⚠ Could not load prediction model: {e}")
+        model = None
+        feature_cols = None
+
+    # For scaling because Linear Regression using scaled features
+    try:
+        scaler = joblib.load(SCALER_PATH)
+        logger.info("✓ Feature scaler loaded successfully")
+    except Exception as e:
+        logger.warning(f"⚠ Could not load scaler: {e}")
+        logger.warning("⚠ Predictions may be inaccurate if model requires scaled features!")
+        scaler = None
+
+
+_model_lock = threading.Lock()
+_load_model()
+
+
+def reload_model_if_changed():
+    """Reload the joblib artifacts if the training script replaced them since they were loaded"""
+    if _model_files_version() == model_version:
+        return False
+    with _model_lock:
+        if _model_files_version() == model_version:
+            return False
+        logger.info("Model files changed on disk, reloading")
+        _load_model()
+        return True
+
+# Upper bound for one batch; keeps the IN list well under SQL Server's 2100 parameter limit
+MAX_BATCH_STUDENTS = 1000
+
+
+def extract_student_features(matric_no=None, student_status='Active', matric_nos=None):
     """
-    Extract features for students from database
+    Extract features for students from the STUDENT_FEATURES store
+    (incrementally refreshed first, so only students whose scores changed are re-aggregated)
     
     Args:
         matric_no: Optional. If provided, extract for single student.
         student_status: 'Active' (default) or 'Graduate' for testing
+        matric_nos: Optional. List of up to MAX_BATCH_STUDENTS students, fetched in one query.
     
     Returns:
         DataFrame with student features
     """
     
-    conn = get_db_connection()
-    
-    # Build WHERE clause
-    where_clause = f"WHERE s.STUDENT_STATUS = '{student_status}'"
+    refresh_student_features()
+
+    # Only placeholders go into the SQL text; every value is a parameter
+    where_clause = "WHERE s.STUDENT_STATUS = ?"
+    params = [student_status]
     if matric_no:
-        where_clause += f" AND s.MATRIC_NO = '{matric_no}'"
-    
-    query = f"""
-    WITH student_entry_year AS (
-        SELECT 
-            MATRIC_NO,
-            CASE 
-                WHEN MAX(CASE WHEN ATTEMPT_1 = 'Exempted' THEN 1 ELSE 0 END) = 1 
-                THEN 2
-                ELSE 1
-            END AS entry_year_level
-        FROM STUDENT_SCORE
-        GROUP BY MATRIC_NO
-    ),
-
-    course_attempt_details AS (
-        SELECT 
-            MATRIC_NO,
-            COURSE_CODE,
-            ATTEMPT_1,
-            ATTEMPT_2,
-            ATTEMPT_3,
-            
-            CASE 
-                WHEN ATTEMPT_1 NOT IN ('-', 'Exempted') 
-                THEN 1 ELSE 0 
-            END +
-            CASE 
-                WHEN ATTEMPT_2 != '-' 
-                THEN 1 ELSE 0 
-            END +
-            CASE 
-                WHEN ATTEMPT_3 NOT IN ('-', 'NULL')
-                THEN 1 ELSE 0 
-            END AS attempts_for_course,
-            
-            CASE 
-                WHEN ATTEMPT_1 NOT IN ('Exempted', '-') 
-                     AND ISNUMERIC(ATTEMPT_1) = 1 
-                     AND CAST(ATTEMPT_1 AS FLOAT) < 40
-                THEN 1 ELSE 0 
-            END AS failed_first_attempt,
-            
-            CASE WHEN ATTEMPT_1 = 'Exempted' THEN 1 ELSE 0 END AS is_exempted,
-            
-            CASE 
-                WHEN ATTEMPT_1 NOT IN ('Exempted', '-')
-                     AND ISNUMERIC(ATTEMPT_1) = 1 
-                THEN CAST(ATTEMPT_1 AS FLOAT)
-                ELSE NULL
-            END AS first_attempt_score,
-            
-            CASE 
-                WHEN ATTEMPT_3 NOT IN ('-', 'NULL')
-                     AND ISNUMERIC(ATTEMPT_3) = 1 
-                THEN CAST(ATTEMPT_3 AS FLOAT)
-                WHEN ATTEMPT_2 != '-'
-                     AND ISNUMERIC(ATTEMPT_2) = 1 
-                THEN CAST(ATTEMPT_2 AS FLOAT)
-                WHEN ATTEMPT_1 NOT IN ('Exempted', '-')
-                     AND ISNUMERIC(ATTEMPT_1) = 1 
-                THEN CAST(ATTEMPT_1 AS FLOAT)
-                ELSE NULL
-            END AS final_score,
-            
-            CASE 
-                WHEN (
-                    (ATTEMPT_3 NOT IN ('-', 'NULL') AND ISNUMERIC(ATTEMPT_3) = 1 AND CAST(ATTEMPT_3 AS FLOAT) >= 40)
-                    OR (ATTEMPT_2 != '-' AND ISNUMERIC(ATTEMPT_2) = 1 AND CAST(ATTEMPT_2 AS FLOAT) >= 40)
-                    OR (ATTEMPT_1 NOT IN ('Exempted', '-') AND ISNUMERIC(ATTEMPT_1) = 1 AND CAST(ATTEMPT_1 AS FLOAT) >= 40)
-                )
-                THEN 1 ELSE 0 
-            END AS eventually_passed
-            
-        FROM STUDENT_SCORE
-    ),
-
-    student_features_enhanced AS (
-        SELECT 
-            MATRIC_NO,
-            COUNT(DISTINCT COURSE_CODE) as total_courses,
-            SUM(is_exempted) as exempted_courses,
-            COUNT(DISTINCT COURSE_CODE) - SUM(is_exempted) as actual_courses_taken,
-            SUM(CASE WHEN attempts_for_course = 1 THEN 1 ELSE 0 END) as courses_passed_first_attempt,
-            SUM(CASE WHEN attempts_for_course = 2 THEN 1 ELSE 0 END) as courses_with_2_attempts,
-            SUM(CASE WHEN attempts_for_course = 3 THEN 1 ELSE 0 END) as courses_with_3_attempts,
-            SUM(CASE WHEN attempts_for_course >= 2 THEN 1 ELSE 0 END) as total_courses_needing_resits,
-            SUM(failed_first_attempt) as total_first_attempt_failures,
-            SUM(CASE WHEN failed_first_attempt = 1 AND eventually_passed = 0 THEN 1 ELSE 0 END) as courses_never_passed,
-            SUM(CASE WHEN failed_first_attempt = 1 AND eventually_passed = 1 THEN 1 ELSE 0 END) as courses_passed_after_failing,
-            AVG(first_attempt_score) as avg_first_attempt_score,
-            MIN(first_attempt_score) as lowest_first_attempt_score,
-            STDEV(first_attempt_score) as first_attempt_score_std_dev,
-            AVG(final_score) as avg_final_score,
-            MIN(final_score) as lowest_final_score,
-            MAX(final_score) as highest_final_score,
-            SUM(CASE WHEN first_attempt_score >= 70 THEN 1 ELSE 0 END) as courses_with_distinction_first_attempt,
-            SUM(CASE WHEN first_attempt_score >= 40 AND first_attempt_score < 50 THEN 1 ELSE 0 END) as courses_barely_passed_first_attempt,
-            SUM(CASE WHEN final_score = 40 AND attempts_for_course > 1 THEN 1 ELSE 0 END) as courses_capped_at_40,
-            SUM(CASE WHEN final_score < 40 THEN 1 ELSE 0 END) as courses_still_failing
-        FROM course_attempt_details
-        GROUP BY MATRIC_NO
-    )
+        where_clause += " AND s.MATRIC_NO = ?"
+        params.append(matric_no)
+    if matric_nos is not None:
+        if not 0 < len(matric_nos) <= MAX_BATCH_STUDENTS:
+            raise ValueError(f"matric_nos must have 1 to {MAX_BATCH_STUDENTS} entries")
+        where_clause += f" AND s.MATRIC_NO IN ({', '.join('?' * len(matric_nos))})"
+        params.extend(matric_nos)
 
+    query = f"""
     SELECT 
         s.MATRIC_NO,
         s.STUDENT_NAME,
         s.COHORT,
         s.STUDENT_STATUS,
-        sey.entry_year_level,
-        sfe.total_courses,
-        sfe.exempted_courses,
-        sfe.actual_courses_taken,
-        sfe.courses_passed_first_attempt,
-        sfe.courses_with_2_attempts,
-        sfe.courses_with_3_attempts,
-        sfe.total_courses_needing_resits,
-        sfe.total_first_attempt_failures,
-        sfe.courses_never_passed,
-        sfe.courses_passed_after_failing,
-        sfe.avg_first_attempt_score,
-        sfe.lowest_first_attempt_score,
-        sfe.first_attempt_score_std_dev,
-        sfe.avg_final_score,
-        sfe.lowest_final_score,
-        sfe.highest_final_score,
-        sfe.courses_with_distinction_first_attempt,
-        sfe.courses_barely_passed_first_attempt,
-        sfe.courses_capped_at_40,
-        sfe.courses_still_failing,
-        CAST(sfe.courses_passed_first_attempt AS FLOAT) / NULLIF(sfe.actual_courses_taken, 0) as first_attempt_pass_rate,
-        CAST(sfe.total_courses_needing_resits AS FLOAT) / NULLIF(sfe.actual_courses_taken, 0) as resit_rate,
-        CAST(sfe.total_first_attempt_failures AS FLOAT) / NULLIF(sfe.actual_courses_taken, 0) as first_attempt_failure_rate,
-        CAST(sfe.courses_with_3_attempts AS FLOAT) / NULLIF(sfe.total_courses_needing_resits, 0) as third_attempt_rate,
-        CAST(sfe.courses_capped_at_40 AS FLOAT) / NULLIF(sfe.total_courses_needing_resits, 0) as resit_success_rate
+        {', '.join('f.' + c for c in FEATURE_COLUMNS)}
     FROM STUDENTS s
-    INNER JOIN student_entry_year sey ON s.MATRIC_NO = sey.MATRIC_NO
-    INNER JOIN student_features_enhanced sfe ON s.MATRIC_NO = sfe.MATRIC_NO
+    INNER JOIN STUDENT_FEATURES f ON s.MATRIC_NO = f.MATRIC_NO
     {where_clause}
     ORDER BY s.MATRIC_NO
     """
     
-    df = pd.read_sql(query, conn)
-    conn.close()
+    conn = get_db_connection()
+    try:
+        df = pd.read_sql(query, conn, params=params)
+    finally:
+        conn.close()
     
     return df
 
 
+# What a prediction depends on besides the model files, in one round trip: the committed STUDENT_SCORE
+# changes (SCORES_STAMP_SQL; rowversion-based, so deletes count through the tombstones, no scan is
+# needed, and edits committed during a long import still show) and the count/checksum of the STUDENTS
+# columns that feed the output.
+DATA_VERSION_SQL = f"""
+SELECT
+    v.MIN_ACTIVE, v.COMMITTED_ABOVE, v.COMMITTED_CHECKSUM,
+    (SELECT COUNT_BIG(*) FROM STUDENTS),
+    (SELECT CHECKSUM_AGG(CHECKSUM(MATRIC_NO, STUDENT_NAME, COHORT, STUDENT_STATUS)) FROM STUDENTS)
+FROM ({SCORES_STAMP_SQL}) AS v
+"""
+
+# {student_status: (key, predictions DataFrame)}
+_snapshots = {}
+_snapshot_lock = threading.Lock()
+
+
+def prediction_data_version():
+    """Tuple that changes whenever a STUDENT_SCORE write commits or the students' name/cohort/status change"""
+    require_score_change_tracking()
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(DATA_VERSION_SQL)
+        version = tuple(cur.fetchone())
+        cur.close()
+    finally:
+        conn.close()
+    return version
+
+
+def get_prediction_snapshot(student_status='Active'):
+    """
+    Predictions for every student with this status, shared by the dashboard endpoints.
+    Recomputed only when prediction_data_version() or the model files change; treat as read-only.
+    Returns None if the model is not loaded or there are no students (not cached).
+    """
+    reload_model_if_changed()
+    key = (prediction_data_version(), model_version)
+    cached = _snapshots.get(student_status)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    # One computation per change; concurrent requests wait for it instead of repeating it
+    with _snapshot_lock:
+        cached = _snapshots.get(student_status)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        predictions = _predict(None, student_status)
+        if predictions is not None:
+            _snapshots[student_status] = (key, predictions)
+        return predictions
+
+
 def predict_graduation(matric_no=None, student_status='Active'):
     """
     Predict on-time graduation for students
@@ -211,12 +201,50 @@ def predict_graduation(matric_no=None, student_status='Active'):
         DataFrame with predictions, or None if model not loaded
     """
     
+    if matric_no is None:
+        return get_prediction_snapshot(student_status)
+
+    # A current snapshot already has this student; otherwise score just them
+    reload_model_if_changed()
+    cached = _snapshots.get(student_status)
+    if cached is not None and cached[0] == (prediction_data_version(), model_version):
+        row = cached[1][cached[1]['MATRIC_NO'].astype(str).str.rstrip().str.upper() == str(matric_no).rstrip().upper()]
+        if not row.empty:
+            return row.copy()
+    return _predict(matric_no, student_status)
+
+
+def predict_students(matric_nos, student_status='Active'):
+    """
+    Predict on-time graduation for a list of students, scored together in one predict_proba call
+    
+    Args:
+        matric_nos: List of MATRIC_NOs (at most MAX_BATCH_STUDENTS)
+        student_status: 'Active' (default) for current students, 'Graduate' for testing
+    
+    Returns:
+        DataFrame with predictions for the students found (no row for unknown ones),
+        or None if model not loaded or none were found
+    """
+    
+    # A current snapshot already has them; otherwise fetch and score just these students
+    reload_model_if_changed()
+    cached = _snapshots.get(student_status)
+    if cached is not None and cached[0] == (prediction_data_version(), model_version):
+        # Match the way the database compares MATRIC_NO (case-insensitive, trailing blanks ignored)
+        wanted = {str(m).rstrip().upper() for m in matric_nos}
+        rows = cached[1][cached[1]['MATRIC_NO'].astype(str).str.rstrip().str.upper().isin(wanted)]
+        return rows.copy() if not rows.empty else None
+    return _predict(None, student_status, matric_nos)
+
+
+def _predict(matric_no=None, student_status='Active', matric_nos=None):
     if model is None or feature_cols is None:
         logger.error("Model not loaded. Cannot make predictions.")
         return None
     
     # Extract features from database
-    df = extract_student_features(matric_no, student_status)
+    df = extract_student_features(matric_no, student_status, matric_nos)
     
     if df.empty:
         logger.warning(f"No {student_status} students found" + (f" with MATRIC_NO={matric_no}" if matric_no else ""))
@@ -259,18 +287,20 @@ def predict_graduation(matric_no=None, student_status='Active'):
         return None
 
 
-def get_at_risk_students(threshold=0.5):
+def get_at_risk_students(threshold=0.5, predictions=None):
     """
     Get list of active students at risk of not graduating on time
     
     Args:
         threshold: Probability threshold (students below this are at risk)
+        predictions: Optional. Predictions to filter (e.g. the stored batch); predicted live if omitted
     
     Returns:
         DataFrame of at-risk students, sorted by risk level
     """
     
-    predictions = predict_graduation(student_status='Active')
+    if predictions is None:
+        predictions = predict_graduation(student_status='Active')
     
     if predictions is None:
         return None
@@ -281,6 +311,6 @@ def get_at_risk_students(threshold=0.5):
     
     return at_risk[[
         'MATRIC_NO', 'STUDENT_NAME', 'COHORT', 'entry_year_level',
-        'total_courses', 'total_courses_needing_resits', 'total_first_attempt_failures',
+        'total_courses', 'total_courses_needing_resits', 'courses_still_failing', 'total_first_attempt_failures',
         'avg_first_attempt_score', 'prob_on_time', 'prob_late', 'risk_level'
     ]]
@@ -0,0 +1,126 @@
+# src/services/ic_crypto.py
+#
+# Batch Fernet encryption/decryption for IC numbers.
+# Kept free of pandas/DB imports so process-pool workers start quickly.
+#
+# Benchmark: python -m src.services.ic_crypto [rows ...]
+
+import os, threading, time
+from concurrent.futures import ProcessPoolExecutor
+from cryptography.fernet import Fernet, InvalidToken
+
+# Batches smaller than this run inline; process start-up and pickling cost more than they save
+PARALLEL_MIN_ROWS = int(os.getenv("IC_CRYPTO_PARALLEL_MIN", "5000"))
+WORKERS = int(os.getenv("IC_CRYPTO_WORKERS", "0")) or max(1, min(8, (os.cpu_count() or 2) - 1))
+CHUNK_ROWS = 1000
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+# Per-worker cipher, set by _init_worker
+_worker_cipher = None
+
+
+def _init_worker(key):
+    global _worker_cipher
+    _worker_cipher = Fernet(key)
+
+
+def _encrypt_chunk(values, cipher=None):
+    cipher = cipher or _worker_cipher
+    return [cipher.encrypt(str(v).encode()).decode() if v is not None else None for v in values]
+
+
+def _decrypt_chunk(values, cipher=None):
+    cipher = cipher or _worker_cipher
+    out = []
+    for v in values:
+        if not v:
+            out.append(None)
+            continue
+        try:
+            out.append(cipher.decrypt(v.encode()).decode())
+        except (InvalidToken, ValueError, TypeError, AttributeError):
+            out.append(None)  # undecryptable values come back as None, like the per-row call sites
+    return out
+
+
+def _get_pool(key):
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, initializer=_init_worker, initargs=(key,))
+            _pool_key = key
+        return _pool
+
+
+def _run_batch(fn, values, key, parallel):
+    values = list(values)
+    if parallel is None:
+        parallel = len(values) >= PARALLEL_MIN_ROWS and WORKERS > 1
+    if not parallel:
+        return fn(values, Fernet(key))
+    chunks = [values[i:i + CHUNK_ROWS] for i in range(0, len(values), CHUNK_ROWS)]
+    out = []
+    for part in _get_pool(key).map(fn, chunks):
+        out.extend(part)
+    return out
+
+
+def encrypt_batch(values, key, parallel=None):
+    """
+    Encrypt many IC numbers with the Fernet key (bytes). None stays None.
+    Large batches are spread over a process pool; parallel=True/False forces either path.
+    """
+    return _run_batch(_encrypt_chunk, values, key, parallel)
+
+
+def decrypt_batch(values, key, parallel=None):
+    """Decrypt many IC_NO tokens; empty or undecryptable values come back as None"""
+    return _run_batch(_decrypt_chunk, values, key, parallel)
+
+
+def shutdown():
+    """Stop the worker processes (they are started lazily on the first large batch)"""
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool, _pool_key = None, None
+
+
+def benchmark(sizes=(1_000, 10_000, 50_000)):
+    """Rows/second of inline vs process-pool encrypt and decrypt for each batch size"""
+    key = Fernet.generate_key()
+    ics = [f"{900000000000 + i:012d}" for i in range(max(sizes))]
+    _get_pool(key)
+    decrypt_batch(encrypt_batch(ics[:WORKERS * CHUNK_ROWS], key, parallel=True), key, parallel=True)  # warm workers
+
+    results = []
+    for n in sizes:
+        batch = ics[:n]
+        row = {"rows": n}
+        for label, parallel in (("inline", False), ("pool", True)):
+            start = time.perf_counter()
+            tokens = encrypt_batch(batch, key, parallel=parallel)
+            row[f"encrypt_{label}"] = n / (time.perf_counter() - start)
+            start = time.perf_counter()
+            plain = decrypt_batch(tokens, key, parallel=parallel)
+            row[f"decrypt_{label}"] = n / (time.perf_counter() - start)
+            assert plain == batch
+        results.append(row)
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    sizes = tuple(int(a) for a in sys.argv[1:]) or (1_000, 10_000, 50_000)
+    print(f"workers={WORKERS} chunk={CHUNK_ROWS} (rows/second)")
+    print(f"{'rows':>8} {'enc inline':>12} {'enc pool':>12} {'dec inline':>12} {'dec pool':>12}")
+    for r in benchmark(sizes):
+        print(f"{r['rows']:>8} {r['encrypt_inline']:>12,.0f} {r['encrypt_pool']:>12,.0f} "
+              f"{r['decrypt_inline']:>12,.0f} {r['decrypt_pool']:>12,.0f}")
+    shutdown()
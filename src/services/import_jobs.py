@@ -0,0 +1,165 @@
+# src/services/import_jobs.py
+
+import json, logging, os, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Job records are small JSON files so status survives a restart and is visible to every worker process
+JOBS_DIR = os.getenv("IMPORT_JOBS_DIR", os.path.join("uploads", "jobs"))
+JOB_WORKERS = int(os.getenv("IMPORT_JOB_WORKERS", "2"))
+PROGRESS_WRITE_INTERVAL = 0.5  # seconds between progress writes while a job is running
+STALE_AFTER_SECONDS = float(os.getenv("IMPORT_JOB_STALE_SECONDS", "3600"))  # no write for this long -> orphaned
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="import-job")
+_active = set()                # job ids queued or running in this process
+_lock = threading.Lock()
+_OWNER = uuid.uuid4().hex      # identifies this server process in job records
+
+
+def _job_path(job_id):
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+
+def _write_job(job):
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path = _job_path(job["id"])
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(job, f, default=str)
+    os.replace(tmp_path, path)  # atomic, readers never see a half-written record
+
+
+def _read_job(job_id):
+    try:
+        with open(_job_path(job_id), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class JobProgress:
+    """
+    Progress callback handed to the import function: progress(stage, rows_processed=None).
+    rows_processed is cumulative. Writes are throttled, stage changes are written immediately.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self._last_write = 0.0
+
+    def __call__(self, stage, rows_processed=None):
+        stage_changed = stage != self.job["stage"]
+        self.job["stage"] = stage
+        if rows_processed is not None:
+            self.job["rows_processed"] = int(rows_processed)
+        self._refresh_rates()
+        now = time.monotonic()
+        if stage_changed or now - self._last_write >= PROGRESS_WRITE_INTERVAL:
+            self._last_write = now
+            _write_job(self.job)
+
+    def _refresh_rates(self):
+        started = self.job.get("started_at_epoch")
+        if started:
+            elapsed = max(time.time() - started, 1e-6)
+            self.job["elapsed_seconds"] = round(elapsed, 2)
+            self.job["rows_per_second"] = round(self.job["rows_processed"] / elapsed, 1)
+
+
+def _run(job, fn, args, kwargs, cleanup):
+    progress = JobProgress(job)
+    job.update({
+        "status": "running",
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "started_at_epoch": time.time(),
+    })
+    progress("starting")
+    try:
+        result = fn(*args, progress=progress, **kwargs)
+        if isinstance(result, dict) and result.get("error"):
+            job.update({"status": "failed", "error": result["error"]})
+        elif result is None:
+            job.update({"status": "failed", "error": "Import returned no result"})
+        else:
+            job["status"] = "succeeded"
+        job["result"] = result
+    except Exception as e:
+        logging.exception("Import job %s failed", job["id"])
+        job.update({"status": "failed", "error": str(e)})
+    finally:
+        job["stage"] = "done"
+        job["finished_at"] = datetime.now().isoformat(timespec="seconds")
+        progress._refresh_rates()
+        _write_job(job)
+        with _lock:
+            _active.discard(job["id"])
+        if cleanup:
+            try:
+                cleanup()
+            except Exception:
+                logging.warning("Import job %s cleanup failed", job["id"])
+
+
+def submit_import_job(kind, fn, *args, cleanup=None, submitted_by=None, **kwargs):
+    """
+    Queue fn(*args, progress=..., **kwargs) on the import worker pool and return the job id at once.
+    fn's return value (dict of insert/update/error counts) becomes the job's result;
+    a dict with an 'error' key or an exception marks the job failed. cleanup() runs after either.
+    """
+    job_id = uuid.uuid4().hex
+    job = {
+        "id": job_id,
+        "kind": kind,
+        "status": "queued",
+        "stage": "queued",
+        "rows_processed": 0,
+        "rows_per_second": 0.0,
+        "elapsed_seconds": 0.0,
+        "submitted_by": submitted_by,
+        "owner": _OWNER,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "error": None,
+    }
+    _write_job(job)
+    with _lock:
+        _active.add(job_id)
+    _executor.submit(_run, job, fn, args, kwargs, cleanup)
+    return job_id
+
+
+def _is_orphaned(job):
+    if job.get("owner") != _OWNER:
+        # Another (or a previous) server process; judge by how long the record has been silent
+        try:
+            return time.time() - os.path.getmtime(_job_path(job["id"])) > STALE_AFTER_SECONDS
+        except OSError:
+            return False
+    with _lock:
+        if job["id"] in _active:
+            return False
+    # Finished between our read and the check above: the final record is already on disk
+    latest = _read_job(job["id"])
+    return latest is not None and latest["status"] in ("queued", "running")
+
+
+def get_import_job(job_id):
+    """Current job record, or None for an unknown id"""
+    # Ids are uuid4 hex; anything else could be a path
+    if not job_id or len(job_id) != 32 or any(c not in "0123456789abcdef" for c in job_id):
+        return None
+    job = _read_job(job_id)
+    if job is None:
+        return None
+    if job["status"] in ("queued", "running") and _is_orphaned(job):
+        # Left behind by a restart of the server process that owned it
+        job.update({"status": "failed", "stage": "done", "error": "Server restarted before the import finished"})
+        _write_job(job)
+    job.pop("started_at_epoch", None)
+    job.pop("owner", None)
+    return job
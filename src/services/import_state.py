@@ -0,0 +1,151 @@
+# src/services/import_state.py
+
+import hashlib, json, logging, os, re, tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+import numpy as np
+import pandas as pd
+import pyodbc
+from src.db.core import get_db_connection
+
+load_dotenv()
+
+# Fingerprints of the rows last written to the import's target tables, used to skip unchanged
+# re-uploads of the master workbook. One state per scope (set of target tables), shared by every
+# sheet and workbook writing to them.
+STATE_DIR = os.getenv("IMPORT_STATE_DIR", os.path.join("uploads", "import_state"))
+
+# How long an import waits for another one into the same scope to finish
+STATE_LOCK_TIMEOUT_MS = int(os.getenv("IMPORT_STATE_LOCK_TIMEOUT_MS", str(30 * 60 * 1000)))
+
+
+@contextmanager
+def state_lock(scope):
+    """
+    Exclusive lock on one state scope, across threads and worker processes (sp_getapplock owned by
+    a session of its own, since the import commits on other connections). Hold it from
+    load_import_state through the DB commit to save_import_state, so concurrent imports into the
+    same tables can't interleave their writes and leave fingerprints that don't match the DB.
+    """
+    resource = f"import_state:{scope}"
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SET NOCOUNT ON;
+            DECLARE @rc INT;
+            EXEC @rc = sp_getapplock @Resource = ?, @LockMode = 'Exclusive', @LockOwner = 'Session', @LockTimeout = ?;
+            SELECT @rc;
+        """, (resource, STATE_LOCK_TIMEOUT_MS))
+        if cur.fetchone()[0] < 0:
+            raise TimeoutError(f"Another import into {scope} is still running")
+        conn.commit()
+        try:
+            yield
+        finally:
+            try:
+                cur.execute("EXEC sp_releaseapplock @Resource = ?, @LockOwner = 'Session'", (resource,))
+                conn.commit()
+            except pyodbc.Error as e:
+                # Only a broken session fails here, and its locks go with it
+                logging.error("Releasing %s failed: %s", resource, e)
+    finally:
+        conn.close()
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """sha256 of the uploaded workbook, read in 1 MB chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _normalize_cell(value):
+    # Same content must hash the same whether Excel handed us 75, 75.0 or ' 75 '
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return "" if np.isnan(value) else format(value, ".10g")
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, np.floating):
+        return _normalize_cell(float(value))
+    try:
+        if pd.isna(value):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    return str(value).strip()
+
+
+def row_fingerprints(df):
+    """
+    One 64-bit content hash (hex) per row of df over its normalized cell values.
+    Each distinct value is normalized once, then rows are hashed vectorized.
+    """
+    if df.empty:
+        return []
+    values = df.to_numpy(dtype=object)
+    codes, distinct = pd.factorize(values.ravel(), use_na_sentinel=True)
+    normalized = np.array([_normalize_cell(v) for v in distinct] + [""], dtype=object)
+    text = pd.DataFrame(normalized[codes].reshape(values.shape))
+    hashes = pd.util.hash_pandas_object(text, index=False).to_numpy()
+    return [format(int(h), "016x") for h in hashes]
+
+
+def columns_fingerprint(df):
+    """Hash of the column layout; a layout change invalidates every stored row hash"""
+    return hashlib.sha256("\x1f".join(str(c) for c in df.columns).encode("utf-8")).hexdigest()
+
+
+def _state_path(scope):
+    safe = re.sub(r"[^A-Za-z0-9_-]+", "_", scope) or "import"
+    return os.path.join(STATE_DIR, f"{safe}.json")
+
+
+def load_import_state(scope):
+    """Fingerprints saved by the last committed import into this scope ({} if none)"""
+    try:
+        with open(_state_path(scope), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_import_state(scope, state):
+    """Atomically replace the scope's state; call only once the DB writes it describes are committed"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = _state_path(scope)
+    state = dict(state, saved_at=datetime.now().isoformat(timespec="seconds"))
+    fd, tmp_path = tempfile.mkstemp(dir=STATE_DIR, prefix=os.path.basename(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def changed_rows(df, keys, section_state, context=""):
+    """
+    Split df against a saved section ({'rows': {key: hash}}).
+    Each hash covers the row, the column layout and context (e.g. the sheet, when it decides
+    what gets written), so the same key coming from another layout or sheet counts as changed.
+
+    Returns:
+        tuple: (boolean mask of rows that are new or changed,
+                new section state: the saved rows updated with every row of df)
+    """
+    salt = f"{columns_fingerprint(df)}\x1f{context}\x1f"
+    hashes = [hashlib.sha256((salt + h).encode("utf-8")).hexdigest()[:16] for h in row_fingerprints(df)]
+    keys = ["" if k is None else str(k).strip().upper() for k in keys]
+
+    previous = section_state.get("rows", {})
+    mask = np.array([previous.get(k) != h for k, h in zip(keys, hashes)], dtype=bool)
+    new_section = {"rows": {**previous, **dict(zip(keys, hashes))}}
+    return mask, new_section
@@ -0,0 +1,91 @@
+# src/services/pagination.py
+#
+# Keyset (seek) pagination helpers shared by the list endpoints.
+# A page token is the sort-key values of the last row served, so the next page is
+# "WHERE (sort keys) > (token values)" instead of an OFFSET that rescans earlier pages.
+
+import base64, json
+from datetime import date, datetime
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def parse_page_size(raw, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """limit query arg -> int in [1, maximum]; raises ValueError for junk"""
+    if raw in (None, ""):
+        return default
+    size = int(raw)
+    if size < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(size, maximum)
+
+
+def _encode_value(v):
+    if isinstance(v, datetime):
+        return {"dt": v.isoformat()}
+    if isinstance(v, date):
+        return {"d": v.isoformat()}
+    return v
+
+
+def _decode_value(v):
+    if isinstance(v, dict):
+        if "dt" in v:
+            return datetime.fromisoformat(v["dt"])
+        if "d" in v:
+            return date.fromisoformat(v["d"])
+    return v
+
+
+def encode_page_token(values, scope=None):
+    """Opaque token for the row whose sort-key values are `values`; scope ties it to one sort order"""
+    payload = {"k": [_encode_value(v) for v in values], "s": scope}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_page_token(token, scope=None):
+    """Inverse of encode_page_token; raises ValueError if the token is malformed or for another sort"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        values = [_decode_value(v) for v in payload["k"]]
+    except Exception:
+        raise ValueError("Invalid page_token")
+    if payload.get("s") != scope:
+        raise ValueError("page_token does not match the requested sort")
+    return values
+
+
+def keyset_predicate(sort_keys, last_values):
+    """
+    WHERE fragment selecting rows strictly after last_values in the given order.
+
+    Args:
+        sort_keys: [(sql_expression, 'ASC' | 'DESC'), ...]; the last key must be unique
+        last_values: values of those expressions on the last row already served
+
+    Returns:
+        tuple: (sql, params) e.g. "(a >= ? AND ((a > ?) OR (a = ? AND b > ?)))"; the leading
+        range on the first key is redundant but gives the optimizer a seek on an index in sort order
+    """
+    first_expr, first_direction = sort_keys[0]
+    clauses = []
+    params = [last_values[0]]
+    for i, (expr, direction) in enumerate(sort_keys):
+        op = "<" if direction.upper() == "DESC" else ">"
+        parts = []
+        for prev_expr, _ in sort_keys[:i]:
+            parts.append(f"{prev_expr} = ?")
+        parts.append(f"{expr} {op} ?")
+        clauses.append("(" + " AND ".join(parts) + ")")
+        params.extend(last_values[:i])
+        params.append(last_values[i])
+    bound = f"{first_expr} {'<=' if first_direction.upper() == 'DESC' else '>='} ?"
+    return "(" + bound + " AND (" + " OR ".join(clauses) + "))", params
+
+
+def like_prefix(text):
+    """LIKE pattern matching values that start with text (wildcards in text are escaped with [])"""
+    escaped = text.replace("[", "[[]").replace("%", "[%]").replace("_", "[_]")
+    return escaped + "%"
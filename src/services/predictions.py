@@ -1,24 +1,69 @@
 # Flask API endpoint to expose prediction function
 from flask import Blueprint, jsonify, request
+from flask_jwt_extended import jwt_required
 import pandas as pd
-from src.services.graduation_prediction import predict_graduation, get_at_risk_students
+from src.services import graduation_prediction
+from src.services.batch_scoring import load_stored_predictions, score_students, stale_predictions
+from src.services.graduation_prediction import (
+    MAX_BATCH_STUDENTS, predict_graduation, predict_students, get_at_risk_students
+)
 
 # Create blueprint
 prediction_bp = Blueprint('predictions', __name__, url_prefix='/api/predictions')
 
-# Individual students (for details page
-@prediction_bp.route('/student/<matric_no>', methods=['GET'])
-def predict_single_student(matric_no):
-    """Predict graduation for a single student"""
-    
-    result = predict_graduation(matric_no=matric_no, student_status='Active')
-    
-    if result is None or result.empty:
-        return jsonify({'error': 'Student not found or model not available'}), 404
-    
+def load_predictions(matric_no=None, matric_nos=None):
+    """
+    Predictions for active students (or one of them, or a list of up to MAX_BATCH_STUDENTS) as stored
+    by the nightly batch scoring job.
+    Students with no stored row yet (added since the last run) and stale rows (features changed since
+    SCORED_AT, or another model loaded) are scored live instead; live rows have no scored_at.
+    Stale rows are kept as stored if the model cannot score. None if nothing could be predicted.
+    """
+    stored = load_stored_predictions('Active', matric_no, include_unscored=True, matric_nos=matric_nos)
+    stale = stale_predictions(stored)
+    if not stale.any():
+        return stored
+
+    targets = stored.loc[stale, 'MATRIC_NO'].tolist()
+    if len(targets) > MAX_BATCH_STUDENTS:
+        # e.g. before the first batch run or after retraining: the shared snapshot scores them all at once
+        live = predict_graduation(student_status='Active')
+    else:
+        live = predict_students(targets, student_status='Active')
+    live_keys = set()
+    if live is not None:
+        live = live[_matric_keys(live['MATRIC_NO']).isin(set(_matric_keys(targets)))]
+        live = live.assign(model_version=graduation_prediction.model_label)
+        live_keys = set(_matric_keys(live['MATRIC_NO']))
+
+    keep = stored['prob_on_time'].notna() & ~_matric_keys(stored['MATRIC_NO']).isin(live_keys)
+    parts = [stored[keep]] + ([live] if live is not None and not live.empty else [])
+    if len(parts) == 1 and parts[0].empty:
+        return None
+    results = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    return results.sort_values('MATRIC_NO', ignore_index=True)
+
+
+def _matric_keys(values):
+    # MATRIC_NO as the database compares it (case-insensitive, trailing blanks ignored)
+    return pd.Series(values, dtype=object).astype(str).str.rstrip().str.upper()
+
+
+def scoring_info(results):
+    """When and with which model the predictions were made (scored_at None for live predictions)"""
+    if 'scored_at' not in results.columns or results.empty:
+        return {'scored_at': None, 'model_version': None}
+    scored_at = results['scored_at'].min()
+    return {
+        'scored_at': pd.Timestamp(scored_at).isoformat() if pd.notna(scored_at) else None,
+        'model_version': results['model_version'].iloc[0],
+    }
+
+
+def student_prediction_response(result):
     student = result.iloc[0]
     
-    response = {
+    return {
         'matric_no': student['MATRIC_NO'],
         'name': student['STUDENT_NAME'],
         'cohort': str(student['COHORT']),
@@ -40,18 +85,87 @@ def predict_single_student(matric_no):
             'prediction_label': student['prediction_label'],
             'probability_on_time': round(float(student['prob_on_time']), 3),
             'probability_late': round(float(student['prob_late']), 3),
-            'risk_level': student['risk_level']
+            'risk_level': student['risk_level'],
+            **scoring_info(result)
         }
     }
+
+
+# Individual students (for details page
+@prediction_bp.route('/student/<matric_no>', methods=['GET'])
+def predict_single_student(matric_no):
+    """Predict graduation for a single student"""
+    
+    result = load_predictions(matric_no)
+    
+    if result is None or result.empty:
+        return jsonify({'error': 'Student not found or model not available'}), 404
+    
+    return jsonify(student_prediction_response(result)), 200
+
+
+@prediction_bp.route('/student/<matric_no>/rescore', methods=['POST'])
+@jwt_required()
+def rescore_single_student(matric_no):
+    """Score one student now with the current model and replace their stored prediction"""
+    
+    try:
+        scored = score_students(matric_no=matric_no, student_status='Active')
+        if scored is None:
+            return jsonify({'error': 'Student not found or model not available'}), 404
+        result = load_stored_predictions('Active', matric_no)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
     
-    return jsonify(response), 200
+    if result.empty:
+        return jsonify({'error': 'Student not found'}), 404
+    
+    return jsonify(student_prediction_response(result)), 200
+
+# Arbitrary list of students (one stored-predictions query; only students without a current stored
+# row are scored live, together in one predict_proba call)
+@prediction_bp.route('/batch', methods=['POST'])
+def predict_batch():
+    """Predict graduation for a list of active students: {"matric_nos": [...]}"""
+    
+    data = request.get_json(silent=True) or {}
+    matric_nos = data.get('matric_nos') if isinstance(data, dict) else data
+    if not isinstance(matric_nos, list) or not all(isinstance(m, str) for m in matric_nos):
+        return jsonify({'error': 'matric_nos must be a list of strings'}), 400
+    # Trimmed and de-duplicated, first occurrence order kept
+    matric_nos = list(dict.fromkeys(m.strip() for m in matric_nos if m.strip()))
+    if not matric_nos:
+        return jsonify({'error': 'matric_nos is empty'}), 400
+    if len(matric_nos) > MAX_BATCH_STUDENTS:
+        return jsonify({'error': f'At most {MAX_BATCH_STUDENTS} students per batch'}), 400
+    
+    try:
+        results = load_predictions(matric_nos=matric_nos)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    if results is None or results.empty:
+        return jsonify({'error': 'Students not found or model not available'}), 404
+    
+    predictions = []
+    found = set()
+    for i in range(len(results)):
+        student = results.iloc[i:i + 1]
+        predictions.append(student_prediction_response(student))
+        found.add(str(student['MATRIC_NO'].iloc[0]).rstrip().upper())
+    
+    return jsonify({
+        'requested': len(matric_nos),
+        'predictions': predictions,
+        'not_found': [m for m in matric_nos if m.upper() not in found]
+    }), 200
 
 # All students (for dashboard)
 @prediction_bp.route('/all-students', methods=['GET'])
 def predict_all_students():
     """Predict graduation for all active students"""
     
-    results = predict_graduation(student_status='Active')
+    results = load_predictions()
     
     if results is None:
         return jsonify({'error': 'Model not available'}), 500
@@ -82,6 +196,7 @@ def predict_all_students():
         'high_risk_count': int((results['risk_level'] == 'High Risk').sum()),
         'medium_risk_count': int((results['risk_level'] == 'Medium Risk').sum()),
         'low_risk_count': int((results['risk_level'] == 'Low Risk').sum()),
+        **scoring_info(results),
     }
     
     return jsonify({
@@ -96,7 +211,7 @@ def get_at_risk():
     
     threshold = float(request.args.get('threshold', 0.5))
     
-    at_risk = get_at_risk_students(threshold=threshold)
+    at_risk = get_at_risk_students(threshold=threshold, predictions=load_predictions())
     
     if at_risk is None:
         return jsonify({'error': 'Model not available'}), 500
@@ -135,7 +250,7 @@ def get_at_risk():
 def get_prediction_statistics():
     """Get overall prediction statistics for all active students"""
     
-    results = predict_graduation(student_status='Active')
+    results = load_predictions()
     
     if results is None or results.empty:
         return jsonify({'error': 'No data available'}), 500
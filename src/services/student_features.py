@@ -0,0 +1,176 @@
+# src/services/student_features.py
+#
+# Feature store for the graduation model.
+# STUDENT_FEATURES holds the per-student aggregates that extract_student_features used to recompute
+# over the whole STUDENT_SCORE table on every prediction call. A refresh only re-aggregates students
+# with score rows written or deleted since the last refresh (STUDENT_SCORE.ROW_VER > watermark).
+#
+#   python -m src.services.student_features [--full]
+
+import argparse, logging, threading, time
+import numpy as np
+import pandas as pd
+from src.db.core import get_db_connection
+from src.db.schema import require_score_change_tracking, require_student_features
+from src.services.db_helpers import scores_stamp
+from src.services.feature_engine import ATTEMPT_COLUMNS, FEATURE_COLUMNS, compute_student_features
+
+logger = logging.getLogger(__name__)
+
+FEATURE_KEYS_DDL = """
+IF OBJECT_ID('tempdb..#feature_keys') IS NOT NULL DROP TABLE #feature_keys;
+CREATE TABLE #feature_keys (MATRIC_NO NVARCHAR(100) COLLATE DATABASE_DEFAULT PRIMARY KEY);
+"""
+
+# Students touched by committed score writes/deletes above the watermark. Rows an open transaction
+# holds are skipped; their versions stay above the saved watermark, so a later refresh picks them up.
+CHANGED_KEYS_SQL = """
+INSERT INTO #feature_keys (MATRIC_NO)
+SELECT MATRIC_NO FROM STUDENT_SCORE WITH (READPAST)
+WHERE ROW_VER > CAST(CAST(? AS BIGINT) AS BINARY(8)) AND MATRIC_NO IS NOT NULL
+UNION
+SELECT MATRIC_NO FROM STUDENT_SCORE_TOMBSTONES WITH (READPAST)
+WHERE ROW_VER > CAST(CAST(? AS BIGINT) AS BINARY(8)) AND MATRIC_NO IS NOT NULL
+"""
+
+ALL_KEYS_SQL = """
+INSERT INTO #feature_keys (MATRIC_NO)
+SELECT DISTINCT MATRIC_NO FROM STUDENT_SCORE WHERE MATRIC_NO IS NOT NULL
+"""
+
+# Raw rows of the students being refreshed, plus their latest change version / timestamp
+KEYED_RAW_SCORES_SQL = """
+SELECT
+    ss.MATRIC_NO, ss.COURSE_CODE, ss.ATTEMPT_1, ss.ATTEMPT_2, ss.ATTEMPT_3,
+    CAST(ss.ROW_VER AS BIGINT) AS ROW_VER,
+    (SELECT MAX(v) FROM (VALUES (ss.A1_UPDATED_AT), (ss.A2_UPDATED_AT), (ss.A3_UPDATED_AT)) AS t(v)) AS UPDATED_AT
+FROM STUDENT_SCORE ss
+JOIN #feature_keys k ON k.MATRIC_NO = ss.MATRIC_NO
+"""
+
+INSERT_FEATURES_SQL = f"""
+INSERT INTO STUDENT_FEATURES (MATRIC_NO, {', '.join(FEATURE_COLUMNS)}, SOURCE_ROW_VER, SOURCE_UPDATED_AT)
+VALUES ({', '.join('?' * (len(FEATURE_COLUMNS) + 3))})
+"""
+
+SAVE_WATERMARK_SQL = """
+MERGE STUDENT_FEATURES_STATE AS t
+USING (SELECT 1 AS ID, ? AS WATERMARK) AS s
+ON t.ID = s.ID
+WHEN MATCHED THEN UPDATE SET WATERMARK = s.WATERMARK, REFRESHED_AT = GETDATE()
+WHEN NOT MATCHED THEN INSERT (ID, WATERMARK) VALUES (s.ID, s.WATERMARK);
+"""
+
+
+def _db_value(v):
+    if v is None or v is pd.NaT or (isinstance(v, float) and np.isnan(v)):
+        return None
+    if isinstance(v, pd.Timestamp):
+        return v.to_pydatetime()
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def write_student_features(cur):
+    """
+    Recompute STUDENT_FEATURES for the students in #feature_keys with the shared feature engine.
+    Students left without score rows just lose their row.
+    """
+    cur.execute(KEYED_RAW_SCORES_SQL)
+    raw = pd.DataFrame([tuple(r) for r in cur.fetchall()],
+                       columns=['MATRIC_NO', 'COURSE_CODE'] + ATTEMPT_COLUMNS + ['ROW_VER', 'UPDATED_AT'], dtype=object)
+    features = compute_student_features(raw)
+
+    cur.execute("DELETE f FROM STUDENT_FEATURES f JOIN #feature_keys k ON k.MATRIC_NO = f.MATRIC_NO")
+    if features.empty:
+        return
+    key = raw['MATRIC_NO'].astype(str).str.rstrip().str.upper()
+    source = raw.assign(key=key).groupby('key').agg(row_ver=('ROW_VER', 'max'), updated_at=('UPDATED_AT', 'max'))
+    source = source.reindex(features.index.astype(str).str.rstrip().str.upper())
+
+    rows = [
+        tuple(_db_value(v) for v in (matric_no, *values, row_ver, updated_at))
+        for matric_no, values, row_ver, updated_at in zip(
+            features.index, features.itertuples(index=False), source['row_ver'], source['updated_at'])
+    ]
+    cur.fast_executemany = True
+    cur.executemany(INSERT_FEATURES_SQL, rows)
+    cur.fast_executemany = False
+
+
+# Serializes refreshes inside this process; sp_getapplock covers other processes
+_refresh_lock = threading.Lock()
+
+
+def refresh_student_features(full=False):
+    """
+    Bring STUDENT_FEATURES up to the current STUDENT_SCORE version.
+
+    Only students with score rows written or deleted since the stored watermark are re-aggregated.
+    ROW_VER drives this rather than A*_UPDATED_AT alone, because not every writer bumps the
+    timestamps (e.g. the score import leaves them when an attempt goes back to '-').
+    The watermark only advances to just below MIN_ACTIVE_ROWVERSION(), but changes committed above
+    it (e.g. edits made during a long import) are picked up too, so they are re-aggregated on every
+    refresh until the open transaction ends. The first run, or full=True, rebuilds every student.
+
+    Returns:
+        dict: {students, watermark, full, seconds}; students is 0 when nothing changed
+    """
+    require_score_change_tracking()
+    require_student_features()
+    start = time.perf_counter()
+    with _refresh_lock:
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            min_active, committed_above, _ = scores_stamp(cur)
+            version = min_active - 1
+            cur.execute("SELECT WATERMARK FROM STUDENT_FEATURES_STATE WHERE ID = 1")
+            row = cur.fetchone()
+            watermark = None if (full or row is None) else int(row[0])
+            if watermark is not None and watermark >= version and not committed_above:
+                return {"students": 0, "watermark": watermark, "full": False, "seconds": 0.0}
+
+            cur.execute("EXEC sp_getapplock @Resource = 'STUDENT_FEATURES', "
+                        "@LockMode = 'Exclusive', @LockOwner = 'Transaction', @LockTimeout = 60000")
+            if watermark is not None:
+                # Another process may have refreshed while we waited for the lock
+                cur.execute("SELECT WATERMARK FROM STUDENT_FEATURES_STATE WHERE ID = 1")
+                watermark = int(cur.fetchone()[0])
+                if watermark >= version and not committed_above:
+                    conn.commit()
+                    return {"students": 0, "watermark": watermark, "full": False, "seconds": 0.0}
+                # Never move the watermark back past a newer refresh
+                version = max(version, watermark)
+            cur.execute(FEATURE_KEYS_DDL)
+            if watermark is None:
+                cur.execute("DELETE FROM STUDENT_FEATURES")
+                cur.execute(ALL_KEYS_SQL)
+            else:
+                cur.execute(CHANGED_KEYS_SQL, (watermark, watermark))
+            cur.execute("SELECT COUNT(*) FROM #feature_keys")
+            students = cur.fetchone()[0]
+            if students:
+                write_student_features(cur)
+            cur.execute(SAVE_WATERMARK_SQL, (version,))
+            cur.execute("DROP TABLE #feature_keys")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    seconds = time.perf_counter() - start
+    logger.info(f"STUDENT_FEATURES refreshed for {students} students up to version {version} "
+                f"({'full' if watermark is None else 'incremental'}, {seconds:.2f}s)")
+    return {"students": students, "watermark": version, "full": watermark is None, "seconds": seconds}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the STUDENT_FEATURES table")
+    parser.add_argument("--full", action="store_true", help="rebuild every student instead of only changed ones")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = refresh_student_features(full=args.full)
+    print(f"Refreshed {result['students']} students up to version {result['watermark']} in {result['seconds']:.2f}s")
@@ -5,7 +5,7 @@ import os, sys
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
 sys.path.insert(0, project_root)
 
-from src.db.core import get_db_connection
+from src.services.feature_engine import extract_training_frame
 
 import pandas as pd
 import numpy as np
@@ -21,196 +21,9 @@ logging.basicConfig(filename='model_training.log', level=logging.INFO)
 
 
 def extract_features_and_labels():
-    """Query database to get features and labels for graduated students"""
+    """Get features and labels for graduated students from the shared feature engine (src/services/feature_engine.py)"""
     
-    conn = get_db_connection()
-
-    query = """
-    WITH student_entry_year AS (
-        SELECT 
-            MATRIC_NO,
-            CASE 
-                WHEN MAX(CASE WHEN ATTEMPT_1 = 'Exempted' THEN 1 ELSE 0 END) = 1 
-                THEN 2
-                ELSE 1
-            END AS entry_year_level,
-            CASE 
-                WHEN MAX(CASE WHEN ATTEMPT_1 = 'Exempted' THEN 1 ELSE 0 END) = 1 
-                THEN 2
-                ELSE 3
-            END AS expected_years
-        FROM STUDENT_SCORE
-        GROUP BY MATRIC_NO
-    ),
-
-    course_attempt_details AS (
-        SELECT 
-            MATRIC_NO,
-            COURSE_CODE,
-            ATTEMPT_1,
-            ATTEMPT_2,
-            ATTEMPT_3,
-            
-            CASE 
-                WHEN ATTEMPT_1 NOT IN ('-', 'Exempted') 
-                THEN 1 ELSE 0 
-            END +
-            CASE 
-                WHEN ATTEMPT_2 != '-' 
-                THEN 1 ELSE 0 
-            END +
-            CASE 
-                WHEN ATTEMPT_3 NOT IN ('-', 'NULL')
-                THEN 1 ELSE 0 
-            END AS attempts_for_course,
-            
-            CASE 
-                WHEN ATTEMPT_1 NOT IN ('Exempted', '-') 
-                     AND ISNUMERIC(ATTEMPT_1) = 1 
-                     AND CAST(ATTEMPT_1 AS FLOAT) < 40
-                THEN 1 ELSE 0 
-            END AS failed_first_attempt,
-            
-            CASE WHEN ATTEMPT_1 = 'Exempted' THEN 1 ELSE 0 END AS is_exempted,
-            
-            CASE 
-                WHEN ATTEMPT_1 NOT IN ('Exempted', '-')
-                     AND ISNUMERIC(ATTEMPT_1) = 1 
-                THEN CAST(ATTEMPT_1 AS FLOAT)
-                ELSE NULL
-            END AS first_attempt_score,
-            
-            CASE 
-                WHEN ATTEMPT_3 NOT IN ('-', 'NULL')
-                     AND ISNUMERIC(ATTEMPT_3) = 1 
-                THEN CAST(ATTEMPT_3 AS FLOAT)
-                
-                WHEN ATTEMPT_2 != '-'
-                     AND ISNUMERIC(ATTEMPT_2) = 1 
-                THEN CAST(ATTEMPT_2 AS FLOAT)
-                
-                WHEN ATTEMPT_1 NOT IN ('Exempted', '-')
-                     AND ISNUMERIC(ATTEMPT_1) = 1 
-                THEN CAST(ATTEMPT_1 AS FLOAT)
-                
-                ELSE NULL
-            END AS final_score,
-            
-            CASE 
-                WHEN (
-                    (ATTEMPT_3 NOT IN ('-', 'NULL') AND ISNUMERIC(ATTEMPT_3) = 1 AND CAST(ATTEMPT_3 AS FLOAT) >= 40)
-                    OR (ATTEMPT_2 != '-' AND ISNUMERIC(ATTEMPT_2) = 1 AND CAST(ATTEMPT_2 AS FLOAT) >= 40)
-                    OR (ATTEMPT_1 NOT IN ('Exempted', '-') AND ISNUMERIC(ATTEMPT_1) = 1 AND CAST(ATTEMPT_1 AS FLOAT) >= 40)
-                )
-                THEN 1 ELSE 0 
-            END AS eventually_passed
-            
-        FROM STUDENT_SCORE
-    ),
-
-    student_features_enhanced AS (
-        SELECT 
-            MATRIC_NO,
-            
-            COUNT(DISTINCT COURSE_CODE) as total_courses,
-            SUM(is_exempted) as exempted_courses,
-            COUNT(DISTINCT COURSE_CODE) - SUM(is_exempted) as actual_courses_taken,
-            
-            SUM(CASE WHEN attempts_for_course = 1 THEN 1 ELSE 0 END) as courses_passed_first_attempt,
-            SUM(CASE WHEN attempts_for_course = 2 THEN 1 ELSE 0 END) as courses_with_2_attempts,
-            SUM(CASE WHEN attempts_for_course = 3 THEN 1 ELSE 0 END) as courses_with_3_attempts,
-            SUM(CASE WHEN attempts_for_course >= 2 THEN 1 ELSE 0 END) as total_courses_needing_resits,
-            
-            SUM(failed_first_attempt) as total_first_attempt_failures,
-            SUM(CASE WHEN failed_first_attempt = 1 AND eventually_passed = 0 THEN 1 ELSE 0 END) as courses_never_passed,
-            SUM(CASE WHEN failed_first_attempt = 1 AND eventually_passed = 1 THEN 1 ELSE 0 END) as courses_passed_after_failing,
-            
-            AVG(first_attempt_score) as avg_first_attempt_score,
-            MIN(first_attempt_score) as lowest_first_attempt_score,
-            STDEV(first_attempt_score) as first_attempt_score_std_dev,
-            
-            AVG(final_score) as avg_final_score,
-            MIN(final_score) as lowest_final_score,
-            MAX(final_score) as highest_final_score,
-            
-            SUM(CASE WHEN first_attempt_score >= 70 THEN 1 ELSE 0 END) as courses_with_distinction_first_attempt,
-            SUM(CASE WHEN first_attempt_score >= 40 AND first_attempt_score < 50 THEN 1 ELSE 0 END) as courses_barely_passed_first_attempt,
-            SUM(CASE WHEN final_score = 40 AND attempts_for_course > 1 THEN 1 ELSE 0 END) as courses_capped_at_40,
-            SUM(CASE WHEN final_score < 40 THEN 1 ELSE 0 END) as courses_still_failing
-            
-        FROM course_attempt_details
-        GROUP BY MATRIC_NO
-    ),
-
-    graduation_labels AS (
-        SELECT 
-            s.MATRIC_NO,
-            s.COHORT,
-            s.GRADUATED_ON,
-            sey.entry_year_level,
-            sey.expected_years,
-            
-            DATEPART(YEAR, s.COHORT) AS entry_year,
-            DATEPART(MONTH, s.COHORT) AS entry_month,
-            
-            2000 + CAST(SUBSTRING(s.GRADUATED_ON, 2, 2) AS INT) AS grad_year,
-            CAST(SUBSTRING(s.GRADUATED_ON, 5, 1) AS INT) AS grad_month,
-            
-            DATEPART(YEAR, DATEADD(YEAR, sey.expected_years, s.COHORT)) AS expected_grad_year,
-            DATEPART(MONTH, s.COHORT) AS expected_grad_month,
-            
-            CASE 
-                WHEN 2000 + CAST(SUBSTRING(s.GRADUATED_ON, 2, 2) AS INT) < DATEPART(YEAR, DATEADD(YEAR, sey.expected_years, s.COHORT)) THEN 1
-                WHEN 2000 + CAST(SUBSTRING(s.GRADUATED_ON, 2, 2) AS INT) = DATEPART(YEAR, DATEADD(YEAR, sey.expected_years, s.COHORT)) 
-                     AND CAST(SUBSTRING(s.GRADUATED_ON, 5, 1) AS INT) <= DATEPART(MONTH, s.COHORT) THEN 1
-                ELSE 0
-            END AS on_time
-            
-        FROM STUDENTS s
-        INNER JOIN student_entry_year sey ON s.MATRIC_NO = sey.MATRIC_NO
-        WHERE 
-            s.STUDENT_STATUS = 'Graduate'
-            AND s.GRADUATED_ON != '-'
-            AND s.GRADUATED_ON IS NOT NULL
-    )
-
-    SELECT 
-        gl.*,
-        
-        sfe.total_courses,
-        sfe.exempted_courses,
-        sfe.actual_courses_taken,
-        sfe.courses_passed_first_attempt,
-        sfe.courses_with_2_attempts,
-        sfe.courses_with_3_attempts,
-        sfe.total_courses_needing_resits,
-        sfe.total_first_attempt_failures,
-        sfe.courses_never_passed,
-        sfe.courses_passed_after_failing,
-        sfe.avg_first_attempt_score,
-        sfe.lowest_first_attempt_score,
-        sfe.first_attempt_score_std_dev,
-        sfe.avg_final_score,
-        sfe.lowest_final_score,
-        sfe.highest_final_score,
-        sfe.courses_with_distinction_first_attempt,
-        sfe.courses_barely_passed_first_attempt,
-        sfe.courses_capped_at_40,
-        sfe.courses_still_failing,
-        
-        CAST(sfe.courses_passed_first_attempt AS FLOAT) / NULLIF(sfe.actual_courses_taken, 0) as first_attempt_pass_rate,
-        CAST(sfe.total_courses_needing_resits AS FLOAT) / NULLIF(sfe.actual_courses_taken, 0) as resit_rate,
-        CAST(sfe.total_first_attempt_failures AS FLOAT) / NULLIF(sfe.actual_courses_taken, 0) as first_attempt_failure_rate,
-        CAST(sfe.courses_with_3_attempts AS FLOAT) / NULLIF(sfe.total_courses_needing_resits, 0) as third_attempt_rate,
-        CAST(sfe.courses_capped_at_40 AS FLOAT) / NULLIF(sfe.total_courses_needing_resits, 0) as resit_success_rate
-        
-    FROM graduation_labels gl
-    INNER JOIN student_features_enhanced sfe ON gl.MATRIC_NO = sfe.MATRIC_NO
-    ORDER BY gl.MATRIC_NO
-    """
-    
-    df = pd.read_sql(query, conn)
-    conn.close()
+    df = extract_training_frame()
     
     logging.info(f"Extracted {len(df)} training records from database")
     print(f"Extracted {len(df)} training records")